@@ -0,0 +1,46 @@
+"""Image derivative rendering.
+
+Kept out of server.py on purpose: these functions run in a process pool, and
+worker processes import this module rather than the whole API server.
+"""
+
+import io
+
+from PIL import Image, ImageOps
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    """JPEG has no alpha channel; composite transparent images onto white"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.split()[-1])
+        return background
+    return image.convert("RGB")
+
+
+def render_variants(data: bytes, sizes) -> dict:
+    """Resize an image to fit each square preset and encode it as WebP and JPEG.
+
+    Returns {"<size>": {"webp": bytes, "jpeg": bytes}}. Images are never
+    upscaled, and animated images use their first frame.
+    """
+    variants = {}
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+        for size in sizes:
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+
+            webp = io.BytesIO()
+            resized.save(webp, format="WEBP", quality=WEBP_QUALITY, method=4)
+            jpeg = io.BytesIO()
+            _flatten(resized).save(jpeg, format="JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+
+            variants[str(size)] = {"webp": webp.getvalue(), "jpeg": jpeg.getvalue()}
+    return variants
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Maintenance commands for the LUMINA backend.
+
+Run from the backend directory so server.py picks up the same .env:
+
+    python manage.py migrate --dry-run     # show pending migrations and explain plans
+    python manage.py migrate --explain     # apply, printing plans before and after
+    python manage.py reconcile-counters    # rebuild course rating, enrollment and lesson counters
+    python manage.py rebuild-metrics       # recompute admin dashboard rollups from source collections
+    python manage.py migrate-images        # move embedded base64 images to object storage
+"""
+
+import argparse
+import asyncio
+import json
+
+from server import apply_migrations, client, rebuild_dashboard_metrics, reconcile_course_counters
+
+
+def print_migration_results(results):
+    for result in results:
+        print(f"[{result['status']}] {result['version']} - {result['description']}")
+        if result.get("error"):
+            print(f"    error: {result['error']}")
+        for index in result.get("indexes", []):
+            print(f"    {index['collection']}.{index['index']}  probe={json.dumps(index['probe'])}")
+            if "before" in index:
+                print(f"        before: {index['before']}")
+            if "after" in index:
+                print(f"        after:  {index['after']}")
+            if index.get("error"):
+                print(f"        error:  {index['error']}")
+        for key, value in result.items():
+            if key not in ("version", "description", "status", "error", "indexes"):
+                print(f"    {key}: {value}")
+
+
+async def run_migrate(args):
+    results = await apply_migrations(
+        dry_run=args.dry_run,
+        explain=args.explain,
+        only=args.only or None,
+        include_manual=args.include_manual
+    )
+    print_migration_results(results)
+    return 1 if any(r["status"] == "failed" for r in results) else 0
+
+
+async def run_reconcile_counters(args):
+    result = await reconcile_course_counters(dry_run=args.dry_run)
+    for entry in result["drift"]:
+        print(f"{entry['course_id']}: stored={json.dumps(entry['stored'])} actual={json.dumps(entry['actual'])}")
+    print(
+        f"Checked {result['courses_checked']} courses, {result['drifted']} drifted, "
+        f"{result['fixed']} fixed, {result['skipped']} skipped (changed during run)"
+    )
+    return 0
+
+
+async def run_rebuild_metrics(args):
+    result = await rebuild_dashboard_metrics(dry_run=args.dry_run)
+    for key, value in result["totals"].items():
+        print(f"{key}: {value}")
+    print(f"Rebuilt {result['days']} days, last login for {result['users_with_logins']} users")
+    return 0
+
+
+async def run_migrate_images(args):
+    results = await apply_migrations(dry_run=args.dry_run, only=["0006_externalize_images"])
+    print_migration_results(results)
+    return 1 if any(r["status"] == "failed" for r in results) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LUMINA backend maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate = subparsers.add_parser("migrate", help="Apply pending schema migrations")
+    migrate.add_argument("--dry-run", action="store_true", help="Report pending migrations without writing")
+    migrate.add_argument("--explain", action="store_true", help="Print explain plans before and after each index")
+    migrate.add_argument("--only", action="append", metavar="VERSION", help="Run only this migration (repeatable, re-runs if applied)")
+    migrate.add_argument("--include-manual", action="store_true", help="Also run migrations that are skipped at boot")
+    migrate.set_defaults(handler=run_migrate)
+
+    reconcile = subparsers.add_parser("reconcile-counters", help="Rebuild course counters and report drift")
+    reconcile.add_argument("--dry-run", action="store_true", help="Report drift without fixing it")
+    reconcile.set_defaults(handler=run_reconcile_counters)
+
+    metrics = subparsers.add_parser("rebuild-metrics", help="Recompute dashboard rollups and totals")
+    metrics.add_argument("--dry-run", action="store_true", help="Print the recomputed totals without writing")
+    metrics.set_defaults(handler=run_rebuild_metrics)
+
+    images = subparsers.add_parser("migrate-images", help="Move embedded base64 images into the media store")
+    images.add_argument("--dry-run", action="store_true", help="Count embedded images without moving them")
+    images.set_defaults(handler=run_migrate_images)
+
+    args = parser.parse_args()
+    try:
+        exit_code = asyncio.run(args.handler(args))
+    finally:
+        client.close()
+    raise SystemExit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,43 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Query, Header, WebSocket, WebSocketDisconnect
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import StreamingResponse, Response
+from fastapi.responses import StreamingResponse, Response, RedirectResponse
+from starlette.background import BackgroundTask
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReplaceOne, ReturnDocument, UpdateOne, monitoring
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field, EmailStr
+from typing import List, Optional, Dict, Any, Tuple
 import uuid
+import time
+from collections import OrderedDict
 from datetime import datetime, timezone, timedelta
 import bcrypt
 import jwt
 import secrets
+import multiprocessing
+import threading
 import hashlib
 import pyotp
 import random
 import string
 import json
-import requests
+import functools
+import mimetypes
+import shutil
+import base64
 import asyncio
-import smtplib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import aiosmtplib
 import ssl
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import boto3
+from boto3.s3.transfer import TransferConfig
+import httpx
 from botocore.config import Config
 from botocore.exceptions import ClientError
 
@@ -33,8 +45,32 @@ ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
+class CommandCounter(monitoring.CommandListener):
+    """Counts MongoDB commands issued by this process, keyed by command name"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+
+    def started(self, event):
+        with self._lock:
+            self.counts[event.command_name] = self.counts.get(event.command_name, 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def total(self) -> int:
+        with self._lock:
+            return sum(self.counts.values())
+
+
+db_command_counter = CommandCounter()
+
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[db_command_counter])
 db = client[os.environ['DB_NAME']]
 
 # JWT Configuration
@@ -47,7 +83,6 @@ REFRESH_TOKEN_EXPIRE_DAYS = 7
 STORAGE_URL = "https://integrations.emergentagent.com/objstore/api/v1/storage"
 EMERGENT_KEY = os.environ.get("EMERGENT_LLM_KEY")
 APP_NAME = "lumina-lms"
-storage_key = None
 
 # PayU Configuration
 PAYU_MERCHANT_KEY = os.environ.get('PAYU_MERCHANT_KEY', '')
@@ -66,6 +101,8 @@ R2_ACCESS_KEY_ID = os.environ.get('R2_ACCESS_KEY_ID', '')
 R2_SECRET_ACCESS_KEY = os.environ.get('R2_SECRET_ACCESS_KEY', '')
 R2_BUCKET_NAME = os.environ.get('R2_BUCKET_NAME', 'course')
 R2_ENDPOINT = f"https://{R2_ACCOUNT_ID}.r2.cloudflarestorage.com" if R2_ACCOUNT_ID else ""
+# HTTP connections each R2 client keeps; at least STORAGE_WORKERS so pool threads never queue for one
+R2_MAX_POOL_CONNECTIONS = int(os.environ.get('R2_MAX_POOL_CONNECTIONS', 32))
 
 # Create the main FastAPI app
 fastapi_app = FastAPI(title="LUMINA LMS API", version="1.0.0")
@@ -164,53 +201,643 @@ if R2_ACCESS_KEY_ID and R2_SECRET_ACCESS_KEY and R2_ACCOUNT_ID:
             endpoint_url=R2_ENDPOINT,
             aws_access_key_id=R2_ACCESS_KEY_ID,
             aws_secret_access_key=R2_SECRET_ACCESS_KEY,
-            config=Config(signature_version='s3v4'),
+            config=Config(signature_version='s3v4', max_pool_connections=R2_MAX_POOL_CONNECTIONS),
             region_name='auto'
         )
         logger.info("R2 client initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize R2 client: {e}")
 
-# ======================== STORAGE FUNCTIONS ========================
+# ======================== STORAGE BACKENDS ========================
+
+# Every object store sits behind one async interface. boto3 blocks, so S3/R2
+# calls run on a bounded thread pool; Emergent storage is plain HTTP over one
+# pooled httpx client; LocalStorage keeps objects on disk (LOCAL_STORAGE_DIR)
+# for development and offline tests.
+STORAGE_WORKERS = int(os.environ.get('STORAGE_WORKERS', 16))
+STORAGE_HTTP_CONNECTIONS = int(os.environ.get('STORAGE_HTTP_CONNECTIONS', 32))
+LOCAL_STORAGE_DIR = os.environ.get('LOCAL_STORAGE_DIR', '')
+storage_executor = ThreadPoolExecutor(max_workers=STORAGE_WORKERS, thread_name_prefix="storage")
+
+# Multipart settings for large uploads (parts are sent by boto3's own threads)
+LARGE_UPLOAD_CONFIG = TransferConfig(
+    multipart_threshold=50 * 1024 * 1024,
+    max_concurrency=10,
+    multipart_chunksize=50 * 1024 * 1024,
+    use_threads=True
+)
+
+
+class StorageError(Exception):
+    """An object storage call failed, or the backend does not support it"""
+
+
+class RangeNotSatisfiable(StorageError):
+    """The requested byte range starts past the end of the object"""
+
+    def __init__(self, size: Optional[int]):
+        super().__init__(f"Range not satisfiable for an object of {size} bytes")
+        self.size = size
+
+
+# Downloads are streamed in chunks of this size, bounding memory per stream
+STORAGE_STREAM_CHUNK_SIZE = int(os.environ.get('STORAGE_STREAM_CHUNK_SIZE', 256 * 1024))
+
+
+def parse_range_header(header: Optional[str]) -> Optional[Tuple[Optional[int], Optional[int]]]:
+    """(first, last) from a single "bytes=first-last" range; either end may be open.
+
+    Multiple ranges and malformed headers give None, meaning the whole object,
+    which RFC 9110 allows a server to answer with instead.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, sep, last = header[6:].strip().partition("-")
+    if not sep or not (first.isdigit() or last.isdigit()) or (first and not first.isdigit()) \
+            or (last and not last.isdigit()):
+        return None
+    byte_range = (int(first) if first else None, int(last) if last else None)
+    if byte_range[0] is not None and byte_range[1] is not None and byte_range[1] < byte_range[0]:
+        return None
+    return byte_range
+
+
+def resolve_range(byte_range: Tuple[Optional[int], Optional[int]], size: int) -> Tuple[int, int]:
+    """Inclusive (start, end) offsets of a parsed range within an object of `size` bytes"""
+    first, last = byte_range
+    if first is None:
+        # "bytes=-N" is the last N bytes
+        if not last:
+            raise RangeNotSatisfiable(size)
+        return max(0, size - last), size - 1
+    if first >= size:
+        raise RangeNotSatisfiable(size)
+    return first, size - 1 if last is None else min(last, size - 1)
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    if not if_none_match or not etag:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return etag.removeprefix("W/") in tags or "*" in tags
+
+
+class ObjectStream:
+    """An opened download: the bytes being sent, as an async iterator of chunks.
+
+    `byte_range` is the inclusive (start, end) being sent, or None for the
+    whole object; `not_modified` means the If-None-Match tag matched and there
+    is no body. close() releases the upstream connection if the body is never
+    read to the end.
+    """
+
+    def __init__(self, chunks=None, size: Optional[int] = None, content_type: str = "application/octet-stream",
+                 etag: Optional[str] = None, byte_range: Optional[Tuple[int, int]] = None,
+                 not_modified: bool = False, close=None):
+        self.chunks = chunks
+        self.size = size
+        self.content_type = content_type
+        self.etag = etag
+        self.byte_range = byte_range
+        self.not_modified = not_modified
+        self._close = close
+
+    async def close(self):
+        if self._close is not None:
+            await self._close()
+
+
+async def slice_chunks(chunks, skip: int, limit: Optional[int]):
+    """Drop the first `skip` bytes of a chunk stream and stop after `limit` more"""
+    async for chunk in chunks:
+        if skip:
+            dropped = min(skip, len(chunk))
+            chunk, skip = chunk[dropped:], skip - dropped
+        if limit is not None:
+            chunk, limit = chunk[:limit], limit - min(limit, len(chunk))
+        if chunk:
+            yield chunk
+        if limit == 0:
+            return
+
+
+async def run_in_storage_pool(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(storage_executor, functools.partial(fn, *args, **kwargs))
+
+
+class StorageBackend:
+    """Async object storage.
+
+    put/put_file return {"path", "size"}; `path` is the key to read the object
+    back by. get raises StorageError for a missing object, head returns None.
+    """
+
+    name = "storage"
+
+    async def put(self, key: str, data: bytes, content_type: str) -> dict:
+        raise StorageError(f"{self.name} storage does not support uploads")
 
-def init_storage():
-    global storage_key
-    if storage_key:
-        return storage_key
-    if not EMERGENT_KEY:
-        logger.warning("EMERGENT_LLM_KEY not set, storage disabled")
+    async def put_file(self, fileobj, key: str, content_type: str) -> dict:
+        return await self.put(key, await run_in_storage_pool(fileobj.read), content_type)
+
+    async def get(self, key: str) -> Tuple[bytes, str]:
+        raise StorageError(f"{self.name} storage does not support downloads")
+
+    async def delete(self, key: str) -> None:
+        raise StorageError(f"{self.name} storage does not support deletes")
+
+    async def head(self, key: str) -> Optional[dict]:
+        raise StorageError(f"{self.name} storage does not support metadata lookups")
+
+    async def list(self, prefix: str = "", limit: Optional[int] = None) -> List[dict]:
+        raise StorageError(f"{self.name} storage does not support listing")
+
+    async def usage(self, prefix: str = "") -> dict:
+        objects = await self.list(prefix)
+        return {"objects": len(objects), "bytes": sum(o["size"] for o in objects)}
+
+    async def open_stream(self, key: str, byte_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                          if_none_match: Optional[str] = None,
+                          chunk_size: int = STORAGE_STREAM_CHUNK_SIZE) -> ObjectStream:
+        """Open the object (or a byte range of it) for streaming; raises RangeNotSatisfiable"""
+        raise StorageError(f"{self.name} storage does not support streaming")
+
+    def sign(self, key: str, expires_in: int = 3600, method: str = "get_object",
+             content_type: Optional[str] = None) -> Optional[str]:
+        """A time-limited URL for the object, or None when the backend cannot sign"""
         return None
+
+
+class S3Storage(StorageBackend):
+    """One S3-compatible bucket (R2) through a boto3 client"""
+
+    name = "r2"
+
+    def __init__(self, client, bucket: str, scope: str = "default"):
+        self.client = client
+        self.bucket = bucket
+        # Identifies the bucket and credentials the URLs this storage signs are valid for
+        self.scope = scope
+
+    async def _call(self, fn, *args):
+        try:
+            return await run_in_storage_pool(fn, *args)
+        except ClientError as e:
+            raise StorageError(str(e)) from e
+
+    async def put(self, key: str, data: bytes, content_type: str) -> dict:
+        await self._call(functools.partial(
+            self.client.put_object, Bucket=self.bucket, Key=key, Body=data, ContentType=content_type))
+        return {"path": key, "size": len(data)}
+
+    async def put_file(self, fileobj, key: str, content_type: str) -> dict:
+        def upload():
+            size = fileobj.seek(0, os.SEEK_END)
+            fileobj.seek(0)
+            self.client.upload_fileobj(
+                fileobj, self.bucket, key, Config=LARGE_UPLOAD_CONFIG, ExtraArgs={'ContentType': content_type})
+            return size
+        return {"path": key, "size": await self._call(upload)}
+
+    async def get(self, key: str) -> Tuple[bytes, str]:
+        def download():
+            response = self.client.get_object(Bucket=self.bucket, Key=key)
+            return response["Body"].read(), response.get("ContentType", "application/octet-stream")
+        return await self._call(download)
+
+    async def delete(self, key: str) -> None:
+        await self._call(functools.partial(self.client.delete_object, Bucket=self.bucket, Key=key))
+
+    async def head(self, key: str) -> Optional[dict]:
+        try:
+            response = await run_in_storage_pool(self.client.head_object, Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise StorageError(str(e)) from e
+        return {
+            "size": response.get("ContentLength", 0),
+            "content_type": response.get("ContentType", "application/octet-stream"),
+            "etag": response.get("ETag", "").strip('"'),
+        }
+
+    async def list(self, prefix: str = "", limit: Optional[int] = None) -> List[dict]:
+        def list_pages():
+            objects, params = [], {"Bucket": self.bucket, "Prefix": prefix}
+            while True:
+                if limit:
+                    params["MaxKeys"] = min(1000, limit - len(objects))
+                response = self.client.list_objects_v2(**params)
+                objects.extend({"key": o["Key"], "size": o.get("Size", 0)} for o in response.get("Contents", []))
+                if not response.get("IsTruncated") or (limit and len(objects) >= limit):
+                    return objects
+                params["ContinuationToken"] = response["NextContinuationToken"]
+        return await self._call(list_pages)
+
+    async def usage(self, prefix: str = "") -> dict:
+        # Same walk as list() without keeping every key in memory
+        def count_pages():
+            total = {"objects": 0, "bytes": 0}
+            params = {"Bucket": self.bucket, "Prefix": prefix}
+            while True:
+                response = self.client.list_objects_v2(**params)
+                for obj in response.get("Contents", []):
+                    total["objects"] += 1
+                    total["bytes"] += obj.get("Size", 0)
+                if not response.get("IsTruncated"):
+                    return total
+                params["ContinuationToken"] = response["NextContinuationToken"]
+        return await self._call(count_pages)
+
+    def sign(self, key: str, expires_in: int = 3600, method: str = "get_object",
+             content_type: Optional[str] = None) -> Optional[str]:
+        # Signing is local HMAC work, cheap enough to run on the event loop
+        params = {'Bucket': self.bucket, 'Key': key}
+        if content_type:
+            params['ContentType'] = content_type
+        try:
+            return self.client.generate_presigned_url(method, Params=params, ExpiresIn=expires_in)
+        except ClientError as e:
+            logger.error(f"Failed to sign {method} URL for {key}: {e}")
+            return None
+
+
+class EmergentStorage(StorageBackend):
+    """Emergent object storage over a shared, pooled httpx client"""
+
+    name = "emergent"
+
+    def __init__(self, base_url: str, emergent_key: Optional[str]):
+        self.base_url = base_url
+        self.emergent_key = emergent_key
+        self.storage_key: Optional[str] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._init_lock = asyncio.Lock()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(120.0, connect=10.0),
+                limits=httpx.Limits(max_connections=STORAGE_HTTP_CONNECTIONS,
+                                    max_keepalive_connections=STORAGE_HTTP_CONNECTIONS)
+            )
+        return self._client
+
+    async def init(self) -> Optional[str]:
+        if self.storage_key:
+            return self.storage_key
+        if not self.emergent_key:
+            logger.warning("EMERGENT_LLM_KEY not set, storage disabled")
+            return None
+        async with self._init_lock:
+            if not self.storage_key:
+                try:
+                    resp = await self.client.post("/init", json={"emergent_key": self.emergent_key}, timeout=30)
+                    resp.raise_for_status()
+                    self.storage_key = resp.json()["storage_key"]
+                except Exception as e:
+                    logger.error(f"Storage init failed: {e}")
+        return self.storage_key
+
+    async def _headers(self) -> dict:
+        key = await self.init()
+        if not key:
+            raise StorageError("Storage not initialized")
+        return {"X-Storage-Key": key}
+
+    async def put(self, key: str, data: bytes, content_type: str) -> dict:
+        headers = {**await self._headers(), "Content-Type": content_type}
+        try:
+            resp = await self.client.put(f"/objects/{key}", headers=headers, content=data)
+            resp.raise_for_status()
+        except httpx.HTTPError as e:
+            raise StorageError(str(e)) from e
+        return resp.json()
+
+    async def get(self, key: str) -> Tuple[bytes, str]:
+        headers = await self._headers()
+        try:
+            resp = await self.client.get(f"/objects/{key}", headers=headers, timeout=60)
+            resp.raise_for_status()
+        except httpx.HTTPError as e:
+            raise StorageError(str(e)) from e
+        return resp.content, resp.headers.get("Content-Type", "application/octet-stream")
+
+    async def open_stream(self, key: str, byte_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                          if_none_match: Optional[str] = None,
+                          chunk_size: int = STORAGE_STREAM_CHUNK_SIZE) -> ObjectStream:
+        # Range and If-None-Match are forwarded; if upstream ignores them the
+        # same answers are worked out here from the full response.
+        headers = await self._headers()
+        if byte_range:
+            first, last = byte_range
+            headers["Range"] = f"bytes={'' if first is None else first}-{'' if last is None else last}"
+        if if_none_match:
+            headers["If-None-Match"] = if_none_match
+        try:
+            resp = await self.client.send(self.client.build_request("GET", f"/objects/{key}", headers=headers),
+                                          stream=True)
+        except httpx.HTTPError as e:
+            raise StorageError(str(e)) from e
+        
+        etag = resp.headers.get("ETag")
+        content_range = resp.headers.get("Content-Range", "")
+        length = resp.headers.get("Content-Length")
+        try:
+            if resp.status_code == 304 or (resp.status_code == 200 and etag_matches(if_none_match, etag)):
+                await resp.aclose()
+                return ObjectStream(etag=etag, not_modified=True)
+            if resp.status_code == 416:
+                total = content_range.rpartition("/")[2]
+                raise RangeNotSatisfiable(int(total) if total.isdigit() else None)
+            if resp.status_code >= 400:
+                raise StorageError(f"Storage returned {resp.status_code} for {key}")
+            
+            skip, limit, sent_range, size = 0, None, None, None
+            if resp.status_code == 206 and content_range.startswith("bytes "):
+                span, _, total = content_range[6:].partition("/")
+                start, _, end = span.partition("-")
+                sent_range, size = (int(start), int(end)), int(total) if total.isdigit() else None
+            elif length and length.isdigit():
+                size = int(length)
+                if byte_range:
+                    sent_range = resolve_range(byte_range, size)
+                    skip, limit = sent_range[0], sent_range[1] - sent_range[0] + 1
+        except StorageError:
+            await resp.aclose()
+            raise
+        
+        async def chunks():
+            try:
+                async for chunk in slice_chunks(resp.aiter_bytes(chunk_size), skip, limit):
+                    yield chunk
+            finally:
+                await resp.aclose()
+        return ObjectStream(chunks(), size, resp.headers.get("Content-Type", "application/octet-stream"),
+                            etag, sent_range, close=resp.aclose)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class LocalStorage(StorageBackend):
+    """Objects as files under a root directory; content types come from the key's extension"""
+
+    name = "local"
+
+    def __init__(self, root):
+        self.root = Path(root).resolve()
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root not in path.parents:
+            raise StorageError(f"Invalid object key: {key}")
+        return path
+
+    @staticmethod
+    def _content_type(key: str) -> str:
+        return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+    async def put(self, key: str, data: bytes, content_type: str) -> dict:
+        path = self._path(key)
+
+        def write():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+        await run_in_storage_pool(write)
+        return {"path": key, "size": len(data)}
+
+    async def put_file(self, fileobj, key: str, content_type: str) -> dict:
+        path = self._path(key)
+
+        def copy():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fileobj.seek(0)
+            with open(path, "wb") as out:
+                shutil.copyfileobj(fileobj, out, 1024 * 1024)
+            return path.stat().st_size
+        return {"path": key, "size": await run_in_storage_pool(copy)}
+
+    async def get(self, key: str) -> Tuple[bytes, str]:
+        try:
+            data = await run_in_storage_pool(self._path(key).read_bytes)
+        except OSError as e:
+            raise StorageError(str(e)) from e
+        return data, self._content_type(key)
+
+    async def delete(self, key: str) -> None:
+        await run_in_storage_pool(self._path(key).unlink, missing_ok=True)
+
+    async def head(self, key: str) -> Optional[dict]:
+        try:
+            stat = await run_in_storage_pool(self._path(key).stat)
+        except FileNotFoundError:
+            return None
+        return {"size": stat.st_size, "content_type": self._content_type(key),
+                "etag": f"{stat.st_mtime_ns:x}-{stat.st_size:x}"}
+
+    async def open_stream(self, key: str, byte_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                          if_none_match: Optional[str] = None,
+                          chunk_size: int = STORAGE_STREAM_CHUNK_SIZE) -> ObjectStream:
+        stat = await self.head(key)
+        if stat is None:
+            raise StorageError(f"{key} not found")
+        etag, size = f'"{stat["etag"]}"', stat["size"]
+        if etag_matches(if_none_match, etag):
+            return ObjectStream(etag=etag, not_modified=True)
+        start, end = resolve_range(byte_range, size) if byte_range else (0, size - 1)
+        path = self._path(key)
+
+        async def chunks():
+            handle = await run_in_storage_pool(open, path, "rb")
+            try:
+                await run_in_storage_pool(handle.seek, start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = await run_in_storage_pool(handle.read, min(chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+            finally:
+                await run_in_storage_pool(handle.close)
+        return ObjectStream(chunks(), size, stat["content_type"], etag, (start, end) if byte_range else None)
+
+    async def list(self, prefix: str = "", limit: Optional[int] = None) -> List[dict]:
+        def walk():
+            objects = []
+            for path in sorted(p for p in self.root.rglob("*") if p.is_file()):
+                key = path.relative_to(self.root).as_posix()
+                if key.startswith(prefix):
+                    objects.append({"key": key, "size": path.stat().st_size})
+                    if limit and len(objects) >= limit:
+                        break
+            return objects
+        return await run_in_storage_pool(walk)
+
+
+def get_r2_client_for_bucket(bucket_config: dict):
+    """Create an R2 client for a specific bucket configuration"""
     try:
-        resp = requests.post(f"{STORAGE_URL}/init", json={"emergent_key": EMERGENT_KEY}, timeout=30)
-        resp.raise_for_status()
-        storage_key = resp.json()["storage_key"]
-        return storage_key
+        endpoint = f"https://{bucket_config['account_id']}.r2.cloudflarestorage.com"
+        client = boto3.client(
+            's3',
+            endpoint_url=endpoint,
+            aws_access_key_id=bucket_config['access_key_id'],
+            aws_secret_access_key=bucket_config['secret_access_key'],
+            config=Config(signature_version='s3v4', max_pool_connections=R2_MAX_POOL_CONNECTIONS),
+            region_name='auto'
+        )
+        return client
     except Exception as e:
-        logger.error(f"Storage init failed: {e}")
+        logger.error(f"Failed to create R2 client: {e}")
         return None
 
-def put_object(path: str, data: bytes, content_type: str) -> dict:
-    key = init_storage()
-    if not key:
-        raise HTTPException(status_code=500, detail="Storage not initialized")
-    resp = requests.put(
-        f"{STORAGE_URL}/objects/{path}",
-        headers={"X-Storage-Key": key, "Content-Type": content_type},
-        data=data, timeout=120
-    )
-    resp.raise_for_status()
-    return resp.json()
-
-def get_object(path: str) -> tuple:
-    key = init_storage()
-    if not key:
-        raise HTTPException(status_code=500, detail="Storage not initialized")
-    resp = requests.get(
-        f"{STORAGE_URL}/objects/{path}",
-        headers={"X-Storage-Key": key}, timeout=60
-    )
-    resp.raise_for_status()
-    return resp.content, resp.headers.get("Content-Type", "application/octet-stream")
+
+# Building a boto3 client costs tens of milliseconds and several MB, so each
+# admin-configured bucket gets one client per process. Entries are keyed by
+# bucket id and checked against a hash of the connection settings; bucket
+# documents are cached briefly and dropped whenever an admin edits a bucket.
+BUCKET_CONFIG_TTL_SECONDS = float(os.environ.get('BUCKET_CONFIG_TTL_SECONDS', 60))
+BUCKET_CONNECTION_FIELDS = ("account_id", "access_key_id", "secret_access_key", "bucket_name")
+
+
+class BucketStorageRegistry:
+    def __init__(self):
+        self._storages: Dict[str, Tuple[str, S3Storage]] = {}
+        self._configs: Dict[str, Tuple[float, dict]] = {}
+        self.created = 0
+        self.reused = 0
+
+    @staticmethod
+    def config_hash(bucket_config: dict) -> str:
+        fields = json.dumps([bucket_config.get(f) for f in BUCKET_CONNECTION_FIELDS])
+        return hashlib.sha256(fields.encode()).hexdigest()
+
+    def for_config(self, bucket_config: dict) -> Optional[S3Storage]:
+        """The cached storage for a bucket document, rebuilt if its connection settings changed"""
+        bucket_id = bucket_config.get("id")
+        config_hash = self.config_hash(bucket_config)
+        entry = self._storages.get(bucket_id)
+        if entry and entry[0] == config_hash:
+            self.reused += 1
+            return entry[1]
+        bucket_client = get_r2_client_for_bucket(bucket_config)
+        if not bucket_client:
+            return None
+        storage = S3Storage(bucket_client, bucket_config["bucket_name"], scope=f"{bucket_id}:{config_hash[:16]}")
+        self.created += 1
+        if bucket_id:
+            self._storages[bucket_id] = (config_hash, storage)
+        return storage
+
+    async def config(self, bucket_id: str) -> Optional[dict]:
+        cached = self._configs.get(bucket_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        bucket_config = await db.r2_buckets.find_one({"id": bucket_id}, {"_id": 0})
+        if bucket_config:
+            self._configs[bucket_id] = (time.monotonic() + BUCKET_CONFIG_TTL_SECONDS, bucket_config)
+        return bucket_config
+
+    async def storage(self, bucket_id: str) -> Optional[S3Storage]:
+        bucket_config = await self.config(bucket_id)
+        return self.for_config(bucket_config) if bucket_config else None
+
+    def refresh(self, bucket_id: str):
+        """Re-read the bucket document on next use; the client is kept unless its settings changed"""
+        self._configs.pop(bucket_id, None)
+
+    def invalidate(self, bucket_id: str):
+        self._configs.pop(bucket_id, None)
+        self._storages.pop(bucket_id, None)
+
+    async def warm(self):
+        """Build a client for every configured bucket so the first video play does not pay for it"""
+        for bucket_config in await db.r2_buckets.find({}, {"_id": 0}).to_list(100):
+            self._configs[bucket_config["id"]] = (time.monotonic() + BUCKET_CONFIG_TTL_SECONDS, bucket_config)
+            self.for_config(bucket_config)
+
+    def stats(self) -> dict:
+        return {"buckets": len(self._storages), "clients_created": self.created, "clients_reused": self.reused}
+
+
+bucket_registry = BucketStorageRegistry()
+
+
+# Presigned GET URLs are reused while enough of their lifetime remains, so a
+# learner seeking or refreshing gets the URL already issued instead of a new
+# signature. Entries are keyed by (storage scope, object key); a bucket whose
+# credentials change gets a new scope, so stale signatures are never served.
+SIGNED_URL_TTL_SECONDS = int(os.environ.get('SIGNED_URL_TTL_SECONDS', 3600))
+# Reissue once less than this fraction of a URL's lifetime is left
+SIGNED_URL_REUSE_MARGIN = float(os.environ.get('SIGNED_URL_REUSE_MARGIN', 0.25))
+SIGNED_URL_CACHE_SIZE = int(os.environ.get('SIGNED_URL_CACHE_SIZE', 20000))
+
+
+class SignedUrlCache:
+    """LRU of presigned GET URLs with the time each one expires"""
+
+    def __init__(self, max_entries: int, ttl_seconds: int, reuse_margin: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.min_remaining = ttl_seconds * reuse_margin
+        self.hits = 0
+        self.signed = 0
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+    def get(self, storage: S3Storage, key: str) -> Optional[Tuple[str, int]]:
+        """(url, seconds until it expires), signing a new URL only when the cached one is close to expiry"""
+        cache_key = (storage.scope, storage.bucket, key)
+        now = time.time()
+        entry = self._entries.get(cache_key)
+        if entry is not None and entry[1] - now >= self.min_remaining:
+            self._entries.move_to_end(cache_key)
+            self.hits += 1
+            return entry[0], int(entry[1] - now)
+        
+        url = storage.sign(key, expires_in=self.ttl_seconds)
+        if not url:
+            return None
+        self.signed += 1
+        self._entries[cache_key] = (url, now + self.ttl_seconds)
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return url, self.ttl_seconds
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits,
+                "signed": self.signed, "ttl_seconds": self.ttl_seconds, "reissue_below_seconds": self.min_remaining}
+
+
+signed_urls = SignedUrlCache(SIGNED_URL_CACHE_SIZE, SIGNED_URL_TTL_SECONDS, SIGNED_URL_REUSE_MARGIN)
+
+
+# The default R2 bucket from the environment, when configured
+r2_storage: Optional[S3Storage] = S3Storage(r2_client, R2_BUCKET_NAME) if r2_client else None
+emergent_storage = EmergentStorage(STORAGE_URL, EMERGENT_KEY)
+# Where objects go when R2 is not configured
+fallback_storage: StorageBackend = LocalStorage(LOCAL_STORAGE_DIR) if LOCAL_STORAGE_DIR else emergent_storage
+
+
+def storage_backend(name: str) -> StorageBackend:
+    """The backend a stored object's `storage` field names"""
+    if name == "r2" and r2_storage:
+        return r2_storage
+    if name == fallback_storage.name:
+        return fallback_storage
+    if name == "emergent":
+        return emergent_storage
+    raise StorageError(f"Storage backend {name!r} is not configured")
+
 
 # ======================== MODELS ========================
 
@@ -295,6 +922,67 @@ class QuestionCreate(BaseModel):
     correct_answer: int
     points: int = 10
 
+class ProgressSyncItem(BaseModel):
+    lesson_id: str
+    watch_percentage: float = Field(ge=0, le=100)
+    client_timestamp: Optional[datetime] = None
+
+class ProgressSyncBatch(BaseModel):
+    items: List[ProgressSyncItem] = Field(max_length=500)
+
+# Users embedded in other responses. The projections in USER_PROJECTIONS are
+# built from these fields, and response models drop anything else.
+class UserPublicSummary(BaseModel):
+    id: str
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    avatar_url: Optional[str] = None
+    profile_image_url: Optional[str] = None
+    points: Optional[float] = 0
+
+class UserAdminSummary(UserPublicSummary):
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    role: Optional[str] = None
+    is_verified: Optional[bool] = None
+    is_banned: Optional[bool] = None
+    wallet_balance: Optional[float] = None
+    created_at: Optional[Any] = None
+
+class FriendSearchResult(UserPublicSummary):
+    email: Optional[str] = None
+    friendship_status: Optional[str] = None
+    friendship_id: Optional[str] = None
+
+class RowWithAdminUser(BaseModel):
+    """A list row of any shape whose embedded user is cut down to the admin summary"""
+    model_config = ConfigDict(extra="allow")
+    user: Optional[UserAdminSummary] = None
+
+class LeaderboardEntry(UserPublicSummary):
+    rank: int
+
+class LeaderboardResponse(BaseModel):
+    period: str = "all"
+    leaderboard: List[LeaderboardEntry]
+
+class FriendsResponse(BaseModel):
+    friends: List[UserPublicSummary]
+
+class FriendSearchResponse(BaseModel):
+    users: List[FriendSearchResult]
+
+class AdminTicketsResponse(BaseModel):
+    tickets: List[RowWithAdminUser]
+    next_cursor: Optional[str] = None
+
+class AdminWithdrawalsResponse(BaseModel):
+    withdrawals: List[RowWithAdminUser]
+    next_cursor: Optional[str] = None
+
+class AdminCourseAssignmentsResponse(BaseModel):
+    assignments: List[RowWithAdminUser]
+
 class QuizSubmission(BaseModel):
     answers: Dict[str, int]  # question_id -> selected_option_index
 
@@ -403,12 +1091,32 @@ class PaymentSettingsUpdate(BaseModel):
 
 # ======================== HELPER FUNCTIONS ========================
 
+# bcrypt is deliberately slow (~250ms at cost 12), so route handlers hash on a
+# bounded thread pool instead of the event loop. bcrypt releases the GIL, so the
+# pool size is how many hashes run in parallel per worker.
+PASSWORD_HASH_ROUNDS = int(os.environ.get('PASSWORD_HASH_ROUNDS', 12))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 4))
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=PASSWORD_HASH_ROUNDS)).decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+def password_needs_rehash(hashed: str) -> bool:
+    """True when a stored hash ($2b$<cost>$...) was made with a different work factor"""
+    try:
+        return int(hashed.split("$")[2]) != PASSWORD_HASH_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(password_executor, hash_password, password)
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(password_executor, verify_password, password, hashed)
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -430,15 +1138,96 @@ def decode_token(token: str):
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+# Every authenticated request resolves its user, so recently seen users are kept
+# in-process for a few seconds. Routes that change a user invalidate the entry;
+# the TTL bounds staleness for writes made by other workers.
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', 30))
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+
+# Routes that need the password hash, OTP or an embedded image fetch them explicitly.
+# A legacy embedded avatar leaves profile_image (without its data) as a marker.
+AUTH_USER_PROJECTION = {"_id": 0, "password": 0, "profile_image.data": 0, "otp": 0, "otp_expiry": 0}
+
+# public_summary: other users as anyone may see them; admin_summary: users on
+# admin screens; self: a user's own document, as loaded for authentication.
+# profile_image_variants is loaded so use_image_variant can pick a thumbnail.
+USER_PROJECTIONS = {
+    "public_summary": {"_id": 0, "profile_image_variants": 1, **{f: 1 for f in UserPublicSummary.model_fields}},
+    "admin_summary": {"_id": 0, "profile_image_variants": 1, **{f: 1 for f in UserAdminSummary.model_fields}},
+    "self": AUTH_USER_PROJECTION,
+}
+
+
+class UserCache:
+    """In-process TTL + LRU cache of slim user documents keyed by user id"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, user_id: str) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        # Copy so a route mutating current_user cannot corrupt the cached entry
+        return dict(entry[1])
+
+    def put(self, user_id: str, user: dict):
+        if self.ttl_seconds <= 0 or self.max_entries <= 0:
+            return
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, dict(user))
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """Drop one user, or every user when no id is given"""
+        self.invalidations += 1
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
+
+
+user_cache = UserCache(max_entries=USER_CACHE_SIZE, ttl_seconds=USER_CACHE_TTL_SECONDS)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     if not credentials:
         raise HTTPException(status_code=401, detail="Not authenticated")
     payload = decode_token(credentials.credentials)
     if payload.get("type") != "access":
         raise HTTPException(status_code=401, detail="Invalid token type")
-    user = await db.users.find_one({"id": payload.get("sub")}, {"_id": 0})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    user_id = payload.get("sub")
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await db.users.find_one({"id": user_id}, AUTH_USER_PROJECTION)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        user_cache.put(user_id, user)
     if user.get("is_banned"):
         raise HTTPException(status_code=403, detail="User is banned")
     return user
@@ -454,24 +1243,191 @@ def generate_otp():
 def generate_referral_code():
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
 
+# Strong references to fire-and-forget jobs; the event loop only keeps weak ones
+background_jobs = set()
+
+def run_background_job(coro, name: str) -> asyncio.Task:
+    """Run a long admin job after the response is sent, logging any failure"""
+    task = asyncio.create_task(coro, name=name)
+    background_jobs.add(task)
+
+    def finished(done: asyncio.Task):
+        background_jobs.discard(done)
+        if not done.cancelled() and done.exception() is not None:
+            logger.error(f"Background job {name} failed: {done.exception()}")
+
+    task.add_done_callback(finished)
+    return task
+
 def generate_payu_hash(txnid: str, amount: str, productinfo: str, firstname: str, email: str):
     hash_string = f"{PAYU_MERCHANT_KEY}|{txnid}|{amount}|{productinfo}|{firstname}|{email}|||||||||||{PAYU_MERCHANT_SALT}"
     return hashlib.sha512(hash_string.encode('utf-8')).hexdigest()
 
+# ======================== KEYSET PAGINATION ========================
+
+# List routes page by (sort key, id) instead of skip/limit: the cursor is the
+# last row's sort value and id, so page 5,000 costs the same index seek as page 1.
+# Every list route has a compound index on its filter fields, sort key and id.
+PAGE_SIZE_MAX = 500
+
+
+def encode_cursor(sort_field: str, value: Any, item_id: str) -> str:
+    if isinstance(value, datetime):
+        value = {"$date": value.isoformat()}
+    payload = json.dumps([sort_field, value, item_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_field: str) -> Tuple[Any, str]:
+    """Return (sort value, id) from an opaque cursor, rejecting tampered or mismatched ones"""
+    try:
+        field, value, item_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if field != sort_field or not isinstance(item_id, str):
+        raise HTTPException(status_code=400, detail="Cursor does not match this sort order")
+    if isinstance(value, dict) and "$date" in value:
+        value = datetime.fromisoformat(value["$date"])
+    return value, item_id
+
+
+def keyset_filter(sort_field: str, direction: int, value: Any, item_id: str) -> dict:
+    """Rows strictly after (value, id) in (sort_field, id) order; nulls sort lowest"""
+    op = "$lt" if direction < 0 else "$gt"
+    if value is None:
+        after = [{sort_field: None, "id": {op: item_id}}]
+        if direction > 0:
+            after.append({sort_field: {"$ne": None}})
+        return {"$or": after}
+    after = [{sort_field: {op: value}}, {sort_field: value, "id": {op: item_id}}]
+    if direction < 0:
+        after.append({sort_field: None})
+    return {"$or": after}
+
+
+async def paginate(
+    collection,
+    query: dict,
+    projection: dict,
+    sort_field: str = "created_at",
+    direction: int = -1,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    skip: int = 0
+) -> Tuple[List[dict], Optional[str]]:
+    """One page of collection sorted by (sort_field, id), plus the cursor for the next page.
+
+    skip only serves legacy page-number callers and is ignored when a cursor is given.
+    """
+    limit = max(1, min(limit, PAGE_SIZE_MAX))
+    if cursor:
+        value, item_id = decode_cursor(cursor, sort_field)
+        after = keyset_filter(sort_field, direction, value, item_id)
+        query = {"$and": [query, after]} if query else after
+        skip = 0
+    if projection.get("_id") == 0 and any(v for k, v in projection.items() if k != "_id"):
+        projection = {**projection, "id": 1, sort_field: 1}
+    rows = await collection.find(query, projection).sort(
+        [(sort_field, direction), ("id", direction)]
+    ).skip(skip).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort_field, rows[-1].get(sort_field), rows[-1]["id"])
+    return rows, next_cursor
+
+
+# ======================== BATCH LOADER ========================
+
+# Projection profiles for documents embedded into list responses, as
+# (collection, projection). Inclusion projections must list id.
+LOADER_PROFILES = {
+    "public_summary": ("users", USER_PROJECTIONS["public_summary"]),
+    "admin_summary": ("users", USER_PROJECTIONS["admin_summary"]),
+    "course_card": ("courses", {"_id": 0, "thumbnail_data": 0, "content_version": 0, "module_ids": 0}),
+    "course_title": ("courses", {"_id": 0, "id": 1, "title": 1}),
+}
+
+
+class BatchLoader:
+    """Request-scoped id -> document loader.
+
+    Ids collected with want() or attach() are resolved with one $in query per
+    profile, run concurrently; repeated and already loaded ids cost nothing.
+    Create one per request: nothing is shared or invalidated across requests.
+    """
+
+    def __init__(self):
+        self._pending: Dict[str, set] = {}
+        self._loaded: Dict[str, Dict[str, Optional[dict]]] = {}
+
+    def want(self, profile: str, ids) -> None:
+        loaded = self._loaded.setdefault(profile, {})
+        self._pending.setdefault(profile, set()).update(i for i in ids if i and i not in loaded)
+
+    async def _fetch(self, profile: str, ids: set) -> None:
+        collection, projection = LOADER_PROFILES[profile]
+        loaded = self._loaded[profile]
+        async for doc in db[collection].find({"id": {"$in": list(ids)}}, projection):
+            if collection == "users":
+                use_image_variant(doc, "profile_image_url", "profile_image_variants", 64)
+            loaded[doc["id"]] = doc
+        for item_id in ids:
+            loaded.setdefault(item_id, None)
+
+    async def load(self) -> None:
+        pending = {profile: ids for profile, ids in self._pending.items() if ids}
+        self._pending = {}
+        await asyncio.gather(*(self._fetch(profile, ids) for profile, ids in pending.items()))
+
+    def get(self, profile: str, item_id: Optional[str]) -> Optional[dict]:
+        doc = self._loaded.get(profile, {}).get(item_id)
+        return dict(doc) if doc is not None else None
+
+    async def load_many(self, profile: str, ids) -> Dict[str, dict]:
+        """Documents for ids that exist, keyed by id"""
+        ids = list(ids)
+        self.want(profile, ids)
+        await self.load()
+        found = {item_id: self.get(profile, item_id) for item_id in ids}
+        return {item_id: doc for item_id, doc in found.items() if doc is not None}
+
+    async def attach(self, rows: List[dict], *specs: Tuple[str, str, str]) -> List[dict]:
+        """For each (key_field, target_field, profile), set row[target_field] to the loaded document or None"""
+        for key_field, _, profile in specs:
+            self.want(profile, (row.get(key_field) for row in rows))
+        await self.load()
+        for row in rows:
+            for key_field, target_field, profile in specs:
+                row[target_field] = self.get(profile, row.get(key_field))
+        return rows
+
+
 # ======================== EMAIL FUNCTIONS ========================
 
+# Settings are read on every send, so they are cached briefly and dropped
+# whenever an admin saves new email settings.
+EMAIL_SETTINGS_TTL_SECONDS = float(os.environ.get('EMAIL_SETTINGS_TTL_SECONDS', 60))
+_smtp_settings_cache: Dict[str, Any] = {"expires": 0.0, "settings": None}
+
+def invalidate_smtp_settings():
+    _smtp_settings_cache["expires"] = 0.0
+
 async def get_smtp_settings():
     """Get SMTP settings from database (priority) or environment fallback"""
+    if _smtp_settings_cache["expires"] > time.monotonic():
+        return _smtp_settings_cache["settings"]
+    
+    resolved = None
     # First try database settings (configured via admin panel)
     settings = await db.settings.find_one({"type": "email"}, {"_id": 0})
     if settings and all([settings.get("smtp_host"), settings.get("smtp_user"), settings.get("smtp_password")]):
         logger.info("Using SMTP settings from database")
-        return settings
-    
+        resolved = settings
     # Fallback to environment variables
-    if all([SMTP_HOST, SMTP_USER, SMTP_PASSWORD]):
+    elif all([SMTP_HOST, SMTP_USER, SMTP_PASSWORD]):
         logger.info("Using SMTP settings from environment variables")
-        return {
+        resolved = {
             "smtp_host": SMTP_HOST,
             "smtp_port": SMTP_PORT,
             "smtp_user": SMTP_USER,
@@ -479,80 +1435,39 @@ async def get_smtp_settings():
             "smtp_use_ssl": True
         }
     
-    return None
+    _smtp_settings_cache.update(expires=time.monotonic() + EMAIL_SETTINGS_TTL_SECONDS, settings=resolved)
+    return resolved
 
-async def send_email_async(to_email: str, subject: str, html_content: str) -> bool:
-    """Send email using SMTP with SSL (async version)"""
+def new_outbox_message(to_email: str, subject: str, html_content: str, source: str = None) -> dict:
+    """An email_outbox document; source ties bulk sends back to what triggered them"""
+    now = datetime.now(timezone.utc).isoformat()
+    message = {
+        "id": str(uuid.uuid4()),
+        "to": to_email,
+        "subject": subject,
+        "html": html_content,
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "last_error": None,
+        "created_at": now,
+        "updated_at": now
+    }
+    if source:
+        message["source"] = source
+    return message
+
+async def enqueue_email(to_email: str, subject: str, html_content: str) -> str:
+    """Queue an email in the outbox and return its id; delivery happens in the background"""
+    message = new_outbox_message(to_email, subject, html_content)
+    await db.email_outbox.insert_one(message)
+    email_outbox.notify()
+    return message["id"]
+
+async def get_email_logo():
+    """Email logo URL from the (cached) email settings"""
     settings = await get_smtp_settings()
-    
-    if not settings:
-        logger.warning("SMTP not configured, skipping email send")
-        return False
-    
-    try:
-        message = MIMEMultipart("alternative")
-        message["Subject"] = subject
-        from_name = settings.get("smtp_from_name", "LUMINA")
-        from_email = settings.get("smtp_from_email", settings.get("smtp_user"))
-        message["From"] = f"{from_name} <{from_email}>"
-        message["To"] = to_email
-        
-        html_part = MIMEText(html_content, "html")
-        message.attach(html_part)
-        
-        # Create SSL context
-        context = ssl.create_default_context()
-        
-        smtp_host = settings["smtp_host"]
-        smtp_port = settings.get("smtp_port", 465)
-        smtp_user = settings["smtp_user"]
-        smtp_password = settings["smtp_password"]
-        use_ssl = settings.get("smtp_use_ssl", True)
-        
-        # Connect using SSL or TLS
-        if use_ssl:
-            with smtplib.SMTP_SSL(smtp_host, smtp_port, context=context) as server:
-                server.login(smtp_user, smtp_password)
-                server.sendmail(smtp_user, to_email, message.as_string())
-        else:
-            with smtplib.SMTP(smtp_host, smtp_port) as server:
-                server.starttls(context=context)
-                server.login(smtp_user, smtp_password)
-                server.sendmail(smtp_user, to_email, message.as_string())
-        
-        logger.info(f"Email sent successfully to {to_email}")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send email to {to_email}: {e}")
-        return False
-
-def send_email(to_email: str, subject: str, html_content: str) -> bool:
-    """Send email using SMTP with SSL (sync wrapper for background tasks)"""
-    import asyncio
-    try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            # If already in async context, create task
-            asyncio.create_task(send_email_async(to_email, subject, html_content))
-            return True
-        else:
-            return loop.run_until_complete(send_email_async(to_email, subject, html_content))
-    except RuntimeError:
-        # No event loop, create new one
-        return asyncio.run(send_email_async(to_email, subject, html_content))
-
-def get_email_logo_sync():
-    """Get email logo URL from settings (sync version for email functions)"""
-    import asyncio
-    try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            # Return default if already in async context
-            return None
-        settings = loop.run_until_complete(db.settings.find_one({"type": "email"}))
-        return settings.get("email_logo_url") if settings else None
-    except:
-        return None
+    return settings.get("email_logo_url") if settings else None
 
 def get_email_template(content: str, site_name: str = "LUMINA", logo_url: str = None):
     """Generate standardized email template with logo support"""
@@ -605,9 +1520,9 @@ def get_email_template(content: str, site_name: str = "LUMINA", logo_url: str =
     </html>
     """
 
-def send_otp_email(to_email: str, otp: str, user_name: str = "User"):
+async def send_otp_email(to_email: str, otp: str, user_name: str = "User"):
     """Send OTP verification email"""
-    logo_url = get_email_logo_sync()
+    logo_url = await get_email_logo()
     content = f"""
         <h1>Verify Your Email</h1>
         <p>Hi {user_name},</p>
@@ -618,11 +1533,11 @@ def send_otp_email(to_email: str, otp: str, user_name: str = "User"):
         <p>This OTP is valid for 10 minutes. If you didn't request this, please ignore this email.</p>
     """
     html_content = get_email_template(content, "LUMINA", logo_url)
-    return send_email(to_email, "Verify Your Account - OTP", html_content)
+    return await enqueue_email(to_email, "Verify Your Account - OTP", html_content)
 
-def send_password_reset_email(to_email: str, reset_token: str, user_name: str = "User"):
+async def send_password_reset_email(to_email: str, reset_token: str, user_name: str = "User"):
     """Send password reset email"""
-    logo_url = get_email_logo_sync()
+    logo_url = await get_email_logo()
     reset_link = f"{os.environ.get('FRONTEND_URL', 'https://skill-exchange-110.preview.emergentagent.com')}/reset-password?token={reset_token}"
     content = f"""
         <h1>Reset Your Password</h1>
@@ -634,11 +1549,11 @@ def send_password_reset_email(to_email: str, reset_token: str, user_name: str =
         <p>This link is valid for 1 hour. If you didn't request this, please ignore this email.</p>
     """
     html_content = get_email_template(content, "LUMINA", logo_url)
-    return send_email(to_email, "Reset Your Password", html_content)
+    return await enqueue_email(to_email, "Reset Your Password", html_content)
 
-def send_payment_confirmation_email(to_email: str, user_name: str, order_total: float, courses: list):
+async def send_payment_confirmation_email(to_email: str, user_name: str, order_total: float, courses: list):
     """Send payment confirmation email"""
-    logo_url = get_email_logo_sync()
+    logo_url = await get_email_logo()
     course_list = "".join([f"<li style='color: #94A3B8; padding: 8px 0;'>{c['title']}</li>" for c in courses])
     content = f"""
         <h1 style="color: #10B981;">Payment Successful!</h1>
@@ -650,11 +1565,11 @@ def send_payment_confirmation_email(to_email: str, user_name: str, order_total:
         <p>You can now access your courses from your dashboard. Happy learning!</p>
     """
     html_content = get_email_template(content, "LUMINA", logo_url)
-    return send_email(to_email, "Payment Confirmed", html_content)
+    return await enqueue_email(to_email, "Payment Confirmed", html_content)
 
-def send_order_success_email(to_email: str, user_name: str, order: dict, courses: list):
+async def send_order_success_email(to_email: str, user_name: str, order: dict, courses: list):
     """Send order success email with invoice details"""
-    logo_url = get_email_logo_sync()
+    logo_url = await get_email_logo()
     course_rows = ""
     for course in courses:
         price = course.get("discount_price") or course.get("price", 0)
@@ -701,11 +1616,11 @@ def send_order_success_email(to_email: str, user_name: str, order: dict, courses
         </p>
     """
     html_content = get_email_template(content, "LUMINA", logo_url)
-    return send_email(to_email, f"Order Confirmed - Invoice #{order['txn_id']}", html_content)
+    return await enqueue_email(to_email, f"Order Confirmed - Invoice #{order['txn_id']}", html_content)
 
-def send_withdrawal_notification_email(to_email: str, user_name: str, amount: float, status: str):
+async def send_withdrawal_notification_email(to_email: str, user_name: str, amount: float, status: str):
     """Send withdrawal status notification"""
-    logo_url = get_email_logo_sync()
+    logo_url = await get_email_logo()
     status_color = "#10B981" if status == "approved" else "#EF4444"
     status_text = "approved and processed" if status == "approved" else "rejected"
     extra_msg = "The amount will be transferred to your bank account within 3-5 business days." if status == "approved" else "Please contact support if you have any questions."
@@ -718,11 +1633,11 @@ def send_withdrawal_notification_email(to_email: str, user_name: str, amount: fl
         <p>{extra_msg}</p>
     """
     html_content = get_email_template(content, "LUMINA", logo_url)
-    return send_email(to_email, f"Withdrawal {status.title()}", html_content)
+    return await enqueue_email(to_email, f"Withdrawal {status.title()}", html_content)
 
-def send_certificate_email(to_email: str, user_name: str, course_title: str, certificate_id: str, verification_url: str):
+async def send_certificate_email(to_email: str, user_name: str, course_title: str, certificate_id: str, verification_url: str):
     """Send certificate generation notification email"""
-    logo_url = get_email_logo_sync()
+    logo_url = await get_email_logo()
     content = f"""
         <div style="text-align: center;">
             <div style="font-size: 60px; margin: 20px 0;">🏆</div>
@@ -745,126 +1660,587 @@ def send_certificate_email(to_email: str, user_name: str, course_title: str, cer
         </div>
     """
     html_content = get_email_template(content, "LUMINA", logo_url)
-    return send_email(to_email, "Congratulations! Your Certificate is Ready", html_content)
+    return await enqueue_email(to_email, "Congratulations! Your Certificate is Ready", html_content)
+
+# ======================== EMAIL OUTBOX ========================
+
+# Request handlers only insert into email_outbox. A few worker tasks per process
+# claim due messages with a lease, send them over long-lived authenticated SMTP
+# sessions, and reschedule failures with exponential backoff. The rate limit is
+# per process, so the effective rate scales with the number of API workers.
+EMAIL_WORKERS = int(os.environ.get('EMAIL_WORKERS', 2))
+EMAIL_RATE_PER_SECOND = float(os.environ.get('EMAIL_RATE_PER_SECOND', 5))
+EMAIL_MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', 6))
+EMAIL_RETRY_BASE_SECONDS = float(os.environ.get('EMAIL_RETRY_BASE_SECONDS', 30))
+EMAIL_RETRY_MAX_SECONDS = float(os.environ.get('EMAIL_RETRY_MAX_SECONDS', 3600))
+EMAIL_POLL_SECONDS = float(os.environ.get('EMAIL_POLL_SECONDS', 5))
+EMAIL_LEASE_SECONDS = 120
+EMAIL_IDLE_SECONDS = 60
+EMAIL_SMTP_TIMEOUT = 30
+EMAIL_STATUSES = ("pending", "sending", "sent", "failed")
+
+
+def build_email_message(settings: dict, to_email: str, subject: str, html_content: str) -> MIMEMultipart:
+    message = MIMEMultipart("alternative")
+    message["Subject"] = subject
+    from_name = settings.get("smtp_from_name", "LUMINA")
+    from_email = settings.get("smtp_from_email", settings.get("smtp_user"))
+    message["From"] = f"{from_name} <{from_email}>"
+    message["To"] = to_email
+    message.attach(MIMEText(html_content, "html"))
+    return message
+
+
+def is_permanent_smtp_error(error: Exception) -> bool:
+    """5xx replies mean retrying cannot help; bad credentials are left to retry until fixed"""
+    if isinstance(error, aiosmtplib.SMTPAuthenticationError):
+        return False
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return all(500 <= refused.code < 600 for refused in error.recipients)
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        return 500 <= error.code < 600
+    return False
 
-# ======================== R2 STORAGE FUNCTIONS ========================
 
-def get_r2_client_for_bucket(bucket_config: dict):
-    """Create an R2 client for a specific bucket configuration"""
-    try:
-        endpoint = f"https://{bucket_config['account_id']}.r2.cloudflarestorage.com"
-        client = boto3.client(
-            's3',
-            endpoint_url=endpoint,
-            aws_access_key_id=bucket_config['access_key_id'],
-            aws_secret_access_key=bucket_config['secret_access_key'],
-            config=Config(signature_version='s3v4'),
-            region_name='auto'
+class SMTPConnection:
+    """One authenticated SMTP session, reused until it fails, idles out or settings change"""
+
+    def __init__(self):
+        self._client: Optional[aiosmtplib.SMTP] = None
+        self._settings_key = None
+        self.last_used = 0.0
+        self.connects = 0
+
+    async def _connect(self, settings: dict) -> aiosmtplib.SMTP:
+        options = {"hostname": settings["smtp_host"], "port": settings.get("smtp_port", 465), "timeout": EMAIL_SMTP_TIMEOUT}
+        if settings.get("smtp_use_ssl", True):
+            options.update(use_tls=True, tls_context=ssl.create_default_context())
+        elif settings.get("smtp_starttls", True):
+            options.update(start_tls=True, tls_context=ssl.create_default_context())
+        else:
+            options.update(start_tls=False)
+        smtp = aiosmtplib.SMTP(**options)
+        await smtp.connect()
+        try:
+            await smtp.login(settings["smtp_user"], settings["smtp_password"])
+        except Exception:
+            smtp.close()
+            raise
+        self.connects += 1
+        return smtp
+
+    async def send(self, settings: dict, message, recipient: str):
+        key = tuple(settings.get(k) for k in (
+            "smtp_host", "smtp_port", "smtp_user", "smtp_password", "smtp_use_ssl", "smtp_starttls"))
+        if self._client is not None and (key != self._settings_key or not self._client.is_connected):
+            await self.close()
+        for attempt in range(2):
+            if self._client is None:
+                self._client = await self._connect(settings)
+                self._settings_key = key
+            try:
+                await self._client.send_message(message, sender=settings["smtp_user"], recipients=[recipient])
+                self.last_used = time.monotonic()
+                return
+            except aiosmtplib.SMTPServerDisconnected:
+                # Servers drop idle sessions; reconnect once before giving up
+                await self.close()
+                if attempt:
+                    raise
+
+    async def close_if_idle(self):
+        if self._client is not None and time.monotonic() - self.last_used > EMAIL_IDLE_SECONDS:
+            await self.close()
+
+    async def close(self):
+        smtp, self._client = self._client, None
+        if smtp is None:
+            return
+        try:
+            if smtp.is_connected:
+                await smtp.quit()
+        except Exception:
+            smtp.close()
+
+
+class RateLimiter:
+    """Token bucket shared by the outbox workers of one process"""
+
+    def __init__(self, rate_per_second: float, burst: float = None):
+        self.rate = rate_per_second
+        self.capacity = burst or max(1.0, rate_per_second)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class EmailOutbox:
+    """Background delivery of queued emails"""
+
+    def __init__(self, workers: int, rate_per_second: float):
+        self.workers = workers
+        self.limiter = RateLimiter(rate_per_second)
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+
+    def notify(self):
+        self._wakeup.set()
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def claim(self) -> Optional[dict]:
+        """Lease the next due message; expired leases from crashed workers are reclaimed"""
+        now = datetime.now(timezone.utc)
+        return await db.email_outbox.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now.isoformat()}},
+                {"status": "sending", "lease_expires_at": {"$lte": now.isoformat()}},
+            ]},
+            {
+                "$set": {
+                    "status": "sending",
+                    "lease_expires_at": (now + timedelta(seconds=EMAIL_LEASE_SECONDS)).isoformat(),
+                    "updated_at": now.isoformat()
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("next_attempt_at", ASCENDING)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
         )
-        return client
-    except Exception as e:
-        logger.error(f"Failed to create R2 client: {e}")
+
+    async def process(self, message: dict, connection: SMTPConnection):
+        error, permanent = None, False
+        settings = await get_smtp_settings()
+        if not settings:
+            error = "SMTP not configured"
+        else:
+            await self.limiter.acquire()
+            try:
+                email = build_email_message(settings, message["to"], message["subject"], message["html"])
+                await connection.send(settings, email, message["to"])
+            except Exception as e:
+                error, permanent = str(e) or type(e).__name__, is_permanent_smtp_error(e)
+                if not permanent:
+                    await connection.close()
+        
+        now = datetime.now(timezone.utc)
+        if error is None:
+            update = {"$set": {"status": "sent", "sent_at": now.isoformat(), "last_error": None},
+                      "$unset": {"html": "", "lease_expires_at": ""}}
+            self.sent += 1
+        elif permanent or message["attempts"] >= EMAIL_MAX_ATTEMPTS:
+            update = {"$set": {"status": "failed", "last_error": error}, "$unset": {"lease_expires_at": ""}}
+            self.failed += 1
+            logger.error(f"Email {message['id']} to {message['to']} failed permanently: {error}")
+        else:
+            delay = min(EMAIL_RETRY_MAX_SECONDS, EMAIL_RETRY_BASE_SECONDS * 2 ** (message["attempts"] - 1))
+            delay *= random.uniform(0.8, 1.2)
+            update = {"$set": {"status": "pending", "last_error": error,
+                               "next_attempt_at": (now + timedelta(seconds=delay)).isoformat()},
+                      "$unset": {"lease_expires_at": ""}}
+            self.retried += 1
+            logger.warning(f"Email {message['id']} to {message['to']} failed, retrying in {delay:.0f}s: {error}")
+        update["$set"]["updated_at"] = now.isoformat()
+        # Only the holder of the current lease may record the outcome
+        await db.email_outbox.update_one({"id": message["id"], "lease_expires_at": message["lease_expires_at"]}, update)
+
+    async def drain(self) -> int:
+        """Deliver every message that is due now on the calling task; returns how many were processed"""
+        connection = SMTPConnection()
+        processed = 0
+        try:
+            while (message := await self.claim()) is not None:
+                await self.process(message, connection)
+                processed += 1
+        finally:
+            await connection.close()
+        return processed
+
+    async def _worker(self, number: int):
+        connection = SMTPConnection()
+        try:
+            while True:
+                try:
+                    self._wakeup.clear()
+                    message = await self.claim()
+                    if message is None:
+                        await connection.close_if_idle()
+                        try:
+                            await asyncio.wait_for(self._wakeup.wait(), EMAIL_POLL_SECONDS)
+                        except asyncio.TimeoutError:
+                            pass
+                        continue
+                    await self.process(message, connection)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Email worker {number} error: {e}")
+                    await asyncio.sleep(EMAIL_POLL_SECONDS)
+        finally:
+            await connection.close()
+
+    async def stats(self) -> dict:
+        counts = {status: await db.email_outbox.count_documents({"status": status}) for status in EMAIL_STATUSES}
+        oldest = await db.email_outbox.find_one(
+            {"status": "pending"}, {"_id": 0, "created_at": 1}, sort=[("next_attempt_at", ASCENDING)])
+        return {
+            "queue": counts,
+            "oldest_pending_created_at": oldest["created_at"] if oldest else None,
+            "workers_running": sum(1 for task in self._tasks if not task.done()),
+            "rate_per_second": self.limiter.rate,
+            "this_process": {"sent": self.sent, "retried": self.retried, "failed": self.failed},
+        }
+
+
+email_outbox = EmailOutbox(workers=EMAIL_WORKERS, rate_per_second=EMAIL_RATE_PER_SECOND)
+
+# ======================== MEDIA (IMAGE) SERVICE ========================
+
+# Images live in object storage under content-addressed keys and are served by
+# GET /api/media/{key}. Documents keep only the key and its URL; since a key
+# never changes content, responses are cacheable forever.
+MEDIA_BASE_URL = os.environ.get('MEDIA_BASE_URL', '').rstrip('/')
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"
+IMAGE_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "image/gif": "gif"}
+
+
+def media_url(key: str) -> str:
+    return f"{MEDIA_BASE_URL}/api/media/{key}"
+
+
+def parse_data_url(data_url: str) -> Optional[tuple]:
+    """Split a base64 data URL into (bytes, content_type)"""
+    import base64
+    if not data_url or not data_url.startswith("data:") or ";base64," not in data_url:
         return None
+    header, encoded = data_url[5:].split(";base64,", 1)
+    return base64.b64decode(encoded), header or "application/octet-stream"
 
-def upload_to_r2(file_data: bytes, object_key: str, content_type: str = "application/octet-stream") -> bool:
-    """Upload file to Cloudflare R2"""
-    if not r2_client:
-        logger.warning("R2 client not initialized")
-        return False
-    
-    try:
-        r2_client.put_object(
-            Bucket=R2_BUCKET_NAME,
-            Key=object_key,
-            Body=file_data,
-            ContentType=content_type
-        )
-        logger.info(f"Uploaded {object_key} to R2")
-        return True
-    except ClientError as e:
-        logger.error(f"Failed to upload to R2: {e}")
-        return False
 
-def upload_large_file_to_r2(file, object_key: str, content_type: str = "application/octet-stream") -> bool:
-    """Upload large file to Cloudflare R2 using multipart upload"""
-    if not r2_client:
-        logger.warning("R2 client not initialized")
-        return False
+async def store_media(data: bytes, content_type: str, prefix: str) -> dict:
+    """Store bytes in R2 (or Emergent storage) and return {"key", "url"}.
+
+    Identical uploads share one object, so re-uploading is free.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    ext = IMAGE_EXTENSIONS.get(content_type, "bin")
+    key = f"{prefix}/{digest[:32]}.{ext}"
     
-    try:
-        # Use multipart upload for large files
-        from boto3.s3.transfer import TransferConfig
-        
-        config = TransferConfig(
-            multipart_threshold=50 * 1024 * 1024,  # 50MB
-            max_concurrency=10,
-            multipart_chunksize=50 * 1024 * 1024,  # 50MB chunks
-            use_threads=True
+    if not await db.media_objects.find_one({"key": key}, {"_id": 1}):
+        stored = None
+        if r2_storage:
+            try:
+                stored = await r2_storage.put(f"media/{key}", data, content_type)
+                storage = r2_storage.name
+            except StorageError as e:
+                logger.error(f"Failed to upload {key} to R2: {e}")
+        if stored is None:
+            stored = await fallback_storage.put(f"{APP_NAME}/media/{key}", data, content_type)
+            storage = fallback_storage.name
+        storage_path = stored["path"]
+        await db.media_objects.update_one(
+            {"key": key},
+            {"$setOnInsert": {
+                "key": key,
+                "content_type": content_type,
+                "size": len(data),
+                "etag": digest,
+                "storage": storage,
+                "storage_path": storage_path,
+                "created_at": datetime.now(timezone.utc).isoformat()
+            }},
+            upsert=True
         )
-        
-        r2_client.upload_fileobj(
-            file,
-            R2_BUCKET_NAME,
-            object_key,
-            Config=config,
-            ExtraArgs={'ContentType': content_type}
+    
+    return {"key": key, "url": media_url(key)}
+
+
+# Resized derivatives rendered for every uploaded image (longest side, px)
+IMAGE_VARIANT_SIZES = (64, 256, 1024)
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+image_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_image_process_pool() -> ProcessPoolExecutor:
+    # spawn keeps workers from inheriting the event loop and Mongo client threads
+    global image_process_pool
+    if image_process_pool is None:
+        image_process_pool = ProcessPoolExecutor(
+            max_workers=IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
         )
-        logger.info(f"Uploaded large file {object_key} to R2")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to upload large file to R2: {e}")
-        return False
+    return image_process_pool
 
-def get_r2_presigned_upload_url(object_key: str, content_type: str = "video/mp4", expiry_seconds: int = 3600) -> Optional[str]:
-    """Generate a presigned URL for direct upload to R2"""
-    if not r2_client:
-        logger.warning("R2 client not initialized")
-        return None
+
+async def store_image(data: bytes, content_type: str, prefix: str) -> dict:
+    """Store an uploaded image and its resized WebP/JPEG variants.
+
+    Returns {"key", "url", "variants": {"64": {"webp": url, "jpeg": url}, ...}}.
+    Resizing runs in the image process pool; an image Pillow cannot decode is
+    still stored, just without variants.
+    """
+    from image_processing import render_variants
     
+    original = await store_media(data, content_type, prefix)
     try:
-        url = r2_client.generate_presigned_url(
-            'put_object',
-            Params={
-                'Bucket': R2_BUCKET_NAME,
-                'Key': object_key,
-                'ContentType': content_type
-            },
-            ExpiresIn=expiry_seconds
+        rendered = await asyncio.get_running_loop().run_in_executor(
+            get_image_process_pool(), render_variants, data, IMAGE_VARIANT_SIZES
         )
-        return url
-    except ClientError as e:
-        logger.error(f"Failed to generate presigned upload URL: {e}")
-        return None
+    except Exception as e:
+        logger.warning(f"Could not render variants for {original['key']}: {e}")
+        rendered = {}
+    
+    sizes = list(rendered)
+    stored = await asyncio.gather(*[
+        store_media(rendered[size][fmt], f"image/{fmt}", f"{prefix}/{size}")
+        for size in sizes for fmt in ("webp", "jpeg")
+    ])
+    original["variants"] = {
+        size: {"webp": stored[2 * i]["url"], "jpeg": stored[2 * i + 1]["url"]}
+        for i, size in enumerate(sizes)
+    }
+    return original
 
-def get_r2_signed_url(object_key: str, expiry_seconds: int = 3600) -> Optional[str]:
-    """Generate a signed URL for R2 object"""
-    if not r2_client:
-        logger.warning("R2 client not initialized")
-        return None
-    
+
+def use_image_variant(doc: dict, url_field: str, variants_field: str, size: int) -> dict:
+    """Point url_field at the WebP variant of `size` (when one exists) and drop the variant map"""
+    variant = (doc.pop(variants_field, None) or {}).get(str(size))
+    if variant:
+        doc[url_field] = variant["webp"]
+    return doc
+
+
+async def load_media(media: dict) -> Optional[bytes]:
     try:
-        url = r2_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': R2_BUCKET_NAME, 'Key': object_key},
-            ExpiresIn=expiry_seconds
-        )
-        return url
-    except ClientError as e:
-        logger.error(f"Failed to generate signed URL: {e}")
+        content, _ = await storage_backend(media["storage"]).get(media["storage_path"])
+    except StorageError as e:
+        logger.error(f"Failed to read {media['storage_path']} from {media['storage']}: {e}")
         return None
+    return content
+
+
+# ======================== COURSE COUNTERS ========================
+
+# Courses carry rating_sum / rating_count (visible reviews only) and
+# enrollment_count, kept current with $inc by every review and enrollment path.
+
+async def adjust_course_rating(course_id: str, rating_delta: int, count_delta: int):
+    await db.courses.update_one(
+        {"id": course_id},
+        {"$inc": {"rating_sum": rating_delta, "rating_count": count_delta}}
+    )
+
+
+async def adjust_course_enrollments(course_id: str, delta: int):
+    await db.courses.update_one({"id": course_id}, {"$inc": {"enrollment_count": delta}})
+    # Daily rollups count enrollments by enrolled_at, as the rebuild does, so a
+    # revoked enrollment only leaves the running total
+    if delta > 0:
+        await record_metrics(enrollments=delta)
+    else:
+        await record_metrics(totals={"enrollments": delta})
+
+
+def apply_course_stats(course: dict) -> dict:
+    """Replace the stored counters with the public average_rating / review_count / enrollment_count"""
+    rating_sum = course.pop("rating_sum", 0) or 0
+    rating_count = course.pop("rating_count", 0) or 0
+    enrollment_count = course.pop("enrollment_count", 0) or 0
+    course["average_rating"] = rating_sum / rating_count if rating_count > 0 else 0
+    course["review_count"] = rating_count
+    course["enrollment_count"] = enrollment_count
+    return course
+
+
+async def reconcile_course_counters(dry_run: bool = False) -> dict:
+    """Recompute course counters from reviews, enrollments, modules and lessons and report drift.
+
+    Each fix is conditional on the counters still holding the values read here,
+    so an $inc that lands mid-run is never overwritten (that course is reported
+    as skipped and will be fixed on the next run).
+    """
+    ratings = {}
+    async for row in db.reviews.aggregate([
+        {"$match": {"is_visible": True}},
+        {"$group": {"_id": "$course_id", "sum": {"$sum": "$rating"}, "count": {"$sum": 1}}}
+    ]):
+        ratings[row["_id"]] = row
+    enrollments = {}
+    async for row in db.enrollments.aggregate([{"$group": {"_id": "$course_id", "count": {"$sum": 1}}}]):
+        enrollments[row["_id"]] = row["count"]
+    lessons_per_module = {}
+    async for row in db.lessons.aggregate([{"$group": {"_id": "$module_id", "count": {"$sum": 1}}}]):
+        lessons_per_module[row["_id"]] = row["count"]
+    module_ids = {}
+    async for module in db.modules.find({}, {"_id": 0, "id": 1, "course_id": 1}).sort([("course_id", 1), ("order", 1)]):
+        module_ids.setdefault(module["course_id"], []).append(module["id"])
+
+    checked = 0
+    drift = []
+    updates = []
+    async for course in db.courses.find({}, {"_id": 0, "id": 1, "rating_sum": 1, "rating_count": 1, "enrollment_count": 1,
+                                              "lesson_count": 1, "module_ids": 1}):
+        checked += 1
+        rating = ratings.get(course["id"], {})
+        course_modules = module_ids.get(course["id"], [])
+        actual = {
+            "rating_sum": rating.get("sum", 0),
+            "rating_count": rating.get("count", 0),
+            "enrollment_count": enrollments.get(course["id"], 0),
+            "lesson_count": sum(lessons_per_module.get(module_id, 0) for module_id in course_modules),
+            "module_ids": course_modules
+        }
+        stored = {field: course.get(field) for field in actual}
+        if stored["module_ids"] and set(stored["module_ids"]) == set(course_modules):
+            # Same modules in a different order is not drift
+            actual["module_ids"] = stored["module_ids"]
+        if stored != actual:
+            drift.append({"course_id": course["id"], "stored": stored, "actual": actual})
+            updates.append(UpdateOne({"id": course["id"], **stored}, {"$set": actual}))
+
+    fixed = 0
+    if updates and not dry_run:
+        result = await db.courses.bulk_write(updates, ordered=False)
+        fixed = result.modified_count
+    return {
+        "courses_checked": checked,
+        "drifted": len(drift),
+        "fixed": fixed,
+        "skipped": 0 if dry_run else len(updates) - fixed,
+        "drift": drift
+    }
+
+
+# ======================== DASHBOARD METRICS ========================
+
+# The admin dashboard reads one daily_metrics document per UTC day (_id
+# "YYYY-MM-DD": revenue, orders, enrollments, commissions, active_users) and a
+# running totals document, both $inc-ed where the underlying events happen.
+# rebuild_dashboard_metrics recomputes everything from source collections.
+METRICS_TOTALS_ID = "all"
+
+
+def metrics_day(at: Optional[datetime] = None) -> str:
+    return (at or datetime.now(timezone.utc)).strftime("%Y-%m-%d")
+
+
+async def record_metrics(at: Optional[datetime] = None, totals: Optional[dict] = None, **daily: float):
+    """Add to the day's rollup and to the running totals (active_users is daily only)"""
+    at = at or datetime.now(timezone.utc)
+    daily = {field: value for field, value in daily.items() if value}
+    running = {**{f: v for f, v in daily.items() if f != "active_users"}, **(totals or {})}
+    stamp = {"$set": {"updated_at": at.isoformat()}}
+    if daily:
+        await db.daily_metrics.update_one({"_id": metrics_day(at)}, {"$inc": daily, **stamp}, upsert=True)
+    if running:
+        await db.metrics_totals.update_one({"_id": METRICS_TOTALS_ID}, {"$inc": running, **stamp}, upsert=True)
+
+
+async def record_login(user_id: str):
+    """Stamp last_login_at and count the user once in today's active_users"""
+    now = datetime.now(timezone.utc)
+    previous = await db.users.find_one_and_update(
+        {"id": user_id},
+        {"$set": {"last_login_at": now.isoformat()}},
+        projection={"_id": 0, "last_login_at": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if previous is not None and not (previous.get("last_login_at") or "").startswith(metrics_day(now)):
+        await record_metrics(now, active_users=1)
+
+
+def _day_of(field: str) -> dict:
+    return {"$substrCP": [{"$ifNull": [field, ""]}, 0, 10]}
+
+
+async def rebuild_dashboard_metrics(dry_run: bool = False) -> dict:
+    """Recompute daily rollups, totals and users.last_login_at from orders,
+    enrollments, referral earnings, withdrawals and login logs.
+
+    Events recorded while the rebuild runs may be counted twice or lost for the
+    affected day; run it when the dashboard looks wrong, not on a schedule.
+    """
+    days: Dict[str, dict] = {}
+
+    def add(rows: List[dict], fields: Dict[str, str]):
+        for row in rows:
+            if row["_id"]:
+                day = days.setdefault(row["_id"], {})
+                for target, source in fields.items():
+                    day[target] = day.get(target, 0) + (row.get(source) or 0)
+
+    add(await db.orders.aggregate([
+        {"$match": {"status": "completed"}},
+        {"$group": {"_id": _day_of({"$ifNull": ["$completed_at", "$created_at"]}),
+                    "revenue": {"$sum": "$total"}, "orders": {"$sum": 1}}},
+    ]).to_list(None), {"revenue": "revenue", "orders": "orders"})
+    add(await db.enrollments.aggregate([
+        {"$group": {"_id": _day_of("$enrolled_at"), "enrollments": {"$sum": 1}}},
+    ]).to_list(None), {"enrollments": "enrollments"})
+    add(await db.referral_earnings.aggregate([
+        {"$group": {"_id": _day_of("$created_at"), "commissions": {"$sum": "$commission_amount"}}},
+    ]).to_list(None), {"commissions": "commissions"})
+    add(await db.commissions.aggregate([
+        {"$group": {"_id": _day_of("$created_at"), "commissions": {"$sum": "$commission"}}},
+    ]).to_list(None), {"commissions": "commissions"})
+    add(await db.login_logs.aggregate([
+        {"$group": {"_id": {"day": _day_of("$timestamp"), "user_id": "$user_id"}}},
+        {"$group": {"_id": "$_id.day", "active_users": {"$sum": 1}}},
+    ], allowDiskUse=True).to_list(None), {"active_users": "active_users"})
+
+    pending = await db.withdrawals.aggregate([
+        {"$match": {"status": "pending"}},
+        {"$group": {"_id": None, "count": {"$sum": 1}, "amount": {"$sum": "$amount"}}},
+    ]).to_list(1)
+    totals = {field: sum(day.get(field, 0) for day in days.values()) for field in ("revenue", "orders", "commissions")}
+    totals["enrollments"] = await db.enrollments.count_documents({})
+    totals["pending_withdrawals"] = pending[0]["count"] if pending else 0
+    totals["pending_withdrawal_amount"] = pending[0]["amount"] if pending else 0
+
+    last_logins = await db.login_logs.aggregate([
+        {"$group": {"_id": "$user_id", "last": {"$max": "$timestamp"}}},
+    ], allowDiskUse=True).to_list(None)
+
+    if not dry_run:
+        at = datetime.now(timezone.utc).isoformat()
+        if days:
+            await db.daily_metrics.bulk_write([
+                ReplaceOne({"_id": day}, {**values, "updated_at": at}, upsert=True) for day, values in days.items()
+            ], ordered=False)
+        await db.daily_metrics.delete_many({"_id": {"$nin": list(days)}})
+        await db.metrics_totals.replace_one({"_id": METRICS_TOTALS_ID}, {**totals, "updated_at": at}, upsert=True)
+        if last_logins:
+            await db.users.bulk_write([
+                UpdateOne({"id": row["_id"]}, {"$max": {"last_login_at": row["last"]}})
+                for row in last_logins if row["_id"] and row["last"]
+            ], ordered=False)
+    return {"days": len(days), "totals": totals, "users_with_logins": len(last_logins)}
 
-def delete_from_r2(object_key: str) -> bool:
-    """Delete file from R2"""
-    if not r2_client:
-        return False
-    
-    try:
-        r2_client.delete_object(Bucket=R2_BUCKET_NAME, Key=object_key)
-        logger.info(f"Deleted {object_key} from R2")
-        return True
-    except ClientError as e:
-        logger.error(f"Failed to delete from R2: {e}")
-        return False
 
 # ======================== HEALTH CHECK ========================
 
@@ -881,11 +2257,30 @@ async def health_check():
         "services": {
             "database": "connected",
             "smtp": smtp_status,
-            "r2_storage": "configured" if r2_client else "not_configured",
+            "r2_storage": "configured" if r2_storage else "not_configured",
             "payu": "configured" if PAYU_MERCHANT_KEY else "not_configured"
         }
     }
 
+# ======================== MEDIA ROUTES ========================
+
+@api_router.get("/media/{key:path}")
+async def get_media(key: str, if_none_match: Optional[str] = Header(None)):
+    """Serve a stored image. Keys are content-addressed, so clients may cache them forever"""
+    media = await db.media_objects.find_one({"key": key}, {"_id": 0})
+    if not media:
+        raise HTTPException(status_code=404, detail="Media not found")
+    
+    etag = f'"{media["etag"]}"'
+    headers = {"ETag": etag, "Cache-Control": MEDIA_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    
+    content = await load_media(media)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Media not found")
+    return Response(content=content, media_type=media["content_type"], headers=headers)
+
 # ======================== AUTH ROUTES ========================
 
 @api_router.post("/auth/register")
@@ -918,7 +2313,7 @@ async def register(data: UserRegisterWithReferral):
     user_doc = {
         "id": user_id,
         "email": data.email,
-        "password": hash_password(data.password),
+        "password": await hash_password_async(data.password),
         "first_name": data.first_name,
         "last_name": data.last_name,
         "role": "student",
@@ -952,7 +2347,7 @@ async def register(data: UserRegisterWithReferral):
     await db.users.insert_one(user_doc)
     
     # Send OTP via SMTP
-    send_otp_email(data.email, otp, data.first_name)
+    await send_otp_email(data.email, otp, data.first_name)
     logger.info(f"OTP for {data.email}: {otp}")
     
     return {"message": "Registration successful. Please verify your email with OTP.", "email": data.email}
@@ -995,7 +2390,7 @@ async def resend_otp(data: PasswordReset):
     )
     
     # Send OTP email
-    send_otp_email(data.email, otp, user.get("first_name", "User"))
+    await send_otp_email(data.email, otp, user.get("first_name", "User"))
     logger.info(f"New OTP for {data.email}: {otp}")
     
     return {"message": "OTP sent successfully"}
@@ -1006,9 +2401,15 @@ async def login(data: UserLogin):
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    if not verify_password(data.password, user.get("password")):
+    if not await verify_password_async(data.password, user.get("password")):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    # Upgrade hashes made with an outdated work factor while we have the plaintext
+    if password_needs_rehash(user["password"]):
+        user["password"] = await hash_password_async(data.password)
+        await db.users.update_one({"id": user["id"]}, {"$set": {"password": user["password"]}})
+        user_cache.invalidate(user["id"])
+    
     if not user.get("is_verified"):
         raise HTTPException(status_code=403, detail="Please verify your email first")
     
@@ -1026,6 +2427,7 @@ async def login(data: UserLogin):
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "ip_address": "unknown"
     })
+    await record_login(user["id"])
     
     user_response = {k: v for k, v in user.items() if k != "password"}
     
@@ -1069,7 +2471,7 @@ async def forgot_password(data: PasswordReset):
     
     # Send password reset email
     user_name = f"{user.get('first_name', '')} {user.get('last_name', '')}".strip() or "User"
-    send_password_reset_email(data.email, reset_token, user_name)
+    await send_password_reset_email(data.email, reset_token, user_name)
     logger.info(f"Password reset email sent to {data.email}")
     
     return {"message": "If email exists, reset link will be sent"}
@@ -1086,8 +2488,9 @@ async def reset_password(data: PasswordResetConfirm):
     
     await db.users.update_one(
         {"id": reset["user_id"]},
-        {"$set": {"password": hash_password(data.new_password)}}
+        {"$set": {"password": await hash_password_async(data.new_password)}}
     )
+    user_cache.invalidate(reset["user_id"])
     
     await db.password_resets.update_one(
         {"token": data.token},
@@ -1100,13 +2503,17 @@ async def reset_password(data: PasswordResetConfirm):
 async def get_me(current_user: dict = Depends(get_current_user)):
     user_data = {k: v for k, v in current_user.items() if k not in ["password", "profile_image"]}
     
-    # Generate profile image URL if exists (stored in MongoDB)
-    if current_user.get("profile_image") and current_user["profile_image"].get("data"):
-        content_type = current_user["profile_image"].get("content_type", "image/jpeg")
-        user_data["profile_image_url"] = f"data:{content_type};base64,{current_user['profile_image']['data']}"
+    # Uploaded images carry a media URL; older accounts may still embed base64,
+    # which is only loaded for users whose cached document has the marker
+    if not user_data.get("profile_image_url") and current_user.get("profile_image"):
+        legacy = await db.users.find_one({"id": current_user["id"], "profile_image.data": {"$exists": True}},
+                                         {"_id": 0, "profile_image": 1})
+        if legacy:
+            content_type = legacy["profile_image"].get("content_type", "image/jpeg")
+            user_data["profile_image_url"] = f"data:{content_type};base64,{legacy['profile_image']['data']}"
     # Fallback to R2 if using that storage
-    elif user_data.get("profile_image_key"):
-        signed_url = get_r2_signed_url(user_data["profile_image_key"], expiry_seconds=600)
+    if not user_data.get("profile_image_url") and user_data.get("profile_image_key") and r2_storage:
+        signed_url = r2_storage.sign(user_data["profile_image_key"], expires_in=600)
         if signed_url:
             user_data["profile_image_url"] = signed_url
     
@@ -1139,6 +2546,7 @@ async def update_profile(data: ProfileUpdate, current_user: dict = Depends(get_c
         {"id": current_user["id"]},
         {"$set": update_data}
     )
+    user_cache.invalidate(current_user["id"])
     
     return {"message": "Profile updated successfully"}
 
@@ -1155,33 +2563,34 @@ async def upload_profile_image(
     # Read file
     data = await file.read()
     
-    # Validate file size (max 2MB for MongoDB storage)
+    # Validate file size (max 2MB)
     if len(data) > 2 * 1024 * 1024:
         raise HTTPException(status_code=400, detail="File too large. Max 2MB allowed")
     
-    # Convert to Base64 for MongoDB storage
-    import base64
-    base64_data = base64.b64encode(data).decode('utf-8')
-    
-    # Update user profile with image stored in MongoDB
+    media = await store_image(data, file.content_type, "avatars")
     await db.users.update_one(
         {"id": current_user["id"]},
-        {"$set": {
-            "profile_image": {
-                "data": base64_data,
-                "content_type": file.content_type
+        {
+            "$set": {
+                "profile_image_key": media["key"],
+                "profile_image_url": media["url"],
+                "profile_image_variants": media["variants"],
+                "updated_at": datetime.now(timezone.utc).isoformat()
             },
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
+            "$unset": {"profile_image": ""}
+        }
     )
+    user_cache.invalidate(current_user["id"])
     
-    return {"message": "Profile image uploaded successfully"}
+    return {"message": "Profile image uploaded successfully", "image_url": media["url"]}
 
 @api_router.get("/user/profile-image")
 async def get_profile_image(current_user: dict = Depends(get_current_user)):
-    """Get profile image from MongoDB"""
-    user = await db.users.find_one({"id": current_user["id"]}, {"_id": 0})
+    """Get the current user's profile image URL"""
+    user = await db.users.find_one({"id": current_user["id"]}, {"_id": 0, "profile_image_url": 1, "profile_image": 1})
     
+    if user.get("profile_image_url"):
+        return {"image_url": user["profile_image_url"]}
     if not user.get("profile_image") or not user["profile_image"].get("data"):
         return {"image_url": None}
     
@@ -1194,8 +2603,10 @@ async def get_profile_image(current_user: dict = Depends(get_current_user)):
 async def get_profile_image_raw(user_id: str):
     """Get profile image as raw binary for public access"""
     import base64
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "profile_image_url": 1, "profile_image": 1})
     
+    if user and user.get("profile_image_url"):
+        return RedirectResponse(user["profile_image_url"], status_code=302)
     if not user or not user.get("profile_image") or not user["profile_image"].get("data"):
         raise HTTPException(status_code=404, detail="Image not found")
     
@@ -1207,16 +2618,425 @@ async def get_profile_image_raw(user_id: str):
 @api_router.post("/auth/change-password")
 async def change_password(old_password: str, new_password: str, current_user: dict = Depends(get_current_user)):
     user = await db.users.find_one({"id": current_user["id"]}, {"_id": 0})
-    if not verify_password(old_password, user.get("password")):
+    if not await verify_password_async(old_password, user.get("password")):
         raise HTTPException(status_code=400, detail="Invalid current password")
     
     await db.users.update_one(
         {"id": current_user["id"]},
-        {"$set": {"password": hash_password(new_password)}}
+        {"$set": {"password": await hash_password_async(new_password)}}
     )
+    user_cache.invalidate(current_user["id"])
     
     return {"message": "Password changed successfully"}
 
+# ======================== COURSE OUTLINE ========================
+
+# Large enough that a whole outline (100 modules x 100 lessons) arrives in one batch
+OUTLINE_BATCH_SIZE = 10000
+
+async def load_course_outline(course_id: str) -> List[dict]:
+    """Modules with their lessons, quiz and quiz questions, in four queries.
+
+    Mirrors the per-module lookups it replaces: modules and lessons by order,
+    at most 100 modules, 100 lessons per module and 100 questions per quiz,
+    and the first quiz found for each module.
+    """
+    modules = await db.modules.find({"course_id": course_id}, {"_id": 0}).sort("order", 1).to_list(100)
+    if not modules:
+        return modules
+    module_ids = [m["id"] for m in modules]
+    
+    lessons_by_module: Dict[str, List[dict]] = {}
+    lessons = await db.lessons.find(
+        {"module_id": {"$in": module_ids}}, {"_id": 0}
+    ).sort([("module_id", 1), ("order", 1)]).batch_size(OUTLINE_BATCH_SIZE).to_list(None)
+    for lesson in lessons:
+        lessons_by_module.setdefault(lesson["module_id"], []).append(lesson)
+    
+    quiz_by_module: Dict[str, dict] = {}
+    for quiz in await db.quizzes.find({"module_id": {"$in": module_ids}}, {"_id": 0}).batch_size(OUTLINE_BATCH_SIZE).to_list(None):
+        quiz_by_module.setdefault(quiz["module_id"], quiz)
+    
+    questions_by_quiz: Dict[str, List[dict]] = {}
+    if quiz_by_module:
+        quiz_ids = [q["id"] for q in quiz_by_module.values()]
+        questions = db.questions.find({"quiz_id": {"$in": quiz_ids}}, {"_id": 0}).batch_size(OUTLINE_BATCH_SIZE)
+        for question in await questions.to_list(None):
+            questions_by_quiz.setdefault(question["quiz_id"], []).append(question)
+    
+    for module in modules:
+        module["lessons"] = lessons_by_module.get(module["id"], [])[:100]
+        quiz = quiz_by_module.get(module["id"])
+        if quiz:
+            quiz["questions"] = questions_by_quiz.get(quiz["id"], [])[:100]
+            module["quiz"] = quiz
+    return modules
+
+
+def sanitize_outline(modules: List[dict]) -> List[dict]:
+    """Strip what non-enrolled users must not see: video keys and correct answers"""
+    for module in modules:
+        for lesson in module["lessons"]:
+            if lesson.get("video_key"):
+                lesson["has_video"] = True
+                del lesson["video_key"]
+        if module.get("quiz"):
+            for question in module["quiz"]["questions"]:
+                question.pop("correct_answer", None)
+    return modules
+
+
+async def attach_learner_state(modules: List[dict], user_id: str) -> List[dict]:
+    """Add each lesson's progress and each quiz's attempt for one learner, in two queries"""
+    lesson_ids = [lesson["id"] for module in modules for lesson in module["lessons"]]
+    quiz_ids = [module["quiz"]["id"] for module in modules if module.get("quiz")]
+    
+    progress_by_lesson: Dict[str, dict] = {}
+    if lesson_ids:
+        async for progress in db.lesson_progress.find(
+            {"lesson_id": {"$in": lesson_ids}, "user_id": user_id}, {"_id": 0}
+        ).batch_size(OUTLINE_BATCH_SIZE):
+            progress_by_lesson.setdefault(progress["lesson_id"], progress)
+    attempt_by_quiz: Dict[str, dict] = {}
+    if quiz_ids:
+        async for attempt in db.quiz_attempts.find(
+            {"quiz_id": {"$in": quiz_ids}, "user_id": user_id}, {"_id": 0}
+        ).batch_size(OUTLINE_BATCH_SIZE):
+            attempt_by_quiz.setdefault(attempt["quiz_id"], attempt)
+    
+    for module in modules:
+        for lesson in module["lessons"]:
+            lesson["progress"] = progress_buffer.overlay(user_id, lesson["id"], progress_by_lesson.get(lesson["id"]))
+        if module.get("quiz"):
+            module["quiz"]["attempt"] = attempt_by_quiz.get(module["quiz"]["id"])
+    return modules
+
+
+# ======================== COURSE OUTLINE CACHE ========================
+
+# Sanitized public outlines are cached per (course_id, content_version). Admin
+# edits bump the version stored on the course, so every worker stops serving
+# the old outline as soon as it re-reads the course document.
+OUTLINE_CACHE_SIZE = int(os.environ.get('OUTLINE_CACHE_SIZE', 256))
+
+
+class OutlineCache:
+    """In-process LRU of compiled outlines with single-flight builds.
+
+    Cached outlines are shared between requests and must be treated as read-only.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, List[dict]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._building: Dict[tuple, asyncio.Future] = {}
+
+    async def get(self, course_id: str, version: int, build) -> List[dict]:
+        key = (course_id, version)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        
+        self.misses += 1
+        pending = self._building.get(key)
+        if pending is None:
+            # Concurrent misses for the same key await this one build
+            pending = asyncio.ensure_future(build())
+            self._building[key] = pending
+            pending.add_done_callback(lambda future: self._store(key, future))
+        # shield: a cancelled request must not cancel the build other requests wait on
+        return await asyncio.shield(pending)
+
+    def _store(self, key: tuple, future: asyncio.Future):
+        self._building.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        course_id, version = key
+        if self._versions.get(course_id, -1) > version:
+            return
+        previous = self._versions.get(course_id)
+        if previous is not None and previous != version:
+            self._entries.pop((course_id, previous), None)
+        self._versions[course_id] = version
+        self._entries[key] = future.result()
+        while len(self._entries) > self.max_entries:
+            (evicted_course, _), _ = self._entries.popitem(last=False)
+            self._versions.pop(evicted_course, None)
+
+    def invalidate(self, course_id: str):
+        version = self._versions.pop(course_id, None)
+        if version is not None:
+            self._entries.pop((course_id, version), None)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+outline_cache = OutlineCache(OUTLINE_CACHE_SIZE)
+
+
+async def resolve_course_id(
+    module_id: Optional[str] = None,
+    lesson_id: Optional[str] = None,
+    quiz_id: Optional[str] = None,
+    question_id: Optional[str] = None
+) -> Optional[str]:
+    """Walk question -> quiz -> module -> course to find the course an item belongs to"""
+    if question_id:
+        question = await db.questions.find_one({"id": question_id}, {"_id": 0, "quiz_id": 1})
+        quiz_id = question["quiz_id"] if question else None
+    if quiz_id:
+        quiz = await db.quizzes.find_one({"id": quiz_id}, {"_id": 0, "module_id": 1})
+        module_id = quiz["module_id"] if quiz else None
+    if lesson_id:
+        lesson = await db.lessons.find_one({"id": lesson_id}, {"_id": 0, "module_id": 1})
+        module_id = lesson["module_id"] if lesson else None
+    if module_id:
+        module = await db.modules.find_one({"id": module_id}, {"_id": 0, "course_id": 1})
+        return module["course_id"] if module else None
+    return None
+
+
+async def bump_course_content_version(course_id: Optional[str], changes: Optional[dict] = None):
+    """Mark a course's outline as changed after an admin edit.
+
+    changes are extra update operators (e.g. the lesson_count / module_ids
+    bookkeeping) applied in the same write.
+    """
+    if not course_id:
+        return
+    update = {"$inc": {"content_version": 1}}
+    for operator, fields in (changes or {}).items():
+        update.setdefault(operator, {}).update(fields)
+    await db.courses.update_one({"id": course_id}, update)
+    outline_cache.invalidate(course_id)
+
+
+async def build_public_outline(course_id: str) -> List[dict]:
+    return sanitize_outline(await load_course_outline(course_id))
+
+
+# ======================== COURSE STRUCTURE INDEX ========================
+
+# Courses carry lesson_count and module_ids, maintained by the admin module and
+# lesson routes. Lessons and modules never move to another parent, so the
+# lesson -> module -> course chain is cached per worker and only needs
+# forgetting when content is deleted. A delete only reaches the worker that
+# handled it, so paths that persist progress pass confirm=True: the lessons are
+# re-read in the same single query that fills misses, and any that are gone
+# are forgotten here too.
+LESSON_INDEX_SIZE = int(os.environ.get('LESSON_INDEX_SIZE', 200000))
+
+
+class LessonIndex:
+    """In-process lesson_id -> (module_id, course_id) map, filled on demand"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lessons: "OrderedDict[str, str]" = OrderedDict()
+        self._modules: Dict[str, str] = {}
+
+    def _remember_lesson(self, lesson_id: str, module_id: str):
+        self._lessons[lesson_id] = module_id
+        while len(self._lessons) > self.max_entries:
+            self._lessons.popitem(last=False)
+
+    async def module_course(self, module_id: str) -> Optional[str]:
+        course_id = self._modules.get(module_id)
+        if course_id is None:
+            module = await db.modules.find_one({"id": module_id}, {"_id": 0, "course_id": 1})
+            if not module:
+                return None
+            course_id = self._modules[module_id] = module["course_id"]
+        return course_id
+
+    async def resolve_many(self, lesson_ids: List[str], confirm: bool = False) -> Dict[str, tuple]:
+        """(module_id, course_id) for each known lesson; unknown lessons are left out.
+
+        With confirm, cached lessons are checked against the database as well.
+        """
+        missing = [lesson_id for lesson_id in lesson_ids if lesson_id not in self._lessons]
+        self.hits += len(lesson_ids) - len(missing)
+        self.misses += len(missing)
+        lookup = list(lesson_ids) if confirm else missing
+        if lookup:
+            found = set()
+            async for lesson in db.lessons.find({"id": {"$in": lookup}}, {"_id": 0, "id": 1, "module_id": 1}):
+                self._remember_lesson(lesson["id"], lesson["module_id"])
+                found.add(lesson["id"])
+            for lesson_id in set(lookup) - found:
+                self.forget_lesson(lesson_id)
+        unknown_modules = {
+            self._lessons[lesson_id] for lesson_id in lesson_ids
+            if lesson_id in self._lessons and self._lessons[lesson_id] not in self._modules
+        }
+        if unknown_modules:
+            async for module in db.modules.find({"id": {"$in": list(unknown_modules)}}, {"_id": 0, "id": 1, "course_id": 1}):
+                self._modules[module["id"]] = module["course_id"]
+        
+        located = {}
+        for lesson_id in lesson_ids:
+            module_id = self._lessons.get(lesson_id)
+            if module_id is not None and module_id in self._modules:
+                self._lessons.move_to_end(lesson_id)
+                located[lesson_id] = (module_id, self._modules[module_id])
+        return located
+
+    async def resolve(self, lesson_id: str, confirm: bool = False) -> Optional[tuple]:
+        return (await self.resolve_many([lesson_id], confirm)).get(lesson_id)
+
+    def forget_lesson(self, lesson_id: str):
+        self._lessons.pop(lesson_id, None)
+
+    def forget_module(self, module_id: str):
+        self._modules.pop(module_id, None)
+        for lesson_id in [l for l, m in self._lessons.items() if m == module_id]:
+            del self._lessons[lesson_id]
+
+    def forget_course(self, course_id: str):
+        for module_id in [m for m, c in self._modules.items() if c == course_id]:
+            self.forget_module(module_id)
+
+    def stats(self) -> dict:
+        return {"lessons": len(self._lessons), "modules": len(self._modules), "hits": self.hits, "misses": self.misses}
+
+
+lesson_index = LessonIndex(LESSON_INDEX_SIZE)
+
+
+# ======================== CHANGE SEQUENCE ========================
+
+# Course content, lesson progress and quiz attempts carry updated_seq, taken from
+# one global counter, so a client holding a cursor can ask for exactly what
+# changed since. Deleted content leaves a row in change_tombstones.
+#
+# A value is reserved before the write that carries it lands, so the counter
+# alone can run ahead of what readers can see. Each reservation therefore
+# leaves a lease on the counter document until the writer releases it, and
+# change_cursor() never passes the oldest live lease. A writer that dies
+# without releasing holds the cursor back for CHANGE_SEQ_LEASE_SECONDS at most;
+# rows may then be sent twice, and clients apply them by id.
+CHANGE_SEQ_LEASE_SECONDS = int(os.environ.get('CHANGE_SEQ_LEASE_SECONDS', 30))
+
+
+def _live_change_leases() -> dict:
+    return {"$filter": {
+        "input": {"$ifNull": ["$leases", []]},
+        "cond": {"$gt": ["$$this.at", {"$subtract": ["$$NOW", CHANGE_SEQ_LEASE_SECONDS * 1000]}]},
+    }}
+
+
+async def next_change_seq(count: int = 1) -> int:
+    """Reserve count consecutive sequence values and return the last one.
+
+    Call release_change_seq(last) once the write carrying them has landed.
+    """
+    old_seq = {"$ifNull": ["$seq", 0]}
+    counter = await db.counters.find_one_and_update(
+        {"_id": "change_seq"},
+        [{"$set": {
+            "seq": {"$add": [old_seq, count]},
+            "leases": {"$concatArrays": [_live_change_leases(), [{
+                "first": {"$add": [old_seq, 1]}, "last": {"$add": [old_seq, count]}, "at": "$$NOW"
+            }]]},
+        }}],
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
+
+async def release_change_seq(last: int):
+    await db.counters.update_one({"_id": "change_seq"}, {"$pull": {"leases": {"last": last}}})
+
+
+async def change_cursor() -> int:
+    """The highest seq below every reservation still in flight; all rows up to it are visible"""
+    rows = await db.counters.aggregate([
+        {"$match": {"_id": "change_seq"}},
+        {"$project": {"seq": 1, "pending": {"$min": {"$map": {"input": _live_change_leases(), "in": "$$this.first"}}}}},
+    ]).to_list(1)
+    if not rows:
+        return 0
+    pending = rows[0].get("pending")
+    return pending - 1 if pending is not None else rows[0]["seq"]
+
+
+async def record_deletions(course_id: Optional[str], deleted: Dict[str, List[str]]):
+    """Tombstone deleted content, e.g. {"lesson": [ids], "question": [ids]}"""
+    items = [(kind, item_id) for kind, ids in deleted.items() for item_id in ids]
+    if not course_id or not items:
+        return
+    last = await next_change_seq(len(items))
+    at = datetime.now(timezone.utc).isoformat()
+    await db.change_tombstones.insert_many([
+        {"course_id": course_id, "kind": kind, "item_id": item_id, "updated_seq": last - len(items) + 1 + n, "deleted_at": at}
+        for n, (kind, item_id) in enumerate(items)
+    ])
+    await release_change_seq(last)
+
+
+# ======================== LEARNER PROGRESS ========================
+
+# Per-course progress for one learner in two aggregations, whatever the number
+# of courses: completed lessons grouped by course, and enrollments joined with
+# their course's cached lesson_count and the learner's certificate. Lookups use
+# localField with a sub-pipeline (MongoDB 5.0+) so only the projected fields
+# are joined.
+
+async def learner_course_progress(user_id: str) -> List[dict]:
+    """One row per enrollment whose course still exists, in enrollment order"""
+    completed_pipeline = [
+        {"$match": {"user_id": user_id, "is_completed": True}},
+        {"$group": {"_id": "$lesson_id"}},
+        {"$lookup": {"from": "lessons", "localField": "_id", "foreignField": "id", "as": "lesson",
+                     "pipeline": [{"$project": {"_id": 0, "module_id": 1}}]}},
+        {"$unwind": "$lesson"},
+        {"$lookup": {"from": "modules", "localField": "lesson.module_id", "foreignField": "id", "as": "module",
+                     "pipeline": [{"$project": {"_id": 0, "course_id": 1}}]}},
+        {"$unwind": "$module"},
+        {"$group": {"_id": "$module.course_id", "completed": {"$sum": 1}}},
+    ]
+    enrollment_pipeline = [
+        {"$match": {"user_id": user_id}},
+        {"$lookup": {"from": "courses", "localField": "course_id", "foreignField": "id", "as": "course",
+                     "pipeline": [{"$project": {"_id": 0, "title": 1, "lesson_count": 1}}]}},
+        {"$unwind": "$course"},
+        {"$lookup": {"from": "certificates", "let": {"user_id": "$user_id", "course_id": "$course_id"}, "as": "certificate",
+                     "pipeline": [
+                         {"$match": {"$expr": {"$and": [
+                             {"$eq": ["$user_id", "$$user_id"]}, {"$eq": ["$course_id", "$$course_id"]}
+                         ]}}},
+                         {"$project": {"_id": 0, "certificate_id": 1}},
+                         {"$limit": 1},
+                     ]}},
+        {"$project": {
+            "_id": 0, "course_id": 1, "enrolled_at": 1, "completed_at": 1, "is_completed": 1,
+            "course_title": "$course.title", "total_lessons": {"$ifNull": ["$course.lesson_count", 0]},
+            "certificate_id": {"$first": "$certificate.certificate_id"},
+        }},
+    ]
+    completed_rows, enrollments = await asyncio.gather(
+        db.lesson_progress.aggregate(completed_pipeline).to_list(None),
+        db.enrollments.aggregate(enrollment_pipeline).to_list(None),
+    )
+    completed_by_course = {row["_id"]: row["completed"] for row in completed_rows}
+    
+    for row in enrollments:
+        total_lessons = row["total_lessons"]
+        completed_lessons = min(completed_by_course.get(row["course_id"], 0), total_lessons)
+        row["completed_lessons"] = completed_lessons
+        row["progress_percentage"] = round(completed_lessons / total_lessons * 100, 1) if total_lessons > 0 else 0
+        row["is_completed"] = bool(row.get("is_completed"))
+    return enrollments
+
+
 # ======================== COURSE ROUTES ========================
 
 @api_router.get("/courses")
@@ -1227,8 +3047,10 @@ async def get_courses(
     sort_by: str = "created_at",
     sort_order: str = "desc",
     page: int = 1,
-    limit: int = 12
+    limit: int = 12,
+    cursor: Optional[str] = None
 ):
+    """Published courses; pass next_cursor back as cursor to page without skip"""
     query = {"is_published": True}
     
     if category:
@@ -1243,28 +3065,23 @@ async def get_courses(
     
     sort_direction = -1 if sort_order == "desc" else 1
     
-    total = await db.courses.count_documents(query)
-    courses = await db.courses.find(query, {"_id": 0}).sort(sort_by, sort_direction).skip((page - 1) * limit).limit(limit).to_list(limit)
-    
-    # Get ratings for each course - only from visible reviews
+    courses, next_cursor = await paginate(
+        db.courses, query, {"_id": 0, "thumbnail_data": 0, "content_version": 0, "module_ids": 0},
+        sort_field=sort_by, direction=sort_direction, limit=limit, cursor=cursor, skip=(page - 1) * limit
+    )
     for course in courses:
-        reviews = await db.reviews.find({"course_id": course["id"], "is_visible": True}, {"_id": 0}).to_list(1000)
-        if reviews:
-            course["average_rating"] = sum(r["rating"] for r in reviews) / len(reviews)
-            course["review_count"] = len(reviews)
-        else:
-            course["average_rating"] = 0
-            course["review_count"] = 0
-        
-        # Get enrollment count
-        enrollments = await db.enrollments.count_documents({"course_id": course["id"]})
-        course["enrollment_count"] = enrollments
+        apply_course_stats(course)
+        use_image_variant(course, "thumbnail_url", "thumbnail_variants", 256)
     
+    if cursor:
+        return {"courses": courses, "next_cursor": next_cursor}
+    total = await db.courses.count_documents(query)
     return {
         "courses": courses,
         "total": total,
         "page": page,
-        "pages": (total + limit - 1) // limit
+        "pages": (total + limit - 1) // limit,
+        "next_cursor": next_cursor
     }
 
 @api_router.get("/courses/categories")
@@ -1388,57 +3205,37 @@ async def admin_delete_category(
 
 @api_router.get("/courses/{course_id}")
 async def get_course(course_id: str):
-    course = await db.courses.find_one({"id": course_id}, {"_id": 0})
+    course = await db.courses.find_one({"id": course_id}, {"_id": 0, "thumbnail_data": 0, "module_ids": 0})
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     
-    # Get modules with lessons
-    modules = await db.modules.find({"course_id": course_id}, {"_id": 0}).sort("order", 1).to_list(100)
-    for module in modules:
-        lessons = await db.lessons.find({"module_id": module["id"]}, {"_id": 0}).sort("order", 1).to_list(100)
-        # Don't expose video keys to non-enrolled users
-        for lesson in lessons:
-            if lesson.get("video_key"):
-                lesson["has_video"] = True
-                del lesson["video_key"]
-        module["lessons"] = lessons
-        
-        # Get quiz if exists
-        quiz = await db.quizzes.find_one({"module_id": module["id"]}, {"_id": 0})
-        if quiz:
-            questions = await db.questions.find({"quiz_id": quiz["id"]}, {"_id": 0}).to_list(100)
-            # Don't expose correct answers
-            for q in questions:
-                del q["correct_answer"]
-            quiz["questions"] = questions
-            module["quiz"] = quiz
-    
-    course["modules"] = modules
+    # Get modules with lessons. Video keys and correct answers are hidden from non-enrolled users
+    content_version = course.pop("content_version", 0)
+    course["modules"] = await outline_cache.get(course_id, content_version, lambda: build_public_outline(course_id))
     
     # Get reviews - only visible ones for public view
     reviews = await db.reviews.find(
         {"course_id": course_id, "is_visible": True}, 
         {"_id": 0}
     ).sort("created_at", -1).limit(10).to_list(10)
+    reviewer_ids = list({review["user_id"] for review in reviews})
+    reviewers = {}
+    if reviewer_ids:
+        async for user in db.users.find(
+            {"id": {"$in": reviewer_ids}},
+            {"_id": 0, "id": 1, "first_name": 1, "last_name": 1, "avatar_url": 1}
+        ):
+            reviewers[user.pop("id")] = user
     for review in reviews:
-        user = await db.users.find_one({"id": review["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "avatar_url": 1})
-        review["user"] = user
+        review["user"] = reviewers.get(review["user_id"])
     
     course["reviews"] = reviews
     
     # Get stats - only from visible reviews
-    all_visible_reviews = await db.reviews.find({"course_id": course_id, "is_visible": True}, {"_id": 0}).to_list(1000)
-    if all_visible_reviews:
-        course["average_rating"] = sum(r["rating"] for r in all_visible_reviews) / len(all_visible_reviews)
-        course["review_count"] = len(all_visible_reviews)
-    else:
-        course["average_rating"] = 0
-        course["review_count"] = 0
-    
-    course["enrollment_count"] = await db.enrollments.count_documents({"course_id": course_id})
+    apply_course_stats(course)
     
     # Get instructor info
-    instructor = await db.users.find_one({"id": course.get("instructor_id", "")}, {"_id": 0, "password": 0})
+    instructor = await db.users.find_one({"id": course.get("instructor_id", "")}, {"_id": 0, "password": 0, "profile_image": 0})
     course["instructor"] = instructor
     
     return course
@@ -1452,43 +3249,82 @@ async def get_enrolled_course(course_id: str, current_user: dict = Depends(get_c
     if not enrollment:
         raise HTTPException(status_code=403, detail="Not enrolled in this course")
     
-    course = await db.courses.find_one({"id": course_id}, {"_id": 0})
+    course = await db.courses.find_one({"id": course_id}, {"_id": 0, "thumbnail_data": 0, "module_ids": 0})
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     
-    # Get modules with full lesson data
-    modules = await db.modules.find({"course_id": course_id}, {"_id": 0}).sort("order", 1).to_list(100)
-    for module in modules:
-        lessons = await db.lessons.find({"module_id": module["id"]}, {"_id": 0}).sort("order", 1).to_list(100)
-        
-        for lesson in lessons:
-            # Get progress
-            progress = await db.lesson_progress.find_one(
-                {"lesson_id": lesson["id"], "user_id": current_user["id"]},
-                {"_id": 0}
-            )
-            lesson["progress"] = progress
-        
-        module["lessons"] = lessons
-        
-        # Get quiz with answers for grading
-        quiz = await db.quizzes.find_one({"module_id": module["id"]}, {"_id": 0})
-        if quiz:
-            questions = await db.questions.find({"quiz_id": quiz["id"]}, {"_id": 0}).to_list(100)
-            quiz["questions"] = questions
-            
-            # Get quiz attempt
-            attempt = await db.quiz_attempts.find_one(
-                {"quiz_id": quiz["id"], "user_id": current_user["id"]},
-                {"_id": 0}
-            )
-            quiz["attempt"] = attempt
-            module["quiz"] = quiz
+    # Read the cursor before loading so anything written meanwhile is resent by the next delta sync
+    sync_cursor = await change_cursor()
+    
+    # Get modules with full lesson data, the learner's progress and quiz attempts
+    course.pop("content_version", None)
+    modules = await load_course_outline(course_id)
+    course["modules"] = await attach_learner_state(modules, current_user["id"])
+    course["enrollment"] = enrollment
+    course["sync_cursor"] = sync_cursor
+    
+    return course
+
+@api_router.get("/courses/{course_id}/enrolled/changes")
+async def get_enrolled_course_changes(
+    course_id: str,
+    since: int = Query(0, ge=0),
+    current_user: dict = Depends(get_current_user)
+):
+    """Course content, progress and quiz attempts changed after the since cursor.
+
+    Pass the returned cursor as since on the next call; since=0 returns everything.
+    Progress still sitting in the write-behind buffer arrives once it is flushed.
+    """
+    enrollment = await db.enrollments.find_one(
+        {"course_id": course_id, "user_id": current_user["id"]},
+        {"_id": 0}
+    )
+    if not enrollment:
+        raise HTTPException(status_code=403, detail="Not enrolled in this course")
+    course = await db.courses.find_one({"id": course_id}, {"_id": 0, "module_ids": 1})
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
     
-    course["modules"] = modules
-    course["enrollment"] = enrollment
+    cursor = await change_cursor()
+    # since=0 is a full sync and must not depend on every row carrying updated_seq
+    changed = {"updated_seq": {"$gt": since}} if since else {}
+    module_ids = course.get("module_ids") or []
+    
+    modules = await db.modules.find({"course_id": course_id, **changed}, {"_id": 0}).to_list(None)
+    lessons = await db.lessons.find({"module_id": {"$in": module_ids}, **changed}, {"_id": 0}).to_list(None)
+    quizzes = await db.quizzes.find({"module_id": {"$in": module_ids}}, {"_id": 0}).to_list(None)
+    quiz_ids = [quiz["id"] for quiz in quizzes]
+    questions = await db.questions.find({"quiz_id": {"$in": quiz_ids}, **changed}, {"_id": 0}).to_list(None)
+    
+    progress = []
+    lesson_ids = await db.lessons.distinct("id", {"module_id": {"$in": module_ids}}) if module_ids else []
+    if lesson_ids:
+        progress = await db.lesson_progress.find(
+            {"user_id": current_user["id"], "lesson_id": {"$in": lesson_ids}, **changed}, {"_id": 0}
+        ).to_list(None)
+    attempts = []
+    if quiz_ids:
+        attempts = await db.quiz_attempts.find(
+            {"user_id": current_user["id"], "quiz_id": {"$in": quiz_ids}, **changed}, {"_id": 0}
+        ).to_list(None)
+    
+    deleted: Dict[str, List[str]] = {}
+    if since:
+        async for tombstone in db.change_tombstones.find({"course_id": course_id, **changed}, {"_id": 0}):
+            deleted.setdefault(tombstone["kind"], []).append(tombstone["item_id"])
     
-    return course
+    return {
+        "cursor": cursor,
+        "enrollment": enrollment,
+        "modules": modules,
+        "lessons": lessons,
+        "quizzes": [quiz for quiz in quizzes if not since or quiz.get("updated_seq", 0) > since],
+        "questions": questions,
+        "progress": progress,
+        "attempts": attempts,
+        "deleted": deleted
+    }
 
 # ======================== ENROLLED COURSES ROUTE ========================
 
@@ -1500,20 +3336,19 @@ async def get_enrolled_courses(current_user: dict = Depends(get_current_user)):
         {"_id": 0}
     ).to_list(100)
     
+    enrolled = await db.courses.find(
+        {"id": {"$in": [e["course_id"] for e in enrollments]}},
+        {"_id": 0, "thumbnail_data": 0, "content_version": 0}
+    ).to_list(100)
+    courses_by_id = {course["id"]: course for course in enrolled}
+    
     courses = []
     for enrollment in enrollments:
-        course = await db.courses.find_one({"id": enrollment["course_id"]}, {"_id": 0})
+        course = courses_by_id.get(enrollment["course_id"])
         if course:
             course["enrollment"] = enrollment
-            
-            # Get module/lesson counts
-            modules = await db.modules.find({"course_id": course["id"]}, {"_id": 0}).to_list(100)
-            total_lessons = 0
-            for module in modules:
-                lesson_count = await db.lessons.count_documents({"module_id": module["id"]})
-                total_lessons += lesson_count
-            course["total_modules"] = len(modules)
-            course["total_lessons"] = total_lessons
+            course["total_modules"] = len(course.pop("module_ids", None) or [])
+            course["total_lessons"] = course.get("lesson_count", 0)
             courses.append(course)
     
     return {"courses": courses}
@@ -1523,11 +3358,12 @@ async def get_enrolled_courses(current_user: dict = Depends(get_current_user)):
 @api_router.get("/cart")
 async def get_cart(current_user: dict = Depends(get_current_user)):
     cart_items = await db.cart.find({"user_id": current_user["id"]}, {"_id": 0}).to_list(100)
+    await BatchLoader().attach(cart_items, ("course_id", "course", "course_card"))
     
     items = []
     total = 0
     for item in cart_items:
-        course = await db.courses.find_one({"id": item["course_id"]}, {"_id": 0})
+        course = item["course"]
         if course:
             price = course.get("discount_price") or course.get("price", 0)
             items.append({
@@ -1575,10 +3411,11 @@ async def remove_from_cart(item_id: str, current_user: dict = Depends(get_curren
 @api_router.get("/wishlist")
 async def get_wishlist(current_user: dict = Depends(get_current_user)):
     wishlist_items = await db.wishlist.find({"user_id": current_user["id"]}, {"_id": 0}).to_list(100)
+    await BatchLoader().attach(wishlist_items, ("course_id", "course", "course_card"))
     
     items = []
     for item in wishlist_items:
-        course = await db.courses.find_one({"id": item["course_id"]}, {"_id": 0})
+        course = item["course"]
         if course:
             items.append({
                 "id": item["id"],
@@ -1624,7 +3461,7 @@ async def initiate_payment(
         raise HTTPException(status_code=400, detail="Cart is empty")
     
     course_ids = [item["course_id"] for item in cart_items]
-    courses = await db.courses.find({"id": {"$in": course_ids}}, {"_id": 0}).to_list(100)
+    courses = await db.courses.find({"id": {"$in": course_ids}}, {"_id": 0, "thumbnail_data": 0}).to_list(100)
     
     total = sum(c.get("discount_price") or c.get("price", 0) for c in courses)
     discount = 0
@@ -1715,8 +3552,8 @@ async def payment_success(
     
     if status == "success":
         # Update order
-        await db.orders.update_one(
-            {"txn_id": txnid},
+        completed = await db.orders.update_one(
+            {"txn_id": txnid, "status": {"$ne": "completed"}},
             {"$set": {
                 "status": "completed",
                 "payment_id": mihpayid,
@@ -1724,7 +3561,12 @@ async def payment_success(
                 "completed_at": datetime.now(timezone.utc).isoformat()
             }}
         )
-        
+        # A replayed callback finds the order already completed: everything
+        # below (enrollments, commissions, coupon use, email) already happened
+        if not completed.modified_count:
+            return {"message": "Payment successful", "order_id": order["id"]}
+        await record_metrics(orders=1, revenue=order.get("total", 0))
+
         # Create enrollments
         for course_id in order["course_ids"]:
             enrollment = {
@@ -1738,6 +3580,7 @@ async def payment_success(
                 "enrolled_at": datetime.now(timezone.utc).isoformat()
             }
             await db.enrollments.insert_one(enrollment)
+            await adjust_course_enrollments(course_id, 1)
         
         # Clear cart
         await db.cart.delete_many({"user_id": order["user_id"]})
@@ -1747,10 +3590,11 @@ async def payment_success(
         if user and user.get("referred_by"):
             # referred_by stores the referrer's user ID (permanent relationship)
             referrer = await db.users.find_one({"id": user["referred_by"]}, {"_id": 0})
+            commissions_paid = 0
             if referrer:
                 # Get course details for each course in order
                 for course_id in order["course_ids"]:
-                    course = await db.courses.find_one({"id": course_id}, {"_id": 0})
+                    course = await db.courses.find_one({"id": course_id}, {"_id": 0, "thumbnail_data": 0})
                     if course:
                         course_price = course.get("discount_price") or course.get("price", 0)
                         commission_amount = course_price * 0.20  # 20% lifetime commission
@@ -1780,8 +3624,11 @@ async def payment_success(
                                 }
                             }
                         )
+                        user_cache.invalidate(referrer["id"])
+                        commissions_paid += commission_amount
                         
                         logger.info(f"Referral commission: ₹{commission_amount:.2f} to {referrer['email']} for course {course['title']}")
+            await record_metrics(commissions=commissions_paid)
         
         # Record coupon use
         if order.get("coupon_code"):
@@ -1797,9 +3644,9 @@ async def payment_success(
         
         # Send order confirmation email
         user = await db.users.find_one({"id": order["user_id"]}, {"_id": 0})
-        courses = await db.courses.find({"id": {"$in": order["course_ids"]}}, {"_id": 0}).to_list(100)
+        courses = await db.courses.find({"id": {"$in": order["course_ids"]}}, {"_id": 0, "thumbnail_data": 0}).to_list(100)
         if user:
-            send_order_success_email(
+            await send_order_success_email(
                 user["email"],
                 user.get("first_name", "User"),
                 order,
@@ -1834,28 +3681,487 @@ async def payment_webhook(payload: dict):
     return {"status": "ok"}
 
 @api_router.get("/orders")
-async def get_orders(current_user: dict = Depends(get_current_user)):
-    orders = await db.orders.find(
-        {"user_id": current_user["id"]},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
+async def get_orders(cursor: Optional[str] = None, limit: int = 100, current_user: dict = Depends(get_current_user)):
+    orders, next_cursor = await paginate(db.orders, {"user_id": current_user["id"]}, {"_id": 0}, limit=limit, cursor=cursor)
     
+    courses = await BatchLoader().load_many("course_card", (c for o in orders for c in o["course_ids"]))
     for order in orders:
-        courses = await db.courses.find(
-            {"id": {"$in": order["course_ids"]}},
-            {"_id": 0}
-        ).to_list(100)
-        order["courses"] = courses
+        order["courses"] = [courses[c] for c in order["course_ids"] if c in courses]
+    
+    return {"orders": orders, "next_cursor": next_cursor}
+
+# ======================== POINTS & LEADERBOARD ========================
+
+# Every award goes through award_points: one $inc on the user, one row in the
+# points_events log, and one $inc per period total in points_periods (weekly
+# and monthly boards read those, sorted by an index). The all-time top N is
+# kept in memory, patched on each award and reloaded periodically so awards
+# made by other workers, renames and role changes show up.
+#
+# Ranks use competition ranking: a learner's rank is one more than the number
+# of learners with strictly more points, so tied learners share a rank on both
+# /leaderboard and /leaderboard/me. The count comes from points_rank_buckets, a
+# histogram of learners per points range kept at every power-of-two width (a
+# Fenwick-style tree in documents). Moving a learner touches one bucket per
+# level whose range actually changed, and the number ahead of any score is the
+# sum of at most POINTS_RANK_LEVELS buckets, independent of how many learners
+# there are. Learners with no points are not counted; nobody can be behind them.
+LEADERBOARD_SIZE = int(os.environ.get('LEADERBOARD_SIZE', 50))
+LEADERBOARD_REFRESH_SECONDS = float(os.environ.get('LEADERBOARD_REFRESH_SECONDS', 60))
+LEADERBOARD_PERIODS = ("all", "week", "month")
+# Scores at or above 2**POINTS_RANK_LEVELS - 1 share the top bucket
+POINTS_RANK_LEVELS = 48
+
+
+def points_period_keys(at: datetime) -> Dict[str, str]:
+    year, week, _ = at.isocalendar()
+    return {"week": f"week:{year}-W{week:02d}", "month": f"month:{at:%Y-%m}"}
+
+
+def _rank_position(points) -> int:
+    return min(int(points or 0), (1 << POINTS_RANK_LEVELS) - 1)
+
+
+def rank_bucket_changes(board: str, old_points, new_points) -> List[Tuple[str, int]]:
+    """(bucket id, count delta) for a learner whose score on `board` went from old to new points"""
+    old = _rank_position(old_points) if (old_points or 0) > 0 else 0
+    new = _rank_position(new_points) if (new_points or 0) > 0 else 0
+    changes = []
+    for level in range(POINTS_RANK_LEVELS):
+        old_bucket, new_bucket = old >> level, new >> level
+        if old_bucket == new_bucket:
+            # Both scores share this range, and so every wider one
+            break
+        # Bucket 0 starts at zero points and is never above anyone, so it is not kept
+        if old_bucket:
+            changes.append((f"{board}:{level}:{old_bucket}", -1))
+        if new_bucket:
+            changes.append((f"{board}:{level}:{new_bucket}", 1))
+    return changes
+
+
+def rank_bucket_moves(board: str, old_points, new_points) -> List[UpdateOne]:
+    return [
+        UpdateOne({"_id": bucket}, {"$inc": {"count": delta}}, upsert=delta > 0)
+        for bucket, delta in rank_bucket_changes(board, old_points, new_points)
+    ]
+
+
+def rank_buckets_above(board: str, points) -> List[str]:
+    """Ids of the disjoint buckets that together cover every score above `points`"""
+    position = _rank_position(points) + 1 if (points or 0) > 0 else 1
+    buckets = []
+    while position < 1 << POINTS_RANK_LEVELS:
+        level = (position & -position).bit_length() - 1
+        buckets.append(f"{board}:{level}:{position >> level}")
+        position += 1 << level
+    return buckets
+
+
+async def apply_rank_moves(moves: List[UpdateOne]) -> None:
+    if moves:
+        await db.points_rank_buckets.bulk_write(moves, ordered=False)
+
+
+async def points_rank(board: str, points) -> int:
+    """1 + the number of learners on `board` with more points, from at most POINTS_RANK_LEVELS buckets"""
+    buckets = await db.points_rank_buckets.find(
+        {"_id": {"$in": rank_buckets_above(board, points)}}, {"count": 1}
+    ).to_list(POINTS_RANK_LEVELS)
+    return 1 + sum(bucket["count"] for bucket in buckets)
+
+
+def assign_ranks(entries: List[dict]) -> List[dict]:
+    """Competition ranks for entries sorted by points desc; ties share the higher rank"""
+    for position, entry in enumerate(entries):
+        tied = position and (entry.get("points") or 0) == (entries[position - 1].get("points") or 0)
+        entry["rank"] = entries[position - 1]["rank"] if tied else position + 1
+    return entries
+
+
+async def rebuild_points_rank_buckets(dry_run: bool = False) -> dict:
+    """Recompute points_rank_buckets from users and points_periods.
+
+    Awards made while the rebuild runs may be lost from the histogram; run it
+    from manage.py when ranks look wrong, not on a schedule.
+    """
+    counts: Dict[str, int] = {}
+
+    def add(board: str, points):
+        for bucket, delta in rank_bucket_changes(board, 0, points):
+            counts[bucket] = counts.get(bucket, 0) + delta
+
+    learners = 0
+    async for user in db.users.find({"role": "student", "points": {"$gt": 0}}, {"_id": 0, "points": 1}):
+        add("all", user["points"])
+        learners += 1
+    period_rows = 0
+    async for total in db.points_periods.find({"points": {"$gt": 0}}, {"_id": 0, "period": 1, "points": 1}):
+        add(total["period"], total["points"])
+        period_rows += 1
+    if not dry_run:
+        await db.points_rank_buckets.delete_many({})
+        docs = [{"_id": bucket, "count": count} for bucket, count in counts.items()]
+        for start in range(0, len(docs), 1000):
+            await db.points_rank_buckets.insert_many(docs[start:start + 1000], ordered=False)
+    return {"learners": learners, "period_totals": period_rows, "buckets": len(counts)}
+
+
+class LeaderboardSnapshot:
+    """All-time top-N learners as public summaries, ordered by (points desc, id)"""
+
+    def __init__(self, size: int, refresh_seconds: float):
+        self.size = size
+        self.refresh_seconds = refresh_seconds
+        self.entries: List[dict] = []
+        self.loaded_at: Optional[float] = None
+        self.reloads = 0
+        self._lock = asyncio.Lock()
+
+    def _stale(self) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.refresh_seconds
+
+    async def top(self) -> List[dict]:
+        if self._stale():
+            async with self._lock:
+                if self._stale():
+                    users = await db.users.find(
+                        {"role": "student"}, USER_PROJECTIONS["public_summary"]
+                    ).sort([("points", -1), ("id", 1)]).limit(self.size).to_list(self.size)
+                    self.entries = [
+                        use_image_variant(user, "profile_image_url", "profile_image_variants", 64) for user in users
+                    ]
+                    self.loaded_at = time.monotonic()
+                    self.reloads += 1
+        return [dict(entry) for entry in self.entries]
+
+    def apply(self, user: dict) -> None:
+        """Patch in a learner whose points just changed; users below the cut are ignored"""
+        if self.loaded_at is None or user.get("role") != "student":
+            return
+        entries = [entry for entry in self.entries if entry["id"] != user["id"]]
+        was_listed = len(entries) < len(self.entries)
+        if not was_listed and len(entries) >= self.size and (user.get("points") or 0) < (entries[-1].get("points") or 0):
+            return
+        summary = use_image_variant(
+            {k: v for k, v in user.items() if k in USER_PROJECTIONS["public_summary"]},
+            "profile_image_url", "profile_image_variants", 64
+        )
+        entries.append(summary)
+        entries.sort(key=lambda entry: (-(entry.get("points") or 0), entry["id"]))
+        self.entries = entries[:self.size]
+
+    def invalidate(self) -> None:
+        self.loaded_at = None
+
+    def stats(self) -> dict:
+        return {"size": len(self.entries), "reloads": self.reloads, "loaded": self.loaded_at is not None}
+
+
+leaderboard = LeaderboardSnapshot(LEADERBOARD_SIZE, LEADERBOARD_REFRESH_SECONDS)
+
+
+async def award_points(user_id: str, points: int, reason: str, source_id: Optional[str] = None) -> None:
+    """Credit points to a user and record the event for period leaderboards"""
+    if not points:
+        return
+    user = await db.users.find_one_and_update(
+        {"id": user_id},
+        {"$inc": {"points": points}},
+        projection={**USER_PROJECTIONS["public_summary"], "role": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    user_cache.invalidate(user_id)
+    if not user:
+        return
+    now = datetime.now(timezone.utc)
+    await db.points_events.insert_one({
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "points": points,
+        "reason": reason,
+        "source_id": source_id,
+        "created_at": now.isoformat()
+    })
+    if user.get("role") == "student":
+        totals = await asyncio.gather(*[
+            db.points_periods.find_one_and_update(
+                {"_id": f"{key}:{user_id}"},
+                {"$inc": {"points": points}, "$setOnInsert": {"period": key, "user_id": user_id}},
+                projection={"_id": 0, "period": 1, "points": 1},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+            for key in points_period_keys(now).values()
+        ])
+        moves = rank_bucket_moves("all", user["points"] - points, user["points"])
+        for total in totals:
+            moves += rank_bucket_moves(total["period"], total["points"] - points, total["points"])
+        await apply_rank_moves(moves)
+    leaderboard.apply(user)
+
+
+async def period_leaderboard(period: str) -> List[dict]:
+    """Top learners by points earned in the current week or month"""
+    key = points_period_keys(datetime.now(timezone.utc))[period]
+    totals = await db.points_periods.find(
+        {"period": key}, {"_id": 0, "user_id": 1, "points": 1}
+    ).sort([("points", -1), ("user_id", 1)]).limit(LEADERBOARD_SIZE).to_list(LEADERBOARD_SIZE)
+    users = await BatchLoader().load_many("public_summary", (t["user_id"] for t in totals))
+    return [
+        {**users[t["user_id"]], "points": t["points"]}
+        for t in totals if t["user_id"] in users
+    ]
+
+
+# ======================== LESSON PROGRESS BUFFER ========================
+
+# The player reports progress every few seconds. Non-completing heartbeats are
+# coalesced in memory (max watch_percentage per user and lesson) and written as
+# one unordered bulk of upserts per flush. Completions bypass the buffer so
+# points and course completion are applied before the response.
+PROGRESS_FLUSH_SECONDS = float(os.environ.get('PROGRESS_FLUSH_SECONDS', 5))
+PROGRESS_BUFFER_MAX = int(os.environ.get('PROGRESS_BUFFER_MAX', 5000))
+
+
+def lesson_progress_upsert(user_id: str, lesson_id: str, watch_percentage: float, completed: bool, at: str,
+                           seq: int, client_timestamp: Optional[str] = None) -> UpdateOne:
+    update = {
+        "$max": {"watch_percentage": watch_percentage},
+        "$set": {"updated_at": at, "updated_seq": seq},
+        "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": at},
+    }
+    if client_timestamp:
+        update["$max"]["client_updated_at"] = client_timestamp
+    if completed:
+        update["$set"]["is_completed"] = True
+    else:
+        update["$setOnInsert"]["is_completed"] = False
+    return UpdateOne({"lesson_id": lesson_id, "user_id": user_id}, update, upsert=True)
+
+
+def course_completion(completed_count: int, total_lessons: int) -> Tuple[int, float, bool]:
+    """(completed lessons, progress percentage, course completed) for an enrollment.
+
+    completed_lessons can still hold lessons deleted since, so the count is
+    clamped to the course's lesson_count rather than compared for equality.
+    """
+    completed_count = min(completed_count, total_lessons)
+    progress = (completed_count / total_lessons * 100) if total_lessons > 0 else 0
+    return completed_count, progress, total_lessons > 0 and completed_count >= total_lessons
+
+
+class ProgressBuffer:
+    """Per-process write-behind buffer for lesson_progress"""
+
+    def __init__(self, flush_seconds: float, max_entries: int):
+        self.flush_seconds = flush_seconds
+        self.max_entries = max_entries
+        self.recorded = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.written = 0
+        self._pending: Dict[tuple, dict] = {}
+        self._flush_lock = asyncio.Lock()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, user_id: str, lesson_id: str, watch_percentage: float, completed: bool = False):
+        self.recorded += 1
+        key = (user_id, lesson_id)
+        entry = self._pending.get(key)
+        if entry is None:
+            self._pending[key] = {"watch_percentage": watch_percentage, "is_completed": completed}
+            if len(self._pending) >= self.max_entries:
+                self._full.set()
+        else:
+            self.coalesced += 1
+            entry["watch_percentage"] = max(entry["watch_percentage"], watch_percentage)
+            entry["is_completed"] = entry["is_completed"] or completed
+
+    def take(self, user_id: str, lesson_id: str) -> Optional[dict]:
+        """Remove and return a pending entry, for callers about to write it themselves"""
+        return self._pending.pop((user_id, lesson_id), None)
+
+    def overlay(self, user_id: str, lesson_id: str, progress: Optional[dict]) -> Optional[dict]:
+        """A stored progress document with any not-yet-flushed heartbeat applied"""
+        entry = self._pending.get((user_id, lesson_id))
+        if entry is None:
+            return progress
+        merged = dict(progress or {"user_id": user_id, "lesson_id": lesson_id, "is_completed": False})
+        merged["watch_percentage"] = max(merged.get("watch_percentage", 0), entry["watch_percentage"])
+        merged["is_completed"] = merged.get("is_completed", False) or entry["is_completed"]
+        return merged
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            self._full.clear()
+            if not pending:
+                return 0
+            at = datetime.now(timezone.utc).isoformat()
+            try:
+                # Drop heartbeats for lessons deleted since they were recorded
+                live = await lesson_index.resolve_many(list({lesson_id for _, lesson_id in pending}), confirm=True)
+                pending = {key: entry for key, entry in pending.items() if key[1] in live}
+                if not pending:
+                    return 0
+                last_seq = await next_change_seq(len(pending))
+                operations = [
+                    lesson_progress_upsert(user_id, lesson_id, entry["watch_percentage"], entry["is_completed"], at,
+                                           last_seq - len(pending) + 1 + n)
+                    for n, ((user_id, lesson_id), entry) in enumerate(pending.items())
+                ]
+                await db.lesson_progress.bulk_write(operations, ordered=False)
+                await release_change_seq(last_seq)
+            except Exception:
+                # Put the entries back (merging with newer heartbeats) and retry next flush
+                for (user_id, lesson_id), entry in pending.items():
+                    self.record(user_id, lesson_id, entry["watch_percentage"], entry["is_completed"])
+                raise
+            self.flushes += 1
+            self.written += len(operations)
+            return len(operations)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Progress flush failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "recorded": self.recorded,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "written": self.written,
+            "flush_seconds": self.flush_seconds,
+        }
+
+
+progress_buffer = ProgressBuffer(flush_seconds=PROGRESS_FLUSH_SECONDS, max_entries=PROGRESS_BUFFER_MAX)
+
+# ======================== VIDEO DELIVERY ========================
+
+# A learner seeking or refreshing calls the video endpoint repeatedly, so the
+# access log keeps at most one row per user and lesson per interval.
+VIDEO_ACCESS_LOG_INTERVAL_SECONDS = float(os.environ.get('VIDEO_ACCESS_LOG_INTERVAL_SECONDS', 300))
+VIDEO_ACCESS_LOG_SIZE = int(os.environ.get('VIDEO_ACCESS_LOG_SIZE', 50000))
+VIDEO_PREFETCH_DEFAULT = 3
+VIDEO_PREFETCH_MAX = 10
+
+
+class VideoAccessLog:
+    """Throttled writer for video_access_logs"""
+
+    def __init__(self, interval_seconds: float, max_entries: int):
+        self.interval_seconds = interval_seconds
+        self.max_entries = max_entries
+        self.written = 0
+        self.skipped = 0
+        self._recent: "OrderedDict[tuple, float]" = OrderedDict()
+
+    async def record(self, user_id: str, lesson_id: str):
+        key = (user_id, lesson_id)
+        now = time.monotonic()
+        last = self._recent.get(key)
+        if last is not None and now - last < self.interval_seconds:
+            self.skipped += 1
+            return
+        self._recent[key] = now
+        self._recent.move_to_end(key)
+        while len(self._recent) > self.max_entries:
+            self._recent.popitem(last=False)
+        self.written += 1
+        await db.video_access_logs.insert_one({
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "lesson_id": lesson_id,
+            "accessed_at": datetime.now(timezone.utc).isoformat()
+        })
+
+    def stats(self) -> dict:
+        return {"tracked": len(self._recent), "written": self.written, "skipped": self.skipped,
+                "interval_seconds": self.interval_seconds}
+
+
+video_access_log = VideoAccessLog(VIDEO_ACCESS_LOG_INTERVAL_SECONDS, VIDEO_ACCESS_LOG_SIZE)
+
+
+async def stream_object_response(storage: StorageBackend, key: str, range_header: Optional[str] = None,
+                                 if_none_match: Optional[str] = None) -> Response:
+    """Proxy an object from storage, honouring Range and If-None-Match, in fixed-size chunks"""
+    try:
+        stream = await storage.open_stream(key, parse_range_header(range_header), if_none_match)
+    except RangeNotSatisfiable as e:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{'*' if e.size is None else e.size}"})
+    
+    headers = {"Accept-Ranges": "bytes", "Cache-Control": "private, no-cache"}
+    if stream.etag:
+        headers["ETag"] = stream.etag
+    if stream.not_modified:
+        return Response(status_code=304, headers=headers)
+    
+    status_code = 200
+    if stream.byte_range:
+        start, end = stream.byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{'*' if stream.size is None else stream.size}"
+        headers["Content-Length"] = str(end - start + 1)
+    elif stream.size is not None:
+        headers["Content-Length"] = str(stream.size)
+    return StreamingResponse(stream.chunks, status_code=status_code, media_type=stream.content_type,
+                             headers=headers, background=BackgroundTask(stream.close))
+
+
+async def signed_video_url(video_key: str) -> Optional[Tuple[str, int]]:
+    """(url, expires_in) for a lesson's video_key, or None when its storage cannot sign.
+
+    Keys stored as "bucket_id:object_key" are signed by that bucket, falling
+    back to the default R2 bucket.
+    """
+    bucket_id = None
+    if ":" in video_key:
+        bucket_id, video_key = video_key.split(":", 1)
     
-    return {"orders": orders}
+    if bucket_id:
+        bucket_storage = await bucket_registry.storage(bucket_id)
+        if bucket_storage:
+            signed = signed_urls.get(bucket_storage, video_key)
+            if signed:
+                return signed
+    
+    if r2_storage:
+        return signed_urls.get(r2_storage, video_key)
+    return None
+
 
 # ======================== LESSON & PROGRESS ROUTES ========================
 
 @api_router.get("/lessons/{lesson_id}/video")
 async def get_lesson_video(
     lesson_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user)
 ):
+    """A signed URL for the lesson's video, or the video itself streamed from the fallback storage"""
     lesson = await db.lessons.find_one({"id": lesson_id}, {"_id": 0})
     if not lesson:
         raise HTTPException(status_code=404, detail="Lesson not found")
@@ -1874,115 +4180,112 @@ async def get_lesson_video(
     if not lesson.get("video_key"):
         raise HTTPException(status_code=404, detail="Video not found")
     
-    # Log access
-    await db.video_access_logs.insert_one({
-        "id": str(uuid.uuid4()),
-        "user_id": current_user["id"],
-        "lesson_id": lesson_id,
-        "accessed_at": datetime.now(timezone.utc).isoformat()
-    })
-    
-    video_key = lesson["video_key"]
-    bucket_id = None
-    
-    # Check if video_key contains bucket_id (format: bucket_id:video_key)
-    if ":" in video_key:
-        bucket_id, video_key = video_key.split(":", 1)
-    
-    # Try to get signed URL from specific bucket
-    if bucket_id:
-        bucket_config = await db.r2_buckets.find_one({"id": bucket_id})
-        if bucket_config:
-            try:
-                bucket_client = get_r2_client_for_bucket(bucket_config)
-                if bucket_client:
-                    signed_url = bucket_client.generate_presigned_url(
-                        'get_object',
-                        Params={'Bucket': bucket_config['bucket_name'], 'Key': video_key},
-                        ExpiresIn=3600
-                    )
-                    return {"video_url": signed_url, "expires_in": 3600}
-            except Exception as e:
-                logger.error(f"Error generating signed URL from bucket {bucket_id}: {e}")
+    await video_access_log.record(current_user["id"], lesson_id)
     
-    # Fallback to default R2 client
-    if r2_client:
-        signed_url = get_r2_signed_url(video_key, expiry_seconds=3600)
-        if signed_url:
-            return {"video_url": signed_url, "expires_in": 3600}
+    signed = await signed_video_url(lesson["video_key"])
+    if signed:
+        return {"video_url": signed[0], "expires_in": signed[1]}
+    video_key = lesson["video_key"].split(":", 1)[-1]
     
-    # Fallback to emergent storage
+    # Fallback to emergent storage, streamed so seeking works and memory stays bounded
     try:
-        video_data, content_type = get_object(video_key)
-        return Response(content=video_data, media_type=content_type)
-    except Exception as e:
+        return await stream_object_response(fallback_storage, video_key, range_header, if_none_match)
+    except StorageError as e:
         logger.error(f"Error fetching video: {e}")
         raise HTTPException(status_code=500, detail="Error fetching video")
 
+@api_router.get("/lessons/{lesson_id}/video/prefetch")
+async def prefetch_lesson_videos(
+    lesson_id: str,
+    count: int = VIDEO_PREFETCH_DEFAULT,
+    current_user: dict = Depends(get_current_user)
+):
+    """Signed URLs for the next `count` video lessons in this lesson's module.
+
+    Lessons whose video cannot be signed (Emergent storage) are left out; the
+    player fetches those through GET /lessons/{id}/video as before.
+    """
+    lesson = await db.lessons.find_one({"id": lesson_id}, {"_id": 0, "module_id": 1, "order": 1})
+    if not lesson:
+        raise HTTPException(status_code=404, detail="Lesson not found")
+    location = await lesson_index.resolve(lesson_id)
+    if not location:
+        raise HTTPException(status_code=404, detail="Module not found")
+    
+    enrolled = await db.enrollments.find_one(
+        {"course_id": location[1], "user_id": current_user["id"]}, {"_id": 1}
+    ) is not None
+    query = {"module_id": lesson["module_id"], "order": {"$gt": lesson.get("order", 0)},
+             "video_key": {"$nin": [None, ""]}}
+    if not enrolled:
+        query["is_preview"] = True
+    
+    count = max(0, min(count, VIDEO_PREFETCH_MAX))
+    upcoming = await db.lessons.find(
+        query, {"_id": 0, "id": 1, "video_key": 1}
+    ).sort("order", ASCENDING).limit(count).to_list(count) if count else []
+    
+    videos = []
+    for upcoming_lesson in upcoming:
+        signed = await signed_video_url(upcoming_lesson["video_key"])
+        if signed:
+            videos.append({"lesson_id": upcoming_lesson["id"], "video_url": signed[0], "expires_in": signed[1]})
+    return {"videos": videos}
+
 @api_router.post("/lessons/{lesson_id}/progress")
 async def update_lesson_progress(
     lesson_id: str,
     watch_percentage: float,
     current_user: dict = Depends(get_current_user)
 ):
-    lesson = await db.lessons.find_one({"id": lesson_id}, {"_id": 0})
-    if not lesson:
+    location = await lesson_index.resolve(lesson_id)
+    if not location:
         raise HTTPException(status_code=404, detail="Lesson not found")
-    
-    module = await db.modules.find_one({"id": lesson["module_id"]}, {"_id": 0})
+    _, course_id = location
     
     # Check enrollment
     enrollment = await db.enrollments.find_one(
-        {"course_id": module["course_id"], "user_id": current_user["id"]}
+        {"course_id": course_id, "user_id": current_user["id"]}
     )
     if not enrollment:
         raise HTTPException(status_code=403, detail="Not enrolled in this course")
     
     is_completed = watch_percentage >= 80
     
-    # Update or create progress
-    existing = await db.lesson_progress.find_one(
-        {"lesson_id": lesson_id, "user_id": current_user["id"]}
-    )
-    
-    if existing:
-        await db.lesson_progress.update_one(
-            {"lesson_id": lesson_id, "user_id": current_user["id"]},
-            {"$set": {
-                "watch_percentage": max(existing.get("watch_percentage", 0), watch_percentage),
-                "is_completed": is_completed or existing.get("is_completed", False),
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }}
-        )
-    else:
-        await db.lesson_progress.insert_one({
-            "id": str(uuid.uuid4()),
-            "user_id": current_user["id"],
-            "lesson_id": lesson_id,
-            "watch_percentage": watch_percentage,
-            "is_completed": is_completed,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        })
+    if not is_completed or lesson_id in enrollment.get("completed_lessons", []):
+        progress_buffer.record(current_user["id"], lesson_id, watch_percentage, is_completed)
+        return {"message": "Progress updated", "is_completed": is_completed}
     
-    # Update enrollment progress
-    if is_completed and lesson_id not in enrollment.get("completed_lessons", []):
-        completed_lessons = enrollment.get("completed_lessons", []) + [lesson_id]
+    # First completion of this lesson: write through, then update the enrollment
+    if not await lesson_index.resolve(lesson_id, confirm=True):
+        raise HTTPException(status_code=404, detail="Lesson not found")
+    buffered = progress_buffer.take(current_user["id"], lesson_id)
+    if buffered:
+        watch_percentage = max(watch_percentage, buffered["watch_percentage"])
+    seq = await next_change_seq()
+    await db.lesson_progress.bulk_write([lesson_progress_upsert(
+        current_user["id"], lesson_id, watch_percentage, True, datetime.now(timezone.utc).isoformat(), seq
+    )])
+    await release_change_seq(seq)
+    
+    # Conditional push so concurrent completions award points once
+    updated = await db.enrollments.find_one_and_update(
+        {"id": enrollment["id"], "completed_lessons": {"$ne": lesson_id}},
+        {"$push": {"completed_lessons": lesson_id}},
+        projection={"_id": 0, "completed_lessons": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if updated:
+        completed_lessons = updated["completed_lessons"]
         
-        # Calculate total lessons in course
-        modules = await db.modules.find({"course_id": module["course_id"]}, {"_id": 0}).to_list(100)
-        total_lessons = 0
-        for m in modules:
-            lesson_count = await db.lessons.count_documents({"module_id": m["id"]})
-            total_lessons += lesson_count
+        course = await db.courses.find_one({"id": course_id}, {"_id": 0, "lesson_count": 1})
+        total_lessons = course.get("lesson_count", 0) if course else 0
         
-        progress = (len(completed_lessons) / total_lessons * 100) if total_lessons > 0 else 0
-        is_course_completed = len(completed_lessons) == total_lessons
+        _, progress, is_course_completed = course_completion(len(completed_lessons), total_lessons)
         
         await db.enrollments.update_one(
             {"id": enrollment["id"]},
             {"$set": {
-                "completed_lessons": completed_lessons,
                 "progress_percentage": progress,
                 "is_completed": is_course_completed,
                 "completed_at": datetime.now(timezone.utc).isoformat() if is_course_completed else None
@@ -1990,14 +4293,117 @@ async def update_lesson_progress(
         )
         
         # Award points
-        if is_completed:
-            await db.users.update_one(
-                {"id": current_user["id"]},
-                {"$inc": {"points": 10}}
-            )
+        await award_points(current_user["id"], 10, "lesson_completed", lesson_id)
     
     return {"message": "Progress updated", "is_completed": is_completed}
 
+@api_router.post("/progress/batch")
+async def sync_progress_batch(data: ProgressSyncBatch, current_user: dict = Depends(get_current_user)):
+    """Apply progress recorded offline in one go.
+
+    Items for the same lesson are merged (max watch_percentage), enrollment is
+    checked once per course, and all progress rows go out in a single bulk
+    write. Replays are idempotent, so clients can resend a batch after a
+    dropped response.
+    """
+    user_id = current_user["id"]
+    merged: Dict[str, dict] = {}
+    for item in data.items:
+        stamp = None
+        if item.client_timestamp:
+            client_time = item.client_timestamp
+            if client_time.tzinfo is None:
+                client_time = client_time.replace(tzinfo=timezone.utc)
+            stamp = client_time.astimezone(timezone.utc).isoformat()
+        entry = merged.setdefault(item.lesson_id, {"watch_percentage": 0.0, "client_timestamp": None})
+        entry["watch_percentage"] = max(entry["watch_percentage"], item.watch_percentage)
+        if stamp and (entry["client_timestamp"] is None or stamp > entry["client_timestamp"]):
+            entry["client_timestamp"] = stamp
+    
+    rejected = []
+    locations = await lesson_index.resolve_many(list(merged), confirm=True)
+    rejected += [{"lesson_id": lesson_id, "reason": "Lesson not found"} for lesson_id in merged if lesson_id not in locations]
+    course_ids = list({course_id for _, course_id in locations.values()})
+    enrollments = {
+        e["course_id"]: e for e in await db.enrollments.find(
+            {"user_id": user_id, "course_id": {"$in": course_ids}}, {"_id": 0, "id": 1, "course_id": 1}
+        ).to_list(None)
+    }
+    
+    at = datetime.now(timezone.utc).isoformat()
+    progress_ops = []
+    completions = []
+    for lesson_id, (_, course_id) in locations.items():
+        if course_id not in enrollments:
+            rejected.append({"lesson_id": lesson_id, "reason": "Not enrolled in this course"})
+            continue
+        entry = merged[lesson_id]
+        buffered = progress_buffer.take(user_id, lesson_id)
+        if buffered:
+            entry["watch_percentage"] = max(entry["watch_percentage"], buffered["watch_percentage"])
+        completed = entry["watch_percentage"] >= 80 or bool(buffered and buffered["is_completed"])
+        progress_ops.append((lesson_id, entry, completed))
+        if completed:
+            # Conditional push: a lesson already recorded as complete is a no-op
+            completions.append(UpdateOne(
+                {"id": enrollments[course_id]["id"], "completed_lessons": {"$ne": lesson_id}},
+                {"$push": {"completed_lessons": lesson_id}}
+            ))
+    
+    if progress_ops:
+        last_seq = await next_change_seq(len(progress_ops))
+        await db.lesson_progress.bulk_write([
+            lesson_progress_upsert(user_id, lesson_id, entry["watch_percentage"], completed, at,
+                                   last_seq - len(progress_ops) + 1 + n, entry["client_timestamp"])
+            for n, (lesson_id, entry, completed) in enumerate(progress_ops)
+        ], ordered=False)
+        await release_change_seq(last_seq)
+    
+    newly_completed = 0
+    courses = []
+    if completions:
+        newly_completed = (await db.enrollments.bulk_write(completions, ordered=False)).modified_count
+    if enrollments and progress_ops:
+        touched = {course_id for lesson_id, (_, course_id) in locations.items() if course_id in enrollments}
+        lesson_counts = {
+            c["id"]: c.get("lesson_count", 0) for c in await db.courses.find(
+                {"id": {"$in": list(touched)}}, {"_id": 0, "id": 1, "lesson_count": 1}
+            ).to_list(None)
+        }
+        updated = await db.enrollments.find(
+            {"id": {"$in": [enrollments[c]["id"] for c in touched]}},
+            {"_id": 0, "id": 1, "course_id": 1, "completed_lessons": 1, "is_completed": 1, "completed_at": 1}
+        ).to_list(None)
+        enrollment_ops = []
+        for enrollment in updated:
+            total_lessons = lesson_counts.get(enrollment["course_id"], 0)
+            completed_count, progress, is_course_completed = course_completion(
+                len(enrollment.get("completed_lessons", [])), total_lessons
+            )
+            enrollment_ops.append(UpdateOne({"id": enrollment["id"]}, {"$set": {
+                "progress_percentage": progress,
+                "is_completed": is_course_completed,
+                "completed_at": (enrollment.get("completed_at") or at) if is_course_completed else None
+            }}))
+            courses.append({
+                "course_id": enrollment["course_id"],
+                "completed_lessons": completed_count,
+                "total_lessons": total_lessons,
+                "progress_percentage": progress,
+                "is_completed": is_course_completed
+            })
+        if newly_completed:
+            await db.enrollments.bulk_write(enrollment_ops, ordered=False)
+    
+    await award_points(user_id, 10 * newly_completed, "lesson_completed")
+    
+    return {
+        "applied": len(progress_ops),
+        "rejected": rejected,
+        "courses": courses,
+        "points_awarded": 10 * newly_completed
+    }
+
 # ======================== QUIZ ROUTES ========================
 
 @api_router.post("/quizzes/{quiz_id}/submit")
@@ -2011,13 +4417,13 @@ async def submit_quiz(
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
     
-    module = await db.modules.find_one({"id": quiz["module_id"]}, {"_id": 0})
+    course_id = await lesson_index.module_course(quiz["module_id"])
     
     # Check enrollment
     enrollment = await db.enrollments.find_one(
-        {"course_id": module["course_id"], "user_id": current_user["id"]}
+        {"course_id": course_id, "user_id": current_user["id"]}
     )
-    if not enrollment:
+    if not course_id or not enrollment:
         raise HTTPException(status_code=403, detail="Not enrolled in this course")
     
     # Check if already attempted
@@ -2059,6 +4465,7 @@ async def submit_quiz(
         "results": results,
         "score": score,
         "is_passed": is_passed,
+        "updated_seq": await next_change_seq(),
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
@@ -2069,13 +4476,11 @@ async def submit_quiz(
         )
     else:
         await db.quiz_attempts.insert_one(attempt)
+    await release_change_seq(attempt["updated_seq"])
     
     # Award points for passing
     if is_passed:
-        await db.users.update_one(
-            {"id": current_user["id"]},
-            {"$inc": {"points": 50}}
-        )
+        await award_points(current_user["id"], 50, "quiz_passed", quiz_id)
     
     return {
         "score": score,
@@ -2143,22 +4548,16 @@ async def get_referral_stats(current_user: dict = Depends(get_current_user)):
     }
 
 @api_router.get("/referrals/earnings")
-async def get_referral_earnings(current_user: dict = Depends(get_current_user)):
+async def get_referral_earnings(cursor: Optional[str] = None, limit: int = 500, current_user: dict = Depends(get_current_user)):
     """Get detailed earnings history"""
-    earnings = await db.referral_earnings.find(
-        {"referrer_id": current_user["id"]},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(1000)
+    earnings, next_cursor = await paginate(
+        db.referral_earnings, {"referrer_id": current_user["id"]}, {"_id": 0}, limit=limit, cursor=cursor
+    )
     
     # Enrich with buyer details
-    for earning in earnings:
-        buyer = await db.users.find_one(
-            {"id": earning["buyer_id"]},
-            {"_id": 0, "first_name": 1, "last_name": 1, "email": 1}
-        )
-        earning["buyer"] = buyer
+    await BatchLoader().attach(earnings, ("buyer_id", "buyer", "public_summary"))
     
-    return {"earnings": earnings}
+    return {"earnings": earnings, "next_cursor": next_cursor}
 
 @api_router.post("/referrals/apply/{code}")
 async def apply_referral_code(code: str, current_user: dict = Depends(get_current_user)):
@@ -2176,6 +4575,7 @@ async def apply_referral_code(code: str, current_user: dict = Depends(get_curren
         {"id": current_user["id"]},
         {"$set": {"referred_by": code}}
     )
+    user_cache.invalidate(current_user["id"])
     
     return {"message": "Referral code applied successfully"}
 
@@ -2204,6 +4604,7 @@ async def request_withdrawal(
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.withdrawals.insert_one(withdrawal)
+    await record_metrics(totals={"pending_withdrawals": 1, "pending_withdrawal_amount": data.amount})
     
     # Deduct from wallet balance (pending state - will be returned if rejected)
     await db.users.update_one(
@@ -2213,6 +4614,7 @@ async def request_withdrawal(
             "$set": {"pending_earnings": user.get("pending_earnings", 0) + data.amount}
         }
     )
+    user_cache.invalidate(current_user["id"])
     
     # Notify admin
     await db.notifications.insert_one({
@@ -2262,14 +4664,14 @@ async def create_ticket(data: TicketCreate, current_user: dict = Depends(get_cur
     return {"message": "Ticket created", "ticket_id": ticket["id"]}
 
 @api_router.get("/tickets")
-async def get_tickets(current_user: dict = Depends(get_current_user)):
+async def get_tickets(cursor: Optional[str] = None, limit: int = 100, current_user: dict = Depends(get_current_user)):
     query = {"user_id": current_user["id"]}
     if current_user["role"] == "admin":
         query = {}
     
-    tickets = await db.tickets.find(query, {"_id": 0}).sort("updated_at", -1).to_list(100)
+    tickets, next_cursor = await paginate(db.tickets, query, {"_id": 0}, sort_field="updated_at", limit=limit, cursor=cursor)
     
-    return {"tickets": tickets}
+    return {"tickets": tickets, "next_cursor": next_cursor}
 
 @api_router.get("/tickets/{ticket_id}")
 async def get_ticket(ticket_id: str, current_user: dict = Depends(get_current_user)):
@@ -2394,7 +4796,7 @@ async def reopen_ticket(ticket_id: str, current_user: dict = Depends(get_current
 
 # ======================== CHAT/MESSAGING ROUTES ========================
 
-@api_router.get("/friends")
+@api_router.get("/friends", response_model=FriendsResponse)
 async def get_friends(current_user: dict = Depends(get_current_user)):
     friendships = await db.friendships.find(
         {"$or": [
@@ -2404,15 +4806,9 @@ async def get_friends(current_user: dict = Depends(get_current_user)):
         {"_id": 0}
     ).to_list(100)
     
-    friends = []
-    for f in friendships:
-        friend_id = f["friend_id"] if f["user_id"] == current_user["id"] else f["user_id"]
-        friend = await db.users.find_one(
-            {"id": friend_id},
-            {"_id": 0, "password": 0}
-        )
-        if friend:
-            friends.append(friend)
+    friend_ids = [f["friend_id"] if f["user_id"] == current_user["id"] else f["user_id"] for f in friendships]
+    found = await BatchLoader().load_many("public_summary", friend_ids)
+    friends = [found[friend_id] for friend_id in friend_ids if friend_id in found]
     
     return {"friends": friends}
 
@@ -2466,12 +4862,7 @@ async def get_friend_requests(current_user: dict = Depends(get_current_user)):
     ).to_list(100)
     
     # Get user details for each request
-    for req in requests:
-        sender = await db.users.find_one(
-            {"id": req["user_id"]},
-            {"_id": 0, "id": 1, "first_name": 1, "last_name": 1, "email": 1, "avatar_url": 1}
-        )
-        req["sender"] = sender
+    await BatchLoader().attach(requests, ("user_id", "sender", "public_summary"))
     
     return {"requests": requests}
 
@@ -2505,7 +4896,7 @@ async def get_conversations_list(current_user: dict = Depends(get_current_user))
     conversations = []
     for friendship in friendships:
         friend_id = friendship["friend_id"] if friendship["user_id"] == current_user["id"] else friendship["user_id"]
-        friend = await db.users.find_one({"id": friend_id}, {"_id": 0, "password": 0})
+        friend = await db.users.find_one({"id": friend_id}, {"_id": 0, "password": 0, "profile_image": 0})
         if friend:
             friend = {"id": friend.get("id"), "first_name": friend.get("first_name"), "last_name": friend.get("last_name"), "avatar_url": friend.get("avatar_url")}
         
@@ -2571,25 +4962,77 @@ async def send_message(data: MessageCreate, current_user: dict = Depends(get_cur
 
 # ======================== NOTIFICATION ROUTES ========================
 
+# Broadcasts to every user are stored once in admin_notifications and merged into
+# each feed at read time. notification_receipts holds a small document only for
+# the broadcasts a user has read or deleted individually, and "read all" is a
+# timestamp on the user (notifications_read_at) rather than one write per row.
+BROADCAST_FIELDS = {"_id": 0, "id": 1, "title": 1, "message": 1, "type": 1, "created_at": 1}
+
+def broadcast_query(user: dict, exclude_ids: List[str] = None, after: str = None) -> dict:
+    """Broadcasts a user can see: those sent since they joined, minus exclude_ids"""
+    query = {"audience": "all"}
+    created = {}
+    if user.get("created_at"):
+        created["$gte"] = user["created_at"]
+    if after:
+        created["$gt"] = after
+    if created:
+        query["created_at"] = created
+    if exclude_ids:
+        query["id"] = {"$nin": exclude_ids}
+    return query
+
 @api_router.get("/notifications")
 async def get_notifications(current_user: dict = Depends(get_current_user)):
+    user_id = current_user["id"]
+    receipts = await db.notification_receipts.find(
+        {"user_id": user_id}, {"_id": 0, "notification_id": 1, "is_read": 1, "is_deleted": 1}
+    ).to_list(None)
+    deleted = [r["notification_id"] for r in receipts if r.get("is_deleted")]
+    read = {r["notification_id"] for r in receipts if r.get("is_read")}
+    read_before = current_user.get("notifications_read_at") or ""
+    
     notifications = await db.notifications.find(
-        {"user_id": current_user["id"]},
+        {"user_id": user_id},
         {"_id": 0}
     ).sort("created_at", -1).limit(50).to_list(50)
+    broadcasts = await db.admin_notifications.find(
+        broadcast_query(current_user, deleted), BROADCAST_FIELDS
+    ).sort("created_at", -1).limit(50).to_list(50)
+    for broadcast in broadcasts:
+        broadcast["user_id"] = user_id
+        broadcast["is_read"] = broadcast["id"] in read or broadcast["created_at"] <= read_before
+        broadcast["is_broadcast"] = True
+    notifications = sorted(notifications + broadcasts, key=lambda n: n.get("created_at") or "", reverse=True)[:50]
     
     unread_count = await db.notifications.count_documents(
-        {"user_id": current_user["id"], "is_read": False}
+        {"user_id": user_id, "is_read": False}
+    )
+    unread_count += await db.admin_notifications.count_documents(
+        broadcast_query(current_user, deleted + list(read), after=read_before)
     )
     
     return {"notifications": notifications, "unread_count": unread_count}
 
+async def mark_broadcast(notification_id: str, user_id: str, field: str) -> bool:
+    """Record a per-user read/delete marker on a broadcast; False if it is not one"""
+    if not await db.admin_notifications.find_one({"id": notification_id, "audience": "all"}, {"_id": 0, "id": 1}):
+        return False
+    await db.notification_receipts.update_one(
+        {"notification_id": notification_id, "user_id": user_id},
+        {"$set": {field: True, "updated_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True
+    )
+    return True
+
 @api_router.post("/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: str, current_user: dict = Depends(get_current_user)):
-    await db.notifications.update_one(
+    result = await db.notifications.update_one(
         {"id": notification_id, "user_id": current_user["id"]},
         {"$set": {"is_read": True}}
     )
+    if result.matched_count == 0:
+        await mark_broadcast(notification_id, current_user["id"], "is_read")
     return {"message": "Notification marked as read"}
 
 @api_router.delete("/notifications/{notification_id}")
@@ -2598,7 +5041,7 @@ async def delete_notification(notification_id: str, current_user: dict = Depends
     result = await db.notifications.delete_one(
         {"id": notification_id, "user_id": current_user["id"]}
     )
-    if result.deleted_count == 0:
+    if result.deleted_count == 0 and not await mark_broadcast(notification_id, current_user["id"], "is_deleted"):
         raise HTTPException(status_code=404, detail="Notification not found")
     return {"message": "Notification deleted"}
 
@@ -2608,6 +5051,11 @@ async def mark_all_notifications_read(current_user: dict = Depends(get_current_u
         {"user_id": current_user["id"], "is_read": False},
         {"$set": {"is_read": True}}
     )
+    await db.users.update_one(
+        {"id": current_user["id"]},
+        {"$set": {"notifications_read_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    user_cache.invalidate(current_user["id"])
     return {"message": "All notifications marked as read"}
 
 # ======================== FAQ ROUTES ========================
@@ -2660,22 +5108,29 @@ async def get_all_cms():
 
 # ======================== ADMIN ROUTES ========================
 
+@api_router.get("/admin/metrics/cache")
+async def admin_cache_metrics(current_user: dict = Depends(get_admin_user)):
+    """Per-worker cache counters, for tuning TTLs and sizes"""
+    with db_command_counter._lock:
+        db_commands = dict(db_command_counter.counts)
+    return {
+        "user_cache": user_cache.stats(),
+        "outline_cache": outline_cache.stats(),
+        "progress_buffer": progress_buffer.stats(),
+        "lesson_index": lesson_index.stats(),
+        "leaderboard": leaderboard.stats(),
+        "r2_buckets": bucket_registry.stats(),
+        "signed_urls": signed_urls.stats(),
+        "video_access_log": video_access_log.stats(),
+        "db_commands": db_commands,
+    }
+
 @api_router.get("/admin/dashboard")
 async def admin_dashboard(current_user: dict = Depends(get_admin_user)):
-    # Get stats
+    """Headline numbers from the metrics rollups; nothing here scans orders or logs"""
     total_users = await db.users.count_documents({"role": "student"})
-    total_courses = await db.courses.count_documents({})
-    total_enrollments = await db.enrollments.count_documents({})
-    
-    # Revenue
-    completed_orders = await db.orders.find({"status": "completed"}, {"_id": 0}).to_list(10000)
-    total_revenue = sum(o.get("total", 0) for o in completed_orders)
-    
-    # Pending withdrawals
-    pending_withdrawals = await db.withdrawals.count_documents({"status": "pending"})
-    pending_withdrawal_amount = 0
-    pending_w = await db.withdrawals.find({"status": "pending"}, {"_id": 0}).to_list(1000)
-    pending_withdrawal_amount = sum(w.get("amount", 0) for w in pending_w)
+    total_courses = await db.courses.estimated_document_count()
+    totals = await db.metrics_totals.find_one({"_id": METRICS_TOTALS_ID}) or {}
     
     # Recent orders
     recent_orders = await db.orders.find(
@@ -2683,37 +5138,32 @@ async def admin_dashboard(current_user: dict = Depends(get_admin_user)):
         {"_id": 0}
     ).sort("created_at", -1).limit(10).to_list(10)
     
-    # Sales by date (last 30 days)
-    thirty_days_ago = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
-    recent_sales = await db.orders.find(
-        {"status": "completed", "created_at": {"$gte": thirty_days_ago}},
-        {"_id": 0}
-    ).to_list(10000)
-    
-    sales_by_date = {}
-    for order in recent_sales:
-        date = order["created_at"][:10]
-        sales_by_date[date] = sales_by_date.get(date, 0) + order.get("total", 0)
+    # Daily rollups (last 30 days)
+    now = datetime.now(timezone.utc)
+    daily = await db.daily_metrics.find(
+        {"_id": {"$gte": metrics_day(now - timedelta(days=29))}}
+    ).sort("_id", 1).to_list(31)
+    sales_by_date = {day["_id"]: day.get("revenue", 0) for day in daily if day.get("orders")}
     
     # Active users (logged in last 7 days)
-    seven_days_ago = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
-    active_users = await db.login_logs.distinct("user_id", {"timestamp": {"$gte": seven_days_ago}})
-    
-    # Total commissions
-    all_commissions = await db.commissions.find({}, {"_id": 0}).to_list(10000)
-    total_commissions = sum(c.get("commission", 0) for c in all_commissions)
+    seven_days_ago = (now - timedelta(days=7)).isoformat()
+    active_users = await db.users.count_documents({"last_login_at": {"$gte": seven_days_ago}})
     
     return {
         "total_users": total_users,
         "total_courses": total_courses,
-        "total_enrollments": total_enrollments,
-        "total_revenue": total_revenue,
-        "pending_withdrawals": pending_withdrawals,
-        "pending_withdrawal_amount": pending_withdrawal_amount,
-        "active_users": len(active_users),
-        "total_commissions": total_commissions,
+        "total_enrollments": totals.get("enrollments", 0),
+        "total_revenue": totals.get("revenue", 0),
+        "pending_withdrawals": totals.get("pending_withdrawals", 0),
+        "pending_withdrawal_amount": totals.get("pending_withdrawal_amount", 0),
+        "active_users": active_users,
+        "total_commissions": totals.get("commissions", 0),
         "recent_orders": recent_orders,
-        "sales_by_date": sales_by_date
+        "sales_by_date": sales_by_date,
+        "daily": [
+            {"date": day["_id"], **{field: day.get(field, 0) for field in ("revenue", "orders", "enrollments", "commissions", "active_users")}}
+            for day in daily
+        ]
     }
 
 @api_router.get("/admin/users")
@@ -2722,8 +5172,10 @@ async def admin_get_users(
     role: Optional[str] = None,
     page: int = 1,
     limit: int = 20,
+    cursor: Optional[str] = None,
     current_user: dict = Depends(get_admin_user)
 ):
+    """Newest users first; pass next_cursor back as cursor to page without skip"""
     query = {}
     if search:
         query["$or"] = [
@@ -2734,22 +5186,25 @@ async def admin_get_users(
     if role:
         query["role"] = role
     
-    total = await db.users.count_documents(query)
-    users = await db.users.find(
-        query,
-        {"_id": 0, "password": 0}
-    ).skip((page - 1) * limit).limit(limit).to_list(limit)
+    users, next_cursor = await paginate(
+        db.users, query, {"_id": 0, "password": 0, "profile_image": 0},
+        limit=limit, cursor=cursor, skip=(page - 1) * limit
+    )
     
+    if cursor:
+        return {"users": users, "next_cursor": next_cursor}
+    total = await db.users.count_documents(query)
     return {
         "users": users,
         "total": total,
         "page": page,
-        "pages": (total + limit - 1) // limit
+        "pages": (total + limit - 1) // limit,
+        "next_cursor": next_cursor
     }
 
 @api_router.get("/admin/users/{user_id}")
 async def admin_get_user(user_id: str, current_user: dict = Depends(get_admin_user)):
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0, "profile_image": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -2799,13 +5254,24 @@ async def admin_update_user(
     
     if update_data:
         update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
-        await db.users.update_one({"id": user_id}, {"$set": update_data})
+        before = await db.users.find_one_and_update(
+            {"id": user_id}, {"$set": update_data}, projection={"_id": 0, "role": 1, "points": 1}
+        )
+        user_cache.invalidate(user_id)
+        if before and role is not None and (before.get("role") == "student") != (role == "student"):
+            points = before.get("points") or 0
+            await apply_rank_moves(rank_bucket_moves("all", *((points, 0) if role != "student" else (0, points))))
+            leaderboard.invalidate()
     
     return {"message": "User updated"}
 
 @api_router.delete("/admin/users/{user_id}")
 async def admin_delete_user(user_id: str, current_user: dict = Depends(get_admin_user)):
-    await db.users.delete_one({"id": user_id})
+    user = await db.users.find_one_and_delete({"id": user_id}, projection={"_id": 0, "role": 1, "points": 1})
+    user_cache.invalidate(user_id)
+    if user and user.get("role") == "student":
+        await apply_rank_moves(rank_bucket_moves("all", user.get("points"), 0))
+        leaderboard.invalidate()
     return {"message": "User deleted"}
 
 # Admin Course Assignment - Give free access to users
@@ -2822,7 +5288,7 @@ async def admin_assign_course(
         raise HTTPException(status_code=404, detail="User not found")
     
     # Verify course exists
-    course = await db.courses.find_one({"id": course_id}, {"_id": 0})
+    course = await db.courses.find_one({"id": course_id}, {"_id": 0, "thumbnail_data": 0})
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     
@@ -2847,6 +5313,7 @@ async def admin_assign_course(
         "assignment_note": "Free access granted by admin"
     }
     await db.enrollments.insert_one(enrollment)
+    await adjust_course_enrollments(course_id, 1)
     
     # Create a free order record for tracking
     order = {
@@ -2863,6 +5330,7 @@ async def admin_assign_course(
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.orders.insert_one(order)
+    await record_metrics(orders=1)
     
     return {
         "message": f"Course '{course['title']}' assigned to {user['first_name']} {user['last_name']}",
@@ -2883,10 +5351,11 @@ async def admin_revoke_course(
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Enrollment not found")
+    await adjust_course_enrollments(course_id, -1)
     
     return {"message": "Course access revoked"}
 
-@api_router.get("/admin/course-assignments")
+@api_router.get("/admin/course-assignments", response_model=AdminCourseAssignmentsResponse)
 async def admin_get_course_assignments(current_user: dict = Depends(get_admin_user)):
     """Get all admin-assigned courses"""
     assignments = await db.enrollments.find(
@@ -2895,11 +5364,9 @@ async def admin_get_course_assignments(current_user: dict = Depends(get_admin_us
     ).sort("enrolled_at", -1).to_list(500)
     
     # Enrich with user and course details
-    for assignment in assignments:
-        user = await db.users.find_one({"id": assignment["user_id"]}, {"_id": 0, "password": 0})
-        course = await db.courses.find_one({"id": assignment["course_id"]}, {"_id": 0})
-        assignment["user"] = user
-        assignment["course"] = course
+    await BatchLoader().attach(
+        assignments, ("user_id", "user", "admin_summary"), ("course_id", "course", "course_card")
+    )
     
     return {"assignments": assignments}
 
@@ -2907,58 +5374,26 @@ async def admin_get_course_assignments(current_user: dict = Depends(get_admin_us
 @api_router.get("/admin/users/{user_id}/performance")
 async def admin_get_user_performance(user_id: str, current_user: dict = Depends(get_admin_user)):
     """Get comprehensive user performance data"""
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0, "profile_image": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Get all orders for this user
-    orders = await db.orders.find(
-        {"user_id": user_id, "status": "completed"},
-        {"_id": 0}
-    ).to_list(1000)
-    
-    total_purchases = len(orders)
-    total_spent = sum(o.get("total", 0) for o in orders)
-    
-    # Get all enrollments
-    enrollments = await db.enrollments.find(
-        {"user_id": user_id},
-        {"_id": 0}
-    ).to_list(1000)
-    
-    courses_enrolled = len(enrollments)
-    
-    # Get progress per course
-    course_progress = []
-    for enrollment in enrollments:
-        course = await db.courses.find_one({"id": enrollment["course_id"]}, {"_id": 0})
-        if course:
-            # Get lessons for this course
-            modules = await db.modules.find({"course_id": course["id"]}, {"_id": 0}).to_list(100)
-            total_lessons = 0
-            completed_lessons = 0
-            for module in modules:
-                lessons = await db.lessons.find({"module_id": module["id"]}, {"_id": 0}).to_list(100)
-                total_lessons += len(lessons)
-                for lesson in lessons:
-                    progress = await db.lesson_progress.find_one({
-                        "user_id": user_id,
-                        "lesson_id": lesson["id"],
-                        "is_completed": True
-                    })
-                    if progress:
-                        completed_lessons += 1
-            
-            progress_percentage = (completed_lessons / total_lessons * 100) if total_lessons > 0 else 0
-            
-            course_progress.append({
-                "course_id": course["id"],
-                "course_title": course["title"],
-                "enrolled_at": enrollment.get("enrolled_at"),
-                "total_lessons": total_lessons,
-                "completed_lessons": completed_lessons,
-                "progress_percentage": round(progress_percentage, 1)
-            })
+    # Completed orders, summed by the server
+    order_totals = await db.orders.aggregate([
+        {"$match": {"user_id": user_id, "status": "completed"}},
+        {"$group": {"_id": None, "count": {"$sum": 1}, "spent": {"$sum": "$total"}}},
+    ]).to_list(1)
+    total_purchases = order_totals[0]["count"] if order_totals else 0
+    total_spent = order_totals[0]["spent"] if order_totals else 0
+    
+    # Progress per enrolled course
+    course_progress = [
+        {field: row.get(field) for field in (
+            "course_id", "course_title", "enrolled_at", "total_lessons", "completed_lessons", "progress_percentage"
+        )}
+        for row in await learner_course_progress(user_id)
+    ]
+    courses_enrolled = await db.enrollments.count_documents({"user_id": user_id})
     
     # Get referral earnings generated by this user's referrals
     referral_earnings = await db.referral_earnings.find(
@@ -2991,7 +5426,7 @@ async def admin_get_user_performance(user_id: str, current_user: dict = Depends(
 @api_router.get("/admin/courses")
 async def admin_get_all_courses(current_user: dict = Depends(get_admin_user)):
     """Get all courses including unpublished for admin"""
-    courses = await db.courses.find({}, {"_id": 0}).to_list(1000)
+    courses = await db.courses.find({}, {"_id": 0, "thumbnail_data": 0}).to_list(1000)
     return {"courses": courses}
 
 @api_router.post("/admin/courses")
@@ -3000,6 +5435,11 @@ async def admin_create_course(data: CourseCreate, current_user: dict = Depends(g
         "id": str(uuid.uuid4()),
         "instructor_id": current_user["id"],
         **data.model_dump(),
+        "rating_sum": 0,
+        "rating_count": 0,
+        "enrollment_count": 0,
+        "lesson_count": 0,
+        "module_ids": [],
         "created_at": datetime.now(timezone.utc).isoformat(),
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
@@ -3026,9 +5466,7 @@ async def admin_upload_course_thumbnail(
     file: UploadFile = File(...),
     current_user: dict = Depends(get_admin_user)
 ):
-    """Upload course thumbnail image - stores in MongoDB"""
-    import base64
-    
+    """Upload course thumbnail image to the media store"""
     # Validate file type
     allowed_types = ["image/jpeg", "image/png", "image/webp", "image/gif"]
     if file.content_type not in allowed_types:
@@ -3041,27 +5479,23 @@ async def admin_upload_course_thumbnail(
     if len(data) > 5 * 1024 * 1024:
         raise HTTPException(status_code=400, detail="File too large. Max 5MB allowed")
     
-    # Convert to Base64 for MongoDB storage
-    base64_data = base64.b64encode(data).decode('utf-8')
-    
-    # Create data URL
-    thumbnail_url = f"data:{file.content_type};base64,{base64_data}"
+    media = await store_image(data, file.content_type, "course-thumbnails")
     
     # Update course with thumbnail
     await db.courses.update_one(
         {"id": course_id},
-        {"$set": {
-            "thumbnail_url": thumbnail_url,
-            "thumbnail_data": {
-                "data": base64_data,
-                "content_type": file.content_type,
-                "filename": file.filename
+        {
+            "$set": {
+                "thumbnail_key": media["key"],
+                "thumbnail_url": media["url"],
+                "thumbnail_variants": media["variants"],
+                "updated_at": datetime.now(timezone.utc).isoformat()
             },
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
+            "$unset": {"thumbnail_data": ""}
+        }
     )
     
-    return {"message": "Thumbnail uploaded successfully", "thumbnail_url": thumbnail_url}
+    return {"message": "Thumbnail uploaded successfully", "thumbnail_url": media["url"]}
 
 @api_router.delete("/admin/courses/{course_id}/thumbnail")
 async def admin_delete_course_thumbnail(
@@ -3071,11 +5505,15 @@ async def admin_delete_course_thumbnail(
     """Remove course thumbnail"""
     await db.courses.update_one(
         {"id": course_id},
-        {"$set": {
-            "thumbnail_url": None,
-            "thumbnail_data": None,
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
+        {
+            "$set": {
+                "thumbnail_url": None,
+                "thumbnail_key": None,
+                "thumbnail_variants": None,
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            },
+            "$unset": {"thumbnail_data": ""}
+        }
     )
     return {"message": "Thumbnail removed"}
 
@@ -3083,6 +5521,8 @@ async def admin_delete_course_thumbnail(
 async def admin_delete_course(course_id: str, current_user: dict = Depends(get_admin_user)):
     await db.courses.delete_one({"id": course_id})
     await db.modules.delete_many({"course_id": course_id})
+    outline_cache.invalidate(course_id)
+    lesson_index.forget_course(course_id)
     return {"message": "Course deleted"}
 
 @api_router.post("/admin/courses/{course_id}/modules")
@@ -3095,9 +5535,12 @@ async def admin_create_module(
         "id": str(uuid.uuid4()),
         "course_id": course_id,
         **data.model_dump(),
+        "updated_seq": await next_change_seq(),
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.modules.insert_one(module)
+    await release_change_seq(module["updated_seq"])
+    await bump_course_content_version(course_id, {"$addToSet": {"module_ids": module["id"]}})
     return {"message": "Module created", "module_id": module["id"]}
 
 @api_router.post("/admin/modules/{module_id}/lessons")
@@ -3110,9 +5553,12 @@ async def admin_create_lesson(
         "id": str(uuid.uuid4()),
         "module_id": module_id,
         **data.model_dump(),
+        "updated_seq": await next_change_seq(),
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.lessons.insert_one(lesson)
+    await release_change_seq(lesson["updated_seq"])
+    await bump_course_content_version(await lesson_index.module_course(module_id), {"$inc": {"lesson_count": 1}})
     return {"message": "Lesson created", "lesson_id": lesson["id"]}
 
 @api_router.post("/admin/modules/{module_id}/quiz")
@@ -3125,9 +5571,12 @@ async def admin_create_quiz(
         "id": str(uuid.uuid4()),
         "module_id": module_id,
         **data.model_dump(),
+        "updated_seq": await next_change_seq(),
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.quizzes.insert_one(quiz)
+    await release_change_seq(quiz["updated_seq"])
+    await bump_course_content_version(await resolve_course_id(module_id=module_id))
     return {"message": "Quiz created", "quiz_id": quiz["id"]}
 
 @api_router.post("/admin/quizzes/{quiz_id}/questions")
@@ -3140,9 +5589,12 @@ async def admin_add_question(
         "id": str(uuid.uuid4()),
         "quiz_id": quiz_id,
         **data.model_dump(),
+        "updated_seq": await next_change_seq(),
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.questions.insert_one(question)
+    await release_change_seq(question["updated_seq"])
+    await bump_course_content_version(await resolve_course_id(quiz_id=quiz_id))
     return {"message": "Question added", "question_id": question["id"]}
 
 # ======================== ADMIN MODULE/LESSON UPDATE ROUTES ========================
@@ -3155,7 +5607,10 @@ async def admin_update_module(
 ):
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
     if update_data:
+        update_data["updated_seq"] = await next_change_seq()
         await db.modules.update_one({"id": module_id}, {"$set": update_data})
+        await release_change_seq(update_data["updated_seq"])
+        await bump_course_content_version(await resolve_course_id(module_id=module_id))
     return {"message": "Module updated"}
 
 @api_router.delete("/admin/modules/{module_id}")
@@ -3163,15 +5618,30 @@ async def admin_delete_module(
     module_id: str,
     current_user: dict = Depends(get_admin_user)
 ):
+    course_id = await resolve_course_id(module_id=module_id)
+    deleted = {
+        "module": [module_id],
+        "lesson": await db.lessons.distinct("id", {"module_id": module_id}),
+        "quiz": [],
+        "question": []
+    }
     # Delete all lessons in module
-    await db.lessons.delete_many({"module_id": module_id})
+    deleted_lessons = await db.lessons.delete_many({"module_id": module_id})
     # Delete all quizzes in module
     quiz = await db.quizzes.find_one({"module_id": module_id})
     if quiz:
+        deleted["quiz"].append(quiz["id"])
+        deleted["question"] = await db.questions.distinct("id", {"quiz_id": quiz["id"]})
         await db.questions.delete_many({"quiz_id": quiz["id"]})
         await db.quizzes.delete_one({"id": quiz["id"]})
     # Delete module
     await db.modules.delete_one({"id": module_id})
+    await bump_course_content_version(course_id, {
+        "$inc": {"lesson_count": -deleted_lessons.deleted_count},
+        "$pull": {"module_ids": module_id}
+    })
+    await record_deletions(course_id, deleted)
+    lesson_index.forget_module(module_id)
     return {"message": "Module deleted"}
 
 @api_router.put("/admin/lessons/{lesson_id}")
@@ -3182,7 +5652,10 @@ async def admin_update_lesson(
 ):
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
     if update_data:
+        update_data["updated_seq"] = await next_change_seq()
         await db.lessons.update_one({"id": lesson_id}, {"$set": update_data})
+        await release_change_seq(update_data["updated_seq"])
+        await bump_course_content_version(await resolve_course_id(lesson_id=lesson_id))
     return {"message": "Lesson updated"}
 
 @api_router.delete("/admin/lessons/{lesson_id}")
@@ -3190,7 +5663,12 @@ async def admin_delete_lesson(
     lesson_id: str,
     current_user: dict = Depends(get_admin_user)
 ):
-    await db.lessons.delete_one({"id": lesson_id})
+    course_id = await resolve_course_id(lesson_id=lesson_id)
+    result = await db.lessons.delete_one({"id": lesson_id})
+    await bump_course_content_version(course_id, {"$inc": {"lesson_count": -result.deleted_count}})
+    if result.deleted_count:
+        await record_deletions(course_id, {"lesson": [lesson_id]})
+    lesson_index.forget_lesson(lesson_id)
     return {"message": "Lesson deleted"}
 
 @api_router.post("/admin/lessons/{lesson_id}/thumbnail")
@@ -3198,10 +5676,8 @@ async def admin_upload_lesson_thumbnail(
     lesson_id: str,
     file: UploadFile = File(...),
     current_user: dict = Depends(get_admin_user)
-):
-    """Upload thumbnail image for a lesson - stores as base64 in MongoDB"""
-    import base64
-    
+):
+    """Upload thumbnail image for a lesson to the media store"""
     # Validate file type
     allowed_types = ["image/jpeg", "image/png", "image/webp", "image/gif"]
     if file.content_type not in allowed_types:
@@ -3214,20 +5690,27 @@ async def admin_upload_lesson_thumbnail(
     if len(data) > 2 * 1024 * 1024:
         raise HTTPException(status_code=400, detail="File too large. Max 2MB allowed")
     
-    # Convert to Base64
-    base64_data = base64.b64encode(data).decode('utf-8')
-    thumbnail_url = f"data:{file.content_type};base64,{base64_data}"
+    if not await db.lessons.find_one({"id": lesson_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Lesson not found")
+    
+    media = await store_image(data, file.content_type, "lesson-thumbnails")
     
     # Update lesson
-    result = await db.lessons.update_one(
+    seq = await next_change_seq()
+    await db.lessons.update_one(
         {"id": lesson_id},
-        {"$set": {"thumbnail_url": thumbnail_url, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {
+            "thumbnail_key": media["key"],
+            "thumbnail_url": media["url"],
+            "thumbnail_variants": media["variants"],
+            "updated_seq": seq,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }}
     )
+    await release_change_seq(seq)
+    await bump_course_content_version(await resolve_course_id(lesson_id=lesson_id))
     
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="Lesson not found")
-    
-    return {"message": "Thumbnail uploaded", "thumbnail_url": thumbnail_url}
+    return {"message": "Thumbnail uploaded", "thumbnail_url": media["url"]}
 
 @api_router.put("/admin/quizzes/{quiz_id}")
 async def admin_update_quiz(
@@ -3236,7 +5719,10 @@ async def admin_update_quiz(
     current_user: dict = Depends(get_admin_user)
 ):
     update_data = data.model_dump()
+    update_data["updated_seq"] = await next_change_seq()
     await db.quizzes.update_one({"id": quiz_id}, {"$set": update_data})
+    await release_change_seq(update_data["updated_seq"])
+    await bump_course_content_version(await resolve_course_id(quiz_id=quiz_id))
     return {"message": "Quiz updated"}
 
 @api_router.delete("/admin/quizzes/{quiz_id}")
@@ -3244,8 +5730,12 @@ async def admin_delete_quiz(
     quiz_id: str,
     current_user: dict = Depends(get_admin_user)
 ):
+    course_id = await resolve_course_id(quiz_id=quiz_id)
+    deleted = {"quiz": [quiz_id], "question": await db.questions.distinct("id", {"quiz_id": quiz_id})}
     await db.questions.delete_many({"quiz_id": quiz_id})
     await db.quizzes.delete_one({"id": quiz_id})
+    await bump_course_content_version(course_id)
+    await record_deletions(course_id, deleted)
     return {"message": "Quiz deleted"}
 
 @api_router.put("/admin/questions/{question_id}")
@@ -3255,7 +5745,10 @@ async def admin_update_question(
     current_user: dict = Depends(get_admin_user)
 ):
     update_data = data.model_dump()
+    update_data["updated_seq"] = await next_change_seq()
     await db.questions.update_one({"id": question_id}, {"$set": update_data})
+    await release_change_seq(update_data["updated_seq"])
+    await bump_course_content_version(await resolve_course_id(question_id=question_id))
     return {"message": "Question updated"}
 
 @api_router.delete("/admin/questions/{question_id}")
@@ -3263,7 +5756,10 @@ async def admin_delete_question(
     question_id: str,
     current_user: dict = Depends(get_admin_user)
 ):
+    course_id = await resolve_course_id(question_id=question_id)
     await db.questions.delete_one({"id": question_id})
+    await bump_course_content_version(course_id)
+    await record_deletions(course_id, {"question": [question_id]})
     return {"message": "Question deleted"}
 
 # ======================== ASSIGNMENT ROUTES ========================
@@ -3289,18 +5785,18 @@ async def admin_get_assignments(current_user: dict = Depends(get_admin_user)):
 @api_router.get("/admin/assignments/{assignment_id}/submissions")
 async def admin_get_submissions(
     assignment_id: str,
+    cursor: Optional[str] = None,
+    limit: int = 500,
     current_user: dict = Depends(get_admin_user)
 ):
-    submissions = await db.assignment_submissions.find(
-        {"assignment_id": assignment_id},
-        {"_id": 0}
-    ).to_list(1000)
+    submissions, next_cursor = await paginate(
+        db.assignment_submissions, {"assignment_id": assignment_id}, {"_id": 0},
+        sort_field="submitted_at", limit=limit, cursor=cursor
+    )
     
-    for sub in submissions:
-        user = await db.users.find_one({"id": sub["user_id"]}, {"_id": 0, "password": 0})
-        sub["user"] = user
+    await BatchLoader().attach(submissions, ("user_id", "user", "admin_summary"))
     
-    return {"submissions": submissions}
+    return {"submissions": submissions, "next_cursor": next_cursor}
 
 @api_router.put("/admin/submissions/{submission_id}/grade")
 async def admin_grade_submission(
@@ -3386,14 +5882,14 @@ async def get_video_presigned_upload_url(
     Get a presigned URL for direct upload to R2.
     Browser uploads directly to Cloudflare - much faster!
     """
-    if not r2_client:
+    if not r2_storage:
         raise HTTPException(status_code=500, detail="Storage not configured")
     
     ext = filename.split(".")[-1] if "." in filename else "mp4"
     object_key = f"videos/{uuid.uuid4()}.{ext}"
     
     # Generate presigned URL for upload (valid for 1 hour)
-    upload_url = get_r2_presigned_upload_url(object_key, content_type, expiry_seconds=3600)
+    upload_url = r2_storage.sign(object_key, expires_in=3600, method="put_object", content_type=content_type)
     
     if not upload_url:
         raise HTTPException(status_code=500, detail="Failed to generate upload URL")
@@ -3413,22 +5909,23 @@ async def confirm_video_upload(
     current_user: dict = Depends(get_admin_user)
 ):
     """Confirm that a direct upload completed successfully"""
-    if not r2_client:
+    if not r2_storage:
         raise HTTPException(status_code=500, detail="Storage not configured")
     
     # Verify the file exists in R2
     try:
-        response = r2_client.head_object(Bucket=R2_BUCKET_NAME, Key=video_key)
-        actual_size = response.get('ContentLength', 0)
-        return {
-            "video_key": video_key,
-            "size": actual_size,
-            "storage": "r2",
-            "status": "confirmed"
-        }
-    except ClientError as e:
+        stat = await r2_storage.head(video_key)
+    except StorageError as e:
         logger.error(f"Failed to confirm upload: {e}")
+        stat = None
+    if not stat:
         raise HTTPException(status_code=404, detail="Video not found in storage")
+    return {
+        "video_key": video_key,
+        "size": stat["size"],
+        "storage": "r2",
+        "status": "confirmed"
+    }
 
 
 @api_router.post("/admin/upload/video")
@@ -3441,11 +5938,10 @@ async def admin_upload_video(
     content_type = file.content_type or "video/mp4"
     
     # For large files, use streaming upload to R2
-    if r2_client:
+    if r2_storage:
         try:
             # Create a temporary file to stream the upload
             import tempfile
-            import shutil
             
             with tempfile.SpooledTemporaryFile(max_size=100*1024*1024) as tmp:  # 100MB in memory, then disk
                 # Stream the file in chunks
@@ -3463,11 +5959,14 @@ async def admin_upload_video(
                 tmp.seek(0)
                 
                 # Upload to R2
-                success = upload_large_file_to_r2(tmp, object_key, content_type)
-                if success:
-                    return {"video_key": object_key, "size": total_size, "storage": "r2"}
-                else:
+                try:
+                    await r2_storage.put_file(tmp, object_key, content_type)
+                except StorageError as e:
+                    logger.error(f"Failed to upload {object_key} to R2: {e}")
                     raise HTTPException(status_code=500, detail="Failed to upload video to storage")
+                return {"video_key": object_key, "size": total_size, "storage": "r2"}
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error uploading video: {e}")
             raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
@@ -3475,8 +5974,11 @@ async def admin_upload_video(
     # Fallback to emergent storage (for smaller files only)
     data = await file.read()
     path = f"{APP_NAME}/{object_key}"
-    result = put_object(path, data, content_type)
-    return {"video_key": result["path"], "size": result["size"], "storage": "emergent"}
+    try:
+        result = await fallback_storage.put(path, data, content_type)
+    except StorageError as e:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    return {"video_key": result["path"], "size": result["size"], "storage": fallback_storage.name}
 
 
 # Chunked upload endpoints for large files
@@ -3533,9 +6035,11 @@ async def upload_chunk(
     chunk_data = await file.read()
     chunk_key = f"temp_chunks/{upload_id}/chunk_{chunk_index}"
     
-    if r2_client:
-        success = upload_to_r2(chunk_data, chunk_key, "application/octet-stream")
-        if not success:
+    if r2_storage:
+        try:
+            await r2_storage.put(chunk_key, chunk_data, "application/octet-stream")
+        except StorageError as e:
+            logger.error(f"Failed to save chunk {chunk_key}: {e}")
             raise HTTPException(status_code=500, detail="Failed to save chunk")
     
     # Update session
@@ -3577,13 +6081,12 @@ async def complete_chunked_upload(
             for i in range(session["total_chunks"]):
                 chunk_key = f"temp_chunks/{upload_id}/chunk_{i}"
                 
-                if r2_client:
+                if r2_storage:
                     try:
-                        response = r2_client.get_object(Bucket=R2_BUCKET_NAME, Key=chunk_key)
-                        chunk_data = response['Body'].read()
+                        chunk_data, _ = await r2_storage.get(chunk_key)
                         combined.write(chunk_data)
                         # Delete chunk after reading
-                        r2_client.delete_object(Bucket=R2_BUCKET_NAME, Key=chunk_key)
+                        await r2_storage.delete(chunk_key)
                     except Exception as e:
                         logger.error(f"Failed to read chunk {i}: {e}")
                         raise HTTPException(status_code=500, detail=f"Failed to read chunk {i}")
@@ -3594,8 +6097,12 @@ async def complete_chunked_upload(
             ext = session["filename"].split(".")[-1] if "." in session["filename"] else "mp4"
             content_type = f"video/{ext}" if ext in ["mp4", "webm", "mov", "avi"] else "video/mp4"
             
-            success = upload_large_file_to_r2(combined, session["object_key"], content_type)
-            if not success:
+            try:
+                if not r2_storage:
+                    raise StorageError("R2 is not configured")
+                await r2_storage.put_file(combined, session["object_key"], content_type)
+            except StorageError as e:
+                logger.error(f"Failed to save final video {session['object_key']}: {e}")
                 raise HTTPException(status_code=500, detail="Failed to save final video")
         
         # Update session status
@@ -3632,17 +6139,22 @@ async def admin_upload_image(
     data = await file.read()
     
     # Try R2 first
-    if r2_client:
-        success = upload_to_r2(data, object_key, file.content_type or "image/jpeg")
-        if success:
+    if r2_storage:
+        try:
+            await r2_storage.put(object_key, data, file.content_type or "image/jpeg")
             # For images, we might want to return a signed URL immediately
-            signed_url = get_r2_signed_url(object_key, expiry_seconds=86400)  # 24 hours
+            signed_url = r2_storage.sign(object_key, expires_in=86400)  # 24 hours
             return {"image_key": object_key, "image_url": signed_url, "size": len(data), "storage": "r2"}
+        except StorageError as e:
+            logger.error(f"Failed to upload {object_key} to R2: {e}")
     
     # Fallback to emergent storage
     path = f"{APP_NAME}/{object_key}"
-    result = put_object(path, data, file.content_type or "image/jpeg")
-    return {"image_key": result["path"], "size": result["size"], "storage": "emergent"}
+    try:
+        result = await fallback_storage.put(path, data, file.content_type or "image/jpeg")
+    except StorageError as e:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    return {"image_key": result["path"], "size": result["size"], "storage": fallback_storage.name}
 
 # Admin Coupon Management
 @api_router.get("/admin/coupons")
@@ -3764,22 +6276,22 @@ async def validate_coupon(code: str, cart_total: float = 0, current_user: dict =
     }
 
 # Admin Withdrawal Management
-@api_router.get("/admin/withdrawals")
+@api_router.get("/admin/withdrawals", response_model=AdminWithdrawalsResponse)
 async def admin_get_withdrawals(
     status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
     current_user: dict = Depends(get_admin_user)
 ):
     query = {}
     if status:
         query["status"] = status
     
-    withdrawals = await db.withdrawals.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
+    withdrawals, next_cursor = await paginate(db.withdrawals, query, {"_id": 0}, limit=limit, cursor=cursor)
     
-    for w in withdrawals:
-        user = await db.users.find_one({"id": w["user_id"]}, {"_id": 0, "password": 0})
-        w["user"] = user
+    await BatchLoader().attach(withdrawals, ("user_id", "user", "admin_summary"))
     
-    return {"withdrawals": withdrawals}
+    return {"withdrawals": withdrawals, "next_cursor": next_cursor}
 
 @api_router.put("/admin/withdrawals/{withdrawal_id}")
 async def admin_update_withdrawal(
@@ -3801,6 +6313,12 @@ async def admin_update_withdrawal(
             "processed_at": datetime.now(timezone.utc).isoformat()
         }}
     )
+    pending_delta = (status == "pending") - (withdrawal["status"] == "pending")
+    if pending_delta:
+        await record_metrics(totals={
+            "pending_withdrawals": pending_delta,
+            "pending_withdrawal_amount": pending_delta * withdrawal["amount"]
+        })
     
     if status == "approved":
         # Wallet already deducted when request was made, just clear pending
@@ -3808,6 +6326,7 @@ async def admin_update_withdrawal(
             {"id": withdrawal["user_id"]},
             {"$inc": {"pending_earnings": -withdrawal["amount"]}}
         )
+        user_cache.invalidate(withdrawal["user_id"])
     elif status == "rejected":
         # Return amount to wallet
         await db.users.update_one(
@@ -3819,10 +6338,11 @@ async def admin_update_withdrawal(
                 }
             }
         )
+        user_cache.invalidate(withdrawal["user_id"])
     
     # Send email notification to user
     if user:
-        send_withdrawal_notification_email(
+        await send_withdrawal_notification_email(
             user["email"],
             user.get("first_name", "User"),
             withdrawal["amount"],
@@ -4023,17 +6543,15 @@ async def admin_delete_faq(faq_id: str, current_user: dict = Depends(get_admin_u
     return {"message": "FAQ deleted"}
 
 # Admin Ticket Management
-@api_router.get("/admin/tickets")
-async def admin_get_all_tickets(current_user: dict = Depends(get_admin_user)):
+@api_router.get("/admin/tickets", response_model=AdminTicketsResponse)
+async def admin_get_all_tickets(cursor: Optional[str] = None, limit: int = 500, current_user: dict = Depends(get_admin_user)):
     """Get all tickets for admin"""
-    tickets = await db.tickets.find({}, {"_id": 0}).sort("updated_at", -1).to_list(500)
+    tickets, next_cursor = await paginate(db.tickets, {}, {"_id": 0}, sort_field="updated_at", limit=limit, cursor=cursor)
     
     # Enrich with user info
-    for ticket in tickets:
-        user = await db.users.find_one({"id": ticket["user_id"]}, {"_id": 0, "password": 0})
-        ticket["user"] = user
+    await BatchLoader().attach(tickets, ("user_id", "user", "admin_summary"))
     
-    return {"tickets": tickets}
+    return {"tickets": tickets, "next_cursor": next_cursor}
 
 @api_router.put("/admin/tickets/{ticket_id}/status")
 async def admin_update_ticket_status(
@@ -4049,14 +6567,29 @@ async def admin_update_ticket_status(
 
 # ======================== LEADERBOARD ROUTES ========================
 
-@api_router.get("/leaderboard")
-async def get_leaderboard():
-    users = await db.users.find(
-        {"role": "student"},
-        {"_id": 0, "password": 0}
-    ).sort("points", -1).limit(50).to_list(50)
+@api_router.get("/leaderboard", response_model=LeaderboardResponse)
+async def get_leaderboard(period: str = "all"):
+    """Top learners all-time, or by points earned this week or month"""
+    if period not in LEADERBOARD_PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of {', '.join(LEADERBOARD_PERIODS)}")
+    users = await leaderboard.top() if period == "all" else await period_leaderboard(period)
+    return {"period": period, "leaderboard": assign_ranks(users)}
+
+@api_router.get("/leaderboard/me")
+async def get_my_leaderboard_rank(period: str = "all", current_user: dict = Depends(get_current_user)):
+    """The caller's rank, summed from the points histogram in at most POINTS_RANK_LEVELS buckets"""
+    if period not in LEADERBOARD_PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of {', '.join(LEADERBOARD_PERIODS)}")
+    if period == "all":
+        board = "all"
+        user = await db.users.find_one({"id": current_user["id"]}, {"_id": 0, "points": 1})
+        points = (user or {}).get("points") or 0
+    else:
+        board = points_period_keys(datetime.now(timezone.utc))[period]
+        total = await db.points_periods.find_one({"_id": f"{board}:{current_user['id']}"})
+        points = total["points"] if total else 0
     
-    return {"leaderboard": users}
+    return {"period": period, "rank": await points_rank(board, points), "points": points}
 
 # ======================== REVIEWS ROUTES ========================
 
@@ -4092,6 +6625,9 @@ async def create_review(
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.reviews.insert_one(review)
+    # Pending reviews only count towards the course rating once approved
+    if review["is_visible"]:
+        await adjust_course_rating(course_id, review["rating"], 1)
     
     return {"message": "Review submitted for approval", "review_id": review["id"]}
 
@@ -4101,6 +6637,8 @@ async def create_review(
 async def admin_get_all_reviews(
     course_id: Optional[str] = None,
     is_visible: Optional[bool] = None,
+    cursor: Optional[str] = None,
+    limit: int = 500,
     current_user: dict = Depends(get_admin_user)
 ):
     """Get all reviews with filtering options"""
@@ -4110,16 +6648,14 @@ async def admin_get_all_reviews(
     if is_visible is not None:
         query["is_visible"] = is_visible
     
-    reviews = await db.reviews.find(query, {"_id": 0}).sort("created_at", -1).to_list(500)
+    reviews, next_cursor = await paginate(db.reviews, query, {"_id": 0}, limit=limit, cursor=cursor)
     
     # Enrich with user and course info
-    for review in reviews:
-        user = await db.users.find_one({"id": review["user_id"]}, {"_id": 0, "first_name": 1, "last_name": 1, "email": 1, "avatar_url": 1})
-        review["user"] = user
-        course = await db.courses.find_one({"id": review["course_id"]}, {"_id": 0, "title": 1})
-        review["course"] = course
+    await BatchLoader().attach(
+        reviews, ("user_id", "user", "admin_summary"), ("course_id", "course", "course_title")
+    )
     
-    return {"reviews": reviews}
+    return {"reviews": reviews, "next_cursor": next_cursor}
 
 @api_router.put("/admin/reviews/{review_id}/visibility")
 async def admin_toggle_review_visibility(
@@ -4128,12 +6664,17 @@ async def admin_toggle_review_visibility(
     current_user: dict = Depends(get_admin_user)
 ):
     """Toggle review visibility"""
-    result = await db.reviews.update_one(
+    previous = await db.reviews.find_one_and_update(
         {"id": review_id},
-        {"$set": {"is_visible": is_visible, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"is_visible": is_visible, "updated_at": datetime.now(timezone.utc).isoformat()}},
+        projection={"_id": 0, "course_id": 1, "rating": 1, "is_visible": 1},
+        return_document=ReturnDocument.BEFORE
     )
-    if result.modified_count == 0:
+    if not previous:
         raise HTTPException(status_code=404, detail="Review not found")
+    if bool(previous.get("is_visible")) != is_visible:
+        sign = 1 if is_visible else -1
+        await adjust_course_rating(previous["course_id"], sign * previous["rating"], sign)
     return {"message": f"Review {'shown' if is_visible else 'hidden'} successfully"}
 
 @api_router.put("/admin/reviews/{review_id}")
@@ -4150,9 +6691,16 @@ async def admin_edit_review(
     if comment is not None:
         update_data["comment"] = comment
     
-    result = await db.reviews.update_one({"id": review_id}, {"$set": update_data})
-    if result.modified_count == 0:
+    previous = await db.reviews.find_one_and_update(
+        {"id": review_id},
+        {"$set": update_data},
+        projection={"_id": 0, "course_id": 1, "rating": 1, "is_visible": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not previous:
         raise HTTPException(status_code=404, detail="Review not found")
+    if previous.get("is_visible") and "rating" in update_data and update_data["rating"] != previous["rating"]:
+        await adjust_course_rating(previous["course_id"], update_data["rating"] - previous["rating"], 0)
     return {"message": "Review updated successfully"}
 
 @api_router.delete("/admin/reviews/{review_id}")
@@ -4161,9 +6709,14 @@ async def admin_delete_review(
     current_user: dict = Depends(get_admin_user)
 ):
     """Delete a review"""
-    result = await db.reviews.delete_one({"id": review_id})
-    if result.deleted_count == 0:
+    review = await db.reviews.find_one_and_delete(
+        {"id": review_id},
+        projection={"_id": 0, "course_id": 1, "rating": 1, "is_visible": 1}
+    )
+    if not review:
         raise HTTPException(status_code=404, detail="Review not found")
+    if review.get("is_visible"):
+        await adjust_course_rating(review["course_id"], -review["rating"], -1)
     return {"message": "Review deleted successfully"}
 
 # ======================== ENROLLED COURSES ROUTES ========================
@@ -4214,7 +6767,7 @@ async def request_certificate(
         raise HTTPException(status_code=400, detail="Certificate already generated")
     
     # Get course details
-    course = await db.courses.find_one({"id": course_id}, {"_id": 0})
+    course = await db.courses.find_one({"id": course_id}, {"_id": 0, "thumbnail_data": 0})
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     
@@ -4242,7 +6795,7 @@ async def request_certificate(
     verification_url = f"{frontend_url}/verify/{cert_id}"
     
     try:
-        send_certificate_email(
+        await send_certificate_email(
             to_email=current_user["email"],
             user_name=name_on_certificate,
             course_title=course["title"],
@@ -4316,15 +6869,13 @@ async def generate_certificate_qr(certificate_id: str, base_url: str = Query(...
 
 # Admin certificate routes
 @api_router.get("/admin/certificates")
-async def admin_get_all_certificates(current_user: dict = Depends(get_admin_user)):
+async def admin_get_all_certificates(cursor: Optional[str] = None, limit: int = 500, current_user: dict = Depends(get_admin_user)):
     """Get all certificates"""
-    certificates = await db.certificates.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    certificates, next_cursor = await paginate(db.certificates, {}, {"_id": 0}, limit=limit, cursor=cursor)
     
-    for cert in certificates:
-        user = await db.users.find_one({"id": cert["user_id"]}, {"_id": 0, "password": 0})
-        cert["user"] = user
+    await BatchLoader().attach(certificates, ("user_id", "user", "admin_summary"))
     
-    return {"certificates": certificates}
+    return {"certificates": certificates, "next_cursor": next_cursor}
 
 @api_router.get("/admin/certificate-templates")
 async def admin_get_certificate_templates(current_user: dict = Depends(get_admin_user)):
@@ -4366,59 +6917,16 @@ async def admin_unlock_certificate_name(certificate_id: str, current_user: dict
 
 # Admin notifications management
 @api_router.get("/admin/notifications")
-async def admin_get_all_notifications(current_user: dict = Depends(get_admin_user)):
+async def admin_get_all_notifications(cursor: Optional[str] = None, limit: int = 500, current_user: dict = Depends(get_admin_user)):
     """Get all sent notifications for admin"""
-    notifications = await db.admin_notifications.find({}, {"_id": 0}).sort("created_at", -1).to_list(500)
-    return {"notifications": notifications}
+    notifications, next_cursor = await paginate(db.admin_notifications, {}, {"_id": 0}, limit=limit, cursor=cursor)
+    return {"notifications": notifications, "next_cursor": next_cursor}
 
-@api_router.post("/admin/notifications/send")
-async def admin_send_notification(data: dict, current_user: dict = Depends(get_admin_user)):
-    """Send notification to users with optional email"""
-    title = data.get("title", "")
-    message = data.get("message", "")
-    notif_type = data.get("type", "announcement")
-    send_email = data.get("send_email", False)
-    user_ids = data.get("user_ids")  # None means all users
-    
-    if not title or not message:
-        raise HTTPException(status_code=400, detail="Title and message are required")
-    
-    # Get target users
-    if user_ids:
-        users = await db.users.find({"id": {"$in": user_ids}}, {"_id": 0, "id": 1, "email": 1, "first_name": 1}).to_list(1000)
-    else:
-        users = await db.users.find({}, {"_id": 0, "id": 1, "email": 1, "first_name": 1}).to_list(10000)
-    
-    # Create notification record
-    admin_notif = {
-        "id": str(uuid.uuid4()),
-        "title": title,
-        "message": message,
-        "type": notif_type,
-        "recipient_count": len(users),
-        "email_sent": send_email,
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "created_by": current_user["id"]
-    }
-    await db.admin_notifications.insert_one(admin_notif)
-    
-    # Create individual notifications for each user
-    for user in users:
-        notif = {
-            "id": str(uuid.uuid4()),
-            "user_id": user["id"],
-            "title": title,
-            "message": message,
-            "type": notif_type,
-            "is_read": False,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
-        await db.notifications.insert_one(notif)
-        
-        # Send email if requested
-        if send_email:
-            try:
-                html_content = f"""
+NOTIFICATION_INSERT_CHUNK = 1000
+NOTIFICATION_EMAIL_BATCH = 500
+
+def render_notification_email(title: str, message: str) -> str:
+    return f"""
                 <html>
                 <head>
                     <style>
@@ -4445,24 +6953,130 @@ async def admin_send_notification(data: dict, current_user: dict = Depends(get_a
                 </body>
                 </html>
                 """
-                send_email_func(user["email"], title, html_content)
-            except Exception as e:
-                logger.error(f"Failed to send email to {user['email']}: {e}")
+
+async def queue_notification_emails(notif_id: str, user_query: dict, title: str, html_content: str):
+    """Queue one outbox email per recipient in batches, recording progress on the notification"""
+    async def progress(**fields):
+        await db.admin_notifications.update_one(
+            {"id": notif_id}, {"$set": {f"email_progress.{k}": v for k, v in fields.items()}})
+    
+    await progress(status="running", started_at=datetime.now(timezone.utc).isoformat())
+    queued = 0
+    try:
+        batch = []
+        cursor = db.users.find(user_query, {"_id": 0, "email": 1}).batch_size(NOTIFICATION_EMAIL_BATCH)
+        async for user in cursor:
+            if user.get("email"):
+                batch.append(new_outbox_message(user["email"], title, html_content, source=notif_id))
+            if len(batch) >= NOTIFICATION_EMAIL_BATCH:
+                await db.email_outbox.insert_many(batch, ordered=False)
+                queued += len(batch)
+                batch = []
+                email_outbox.notify()
+                await progress(queued=queued)
+        if batch:
+            await db.email_outbox.insert_many(batch, ordered=False)
+            queued += len(batch)
+            email_outbox.notify()
+        await progress(status="completed", queued=queued, finished_at=datetime.now(timezone.utc).isoformat())
+    except Exception as e:
+        await progress(status="failed", queued=queued, error=str(e))
+        raise
+
+@api_router.post("/admin/notifications/send")
+async def admin_send_notification(data: dict, current_user: dict = Depends(get_admin_user)):
+    """Send notification to users with optional email.
+
+    Without user_ids this is a broadcast, stored once and merged into every feed
+    at read time. Emails are queued by a background job; poll
+    /admin/notifications/{id}/progress for its status.
+    """
+    title = data.get("title", "")
+    message = data.get("message", "")
+    notif_type = data.get("type", "announcement")
+    send_email = data.get("send_email", False)
+    user_ids = data.get("user_ids")  # None means all users
+    
+    if not title or not message:
+        raise HTTPException(status_code=400, detail="Title and message are required")
+    
+    now = datetime.now(timezone.utc).isoformat()
+    notif_id = str(uuid.uuid4())
+    if user_ids:
+        user_query = {"id": {"$in": user_ids}}
+        users = await db.users.find(user_query, {"_id": 0, "id": 1}).to_list(None)
+        recipient_count = len(users)
+    else:
+        user_query = {}
+        recipient_count = await db.users.count_documents({})
+    
+    # Create notification record
+    admin_notif = {
+        "id": notif_id,
+        "title": title,
+        "message": message,
+        "type": notif_type,
+        "audience": "users" if user_ids else "all",
+        "recipient_count": recipient_count,
+        "email_sent": send_email,
+        "created_at": now,
+        "created_by": current_user["id"]
+    }
+    if send_email:
+        admin_notif["email_progress"] = {"status": "queued", "total": recipient_count, "queued": 0}
+    await db.admin_notifications.insert_one(admin_notif)
+    
+    # Targeted sends still get a row per recipient, written in chunks
+    if user_ids:
+        for start in range(0, len(users), NOTIFICATION_INSERT_CHUNK):
+            await db.notifications.insert_many([
+                {
+                    "id": str(uuid.uuid4()),
+                    "user_id": user["id"],
+                    "title": title,
+                    "message": message,
+                    "type": notif_type,
+                    "is_read": False,
+                    "created_at": now
+                }
+                for user in users[start:start + NOTIFICATION_INSERT_CHUNK]
+            ], ordered=False)
+    
+    if send_email:
+        run_background_job(
+            queue_notification_emails(notif_id, user_query, title, render_notification_email(title, message)),
+            name=f"notification-email-{notif_id}"
+        )
     
-    return {"message": f"Notification sent to {len(users)} users"}
+    return {"message": f"Notification sent to {recipient_count} users", "notification_id": notif_id}
+
+@api_router.get("/admin/notifications/{notif_id}/progress")
+async def admin_notification_progress(notif_id: str, current_user: dict = Depends(get_admin_user)):
+    """Email job progress plus delivery status of the queued messages"""
+    notif = await db.admin_notifications.find_one({"id": notif_id}, {"_id": 0, "id": 1, "recipient_count": 1, "email_progress": 1})
+    if not notif:
+        raise HTTPException(status_code=404, detail="Notification not found")
+    delivery = {}
+    if notif.get("email_progress"):
+        delivery = {
+            status: await db.email_outbox.count_documents({"source": notif_id, "status": status})
+            for status in EMAIL_STATUSES
+        }
+    return {**notif, "delivery": delivery}
 
 @api_router.delete("/admin/notifications/{notif_id}")
 async def admin_delete_notification(notif_id: str, current_user: dict = Depends(get_admin_user)):
     """Delete admin notification record"""
     await db.admin_notifications.delete_one({"id": notif_id})
+    await db.notification_receipts.delete_many({"notification_id": notif_id})
     return {"message": "Notification deleted"}
 
 # Admin certificates management
 @api_router.get("/admin/certificates")
-async def admin_get_all_certificates(current_user: dict = Depends(get_admin_user)):
+async def admin_get_all_certificates(cursor: Optional[str] = None, limit: int = 500, current_user: dict = Depends(get_admin_user)):
     """Get all certificates for admin"""
-    certificates = await db.certificates.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return {"certificates": certificates}
+    certificates, next_cursor = await paginate(db.certificates, {}, {"_id": 0}, limit=limit, cursor=cursor)
+    return {"certificates": certificates, "next_cursor": next_cursor}
 
 @api_router.get("/admin/certificates/search")
 async def admin_search_certificate(certificate_id: str, current_user: dict = Depends(get_admin_user)):
@@ -4687,13 +7301,458 @@ async def assign_template_to_course(
     )
     return {"message": "Template assigned to course"}
 
+# ======================== DATABASE INDEXES & MIGRATIONS ========================
+
+# Ordered registry of schema migrations. Applied versions are recorded in the
+# `schema_migrations` collection so each entry runs at most once per database.
+# Index migrations are idempotent anyway: create_index() is a no-op when an
+# identical index already exists.
+MIGRATIONS: List[dict] = []
+
+
+def register_index_migration(version: str, description: str, indexes: Dict[str, List[IndexModel]]):
+    """Register a migration that creates the given indexes, keyed by collection"""
+    MIGRATIONS.append({
+        "version": version,
+        "description": description,
+        "indexes": indexes,
+        "apply": None,
+        "manual": False
+    })
+
+
+def register_migration(version: str, description: str, manual: bool = False):
+    """Register an async data migration `fn(dry_run: bool) -> dict`.
+
+    Manual migrations are skipped at boot and only run from manage.py.
+    """
+    def decorator(fn):
+        MIGRATIONS.append({
+            "version": version,
+            "description": description,
+            "indexes": None,
+            "apply": fn,
+            "manual": manual
+        })
+        return fn
+    return decorator
+
+
+def _unique_id_index() -> IndexModel:
+    return IndexModel([("id", ASCENDING)], unique=True, name="id_unique")
+
+
+register_index_migration("0001_unique_ids", "Unique id index on every entity collection", {
+    name: [_unique_id_index()]
+    for name in [
+        "users", "courses", "categories", "modules", "lessons", "quizzes", "questions",
+        "enrollments", "orders", "reviews", "certificates", "certificate_templates",
+        "cart", "wishlist", "notifications", "admin_notifications", "tickets",
+        "friendships", "messages", "withdrawals", "referral_earnings", "coupons",
+        "assignments", "assignment_submissions", "faqs", "r2_buckets"
+    ]
+})
+
+register_index_migration("0002_lookup_indexes", "Indexes for the equality lookups used by routes", {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel(
+            [("referral_code", ASCENDING)], unique=True, name="referral_code_unique",
+            partialFilterExpression={"referral_code": {"$type": "string"}}
+        ),
+        IndexModel([("referred_by", ASCENDING)]),
+    ],
+    "enrollments": [
+        IndexModel([("user_id", ASCENDING), ("course_id", ASCENDING)]),
+        IndexModel([("course_id", ASCENDING)]),
+    ],
+    "lesson_progress": [
+        IndexModel([("lesson_id", ASCENDING), ("user_id", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("is_completed", ASCENDING)]),
+    ],
+    "quiz_attempts": [IndexModel([("quiz_id", ASCENDING), ("user_id", ASCENDING)])],
+    "orders": [
+        IndexModel(
+            [("txn_id", ASCENDING)], unique=True, name="txn_id_unique",
+            partialFilterExpression={"txn_id": {"$type": "string"}}
+        ),
+    ],
+    "certificates": [
+        IndexModel(
+            [("certificate_id", ASCENDING)], unique=True, name="certificate_id_unique",
+            partialFilterExpression={"certificate_id": {"$type": "string"}}
+        ),
+        IndexModel([("user_id", ASCENDING), ("course_id", ASCENDING)]),
+    ],
+    "modules": [IndexModel([("course_id", ASCENDING), ("order", ASCENDING)])],
+    "lessons": [IndexModel([("module_id", ASCENDING), ("order", ASCENDING)])],
+    "quizzes": [IndexModel([("module_id", ASCENDING)])],
+    "questions": [IndexModel([("quiz_id", ASCENDING)])],
+    "reviews": [IndexModel([("course_id", ASCENDING), ("user_id", ASCENDING)])],
+    "cart": [IndexModel([("user_id", ASCENDING), ("course_id", ASCENDING)])],
+    "wishlist": [IndexModel([("user_id", ASCENDING), ("course_id", ASCENDING)])],
+    "friendships": [
+        IndexModel([("user_id", ASCENDING), ("friend_id", ASCENDING)]),
+        IndexModel([("friend_id", ASCENDING), ("status", ASCENDING)]),
+    ],
+    "coupons": [IndexModel([("code", ASCENDING)])],
+    "coupon_uses": [IndexModel([("coupon_id", ASCENDING)])],
+    "password_resets": [IndexModel([("token", ASCENDING)])],
+    "upload_sessions": [IndexModel([("upload_id", ASCENDING)])],
+    "assignment_submissions": [IndexModel([("assignment_id", ASCENDING), ("user_id", ASCENDING)])],
+    "assignments": [IndexModel([("course_id", ASCENDING)])],
+    "cms": [IndexModel([("slug", ASCENDING)])],
+    "settings": [IndexModel([("type", ASCENDING)])],
+})
+
+register_index_migration("0003_listing_indexes", "Indexes backing sorted list routes and dashboards", {
+    "courses": [IndexModel([("is_published", ASCENDING), ("created_at", DESCENDING)])],
+    "orders": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "reviews": [IndexModel([("course_id", ASCENDING), ("is_visible", ASCENDING), ("created_at", DESCENDING)])],
+    "notifications": [IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)])],
+    "messages": [IndexModel([("sender_id", ASCENDING), ("recipient_id", ASCENDING), ("created_at", ASCENDING)])],
+    "login_logs": [
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)]),
+        IndexModel([("timestamp", DESCENDING)]),
+    ],
+    "referral_earnings": [IndexModel([("referrer_id", ASCENDING), ("created_at", DESCENDING)])],
+    "withdrawals": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "tickets": [IndexModel([("user_id", ASCENDING), ("updated_at", DESCENDING)])],
+    "video_access_logs": [IndexModel([("user_id", ASCENDING), ("accessed_at", DESCENDING)])],
+    "faqs": [IndexModel([("is_published", ASCENDING), ("order", ASCENDING)])],
+})
+
+register_index_migration("0005_media_objects", "Lookup index for stored media", {
+    "media_objects": [IndexModel([("key", ASCENDING)], unique=True, name="key_unique")],
+})
+
+register_index_migration("0007_email_outbox", "Indexes for claiming and reporting queued emails", {
+    "email_outbox": [
+        _unique_id_index(),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("lease_expires_at", ASCENDING)]),
+        IndexModel([("created_at", DESCENDING)]),
+    ],
+})
+
+register_index_migration("0008_notification_broadcasts", "Indexes for broadcasts merged into feeds at read time", {
+    "admin_notifications": [IndexModel([("audience", ASCENDING), ("created_at", DESCENDING)])],
+    "notification_receipts": [
+        IndexModel([("user_id", ASCENDING), ("notification_id", ASCENDING)], unique=True, name="user_notification_unique"),
+        IndexModel([("notification_id", ASCENDING)]),
+    ],
+    "email_outbox": [IndexModel([("source", ASCENDING), ("status", ASCENDING)], sparse=True)],
+})
+
+register_index_migration("0010_change_sequence", "Indexes for delta sync by updated_seq", {
+    "modules": [IndexModel([("course_id", ASCENDING), ("updated_seq", ASCENDING)])],
+    "lessons": [IndexModel([("module_id", ASCENDING), ("updated_seq", ASCENDING)])],
+    "questions": [IndexModel([("quiz_id", ASCENDING), ("updated_seq", ASCENDING)])],
+    "lesson_progress": [IndexModel([("user_id", ASCENDING), ("updated_seq", ASCENDING)])],
+    "change_tombstones": [IndexModel([("course_id", ASCENDING), ("updated_seq", ASCENDING)])],
+})
+
+register_index_migration("0011_keyset_pagination", "Compound (filter, sort key, id) indexes for cursor-paged lists", {
+    "courses": [IndexModel([("is_published", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)])],
+    "users": [
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("role", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "orders": [IndexModel([("user_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)])],
+    "tickets": [
+        IndexModel([("updated_at", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("updated_at", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "reviews": [
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("course_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "certificates": [IndexModel([("created_at", ASCENDING), ("id", ASCENDING)])],
+    "withdrawals": [
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "referral_earnings": [IndexModel([("referrer_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)])],
+    "admin_notifications": [IndexModel([("created_at", ASCENDING), ("id", ASCENDING)])],
+    "assignment_submissions": [
+        IndexModel([("assignment_id", ASCENDING), ("submitted_at", ASCENDING), ("id", ASCENDING)]),
+    ],
+})
+
+register_index_migration("0012_points_leaderboard", "Points event log and period totals for leaderboards", {
+    "users": [IndexModel([("role", ASCENDING), ("points", DESCENDING), ("id", ASCENDING)])],
+    "points_events": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("created_at", DESCENDING)]),
+    ],
+    "points_periods": [IndexModel([("period", ASCENDING), ("points", DESCENDING), ("user_id", ASCENDING)])],
+})
+
+register_index_migration("0013_dashboard_metrics_indexes", "Index for counting recently active users", {
+    "users": [IndexModel([("last_login_at", ASCENDING)], sparse=True)],
+})
+
+
+def _summarize_plan(explain: dict) -> str:
+    """Reduce an explain() result to its winning stage chain, e.g. FETCH > IXSCAN(email_unique)"""
+    plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+    plan = plan.get("queryPlan", plan)
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage = f"{stage}({plan['indexName']})"
+        stages.append(stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return " > ".join(stages) or "unknown"
+
+
+def _probe_query(index: IndexModel) -> dict:
+    """Build an equality query over the index keys, used only for explain()"""
+    return {field: "__probe__" for field, _ in index.document["key"].items()}
+
+
+async def _explain_probe(collection: str, query: dict) -> str:
+    try:
+        result = await db.command("explain", {"find": collection, "filter": query}, verbosity="queryPlanner")
+        return _summarize_plan(result)
+    except Exception as e:
+        return f"explain failed: {e}"
+
+
+async def _apply_index_migration(migration: dict, dry_run: bool, explain: bool) -> dict:
+    report = []
+    errors = []
+    for collection, indexes in migration["indexes"].items():
+        for index in indexes:
+            probe = _probe_query(index)
+            entry = {"collection": collection, "index": index.document["name"], "probe": probe}
+            if dry_run or explain:
+                entry["before"] = await _explain_probe(collection, probe)
+            if dry_run:
+                entry["after"] = f"IXSCAN({index.document['name']}) once built"
+            else:
+                try:
+                    await db[collection].create_indexes([index])
+                except Exception as e:
+                    errors.append(f"{collection}.{index.document['name']}: {e}")
+                    entry["error"] = str(e)
+                if explain:
+                    entry["after"] = await _explain_probe(collection, probe)
+            report.append(entry)
+    if errors:
+        raise RuntimeError("; ".join(errors))
+    return {"indexes": report}
+
+
+async def apply_migrations(
+    dry_run: bool = False,
+    explain: bool = False,
+    only: Optional[List[str]] = None,
+    include_manual: bool = False
+) -> List[dict]:
+    """Apply pending migrations in version order and record them in schema_migrations.
+
+    A failed migration is logged and left unrecorded so the next boot retries it;
+    later migrations still run. With dry_run nothing is written.
+    """
+    applied = {
+        doc["_id"] for doc in await db.schema_migrations.find({}, {"_id": 1}).to_list(None)
+    }
+    results = []
+    for migration in sorted(MIGRATIONS, key=lambda m: m["version"]):
+        version = migration["version"]
+        if only is not None:
+            if version not in only:
+                continue
+        elif migration["manual"] and not include_manual:
+            continue
+        result = {"version": version, "description": migration["description"]}
+        if version in applied and only is None:
+            result["status"] = "already applied"
+            results.append(result)
+            continue
+
+        started = time.monotonic()
+        try:
+            if migration["indexes"] is not None:
+                result.update(await _apply_index_migration(migration, dry_run, explain))
+            else:
+                result.update(await migration["apply"](dry_run) or {})
+        except Exception as e:
+            logger.error(f"Migration {version} failed: {e}")
+            result["status"] = "failed"
+            result["error"] = str(e)
+            results.append(result)
+            continue
+
+        duration_ms = int((time.monotonic() - started) * 1000)
+        if dry_run:
+            result["status"] = "pending"
+        else:
+            await db.schema_migrations.update_one(
+                {"_id": version},
+                {"$set": {
+                    "description": migration["description"],
+                    "applied_at": datetime.now(timezone.utc).isoformat(),
+                    "duration_ms": duration_ms
+                }},
+                upsert=True
+            )
+            result["status"] = "applied"
+            logger.info(f"Applied migration {version} in {duration_ms}ms")
+        results.append(result)
+    return results
+
+
+@register_migration("0004_course_counters", "Backfill rating and enrollment counters on courses")
+async def _backfill_course_counters(dry_run: bool) -> dict:
+    result = await reconcile_course_counters(dry_run=dry_run)
+    return {"courses_checked": result["courses_checked"], "drifted": result["drifted"]}
+
+
+@register_migration("0009_course_structure", "Backfill lesson_count and module_ids on courses")
+async def _backfill_course_structure(dry_run: bool) -> dict:
+    result = await reconcile_course_counters(dry_run=dry_run)
+    return {"courses_checked": result["courses_checked"], "drifted": result["drifted"]}
+
+
+@register_migration("0014_dashboard_metrics", "Backfill daily dashboard rollups, totals and last logins")
+async def _backfill_dashboard_metrics(dry_run: bool) -> dict:
+    result = await rebuild_dashboard_metrics(dry_run=dry_run)
+    return {"days": result["days"], "users_with_logins": result["users_with_logins"]}
+
+
+CHANGE_SEQ_COLLECTIONS = ("modules", "lessons", "quizzes", "questions", "lesson_progress", "quiz_attempts")
+
+
+@register_migration("0015_change_sequence_backfill", "Stamp updated_seq on rows written before delta sync")
+async def _backfill_change_seq(dry_run: bool) -> dict:
+    """Give every row without updated_seq one freshly reserved value.
+
+    Clients that synced before this runs receive those rows once more.
+    """
+    missing = {"updated_seq": {"$exists": False}}
+    if dry_run:
+        return {name: await db[name].count_documents(missing) for name in CHANGE_SEQ_COLLECTIONS}
+    seq = await next_change_seq()
+    counts = {name: (await db[name].update_many(missing, {"$set": {"updated_seq": seq}})).modified_count
+              for name in CHANGE_SEQ_COLLECTIONS}
+    await release_change_seq(seq)
+    return counts
+
+
+@register_migration("0016_drop_role_points_index", "Drop the (role, points) users index superseded by 0012")
+async def _drop_role_points_index(dry_run: bool) -> dict:
+    """0012's (role, points, id) index serves every query the 0002 prefix did"""
+    name = "role_1_points_-1"
+    present = name in await db.users.index_information()
+    if present and not dry_run:
+        await db.users.drop_index(name)
+    return {"dropped": [name] if present else []}
+
+
+@register_migration("0017_points_rank_buckets", "Build the points histogram behind leaderboard ranks")
+async def _backfill_points_rank_buckets(dry_run: bool) -> dict:
+    return await rebuild_points_rank_buckets(dry_run=dry_run)
+
+
+@register_migration("0006_externalize_images", "Move embedded base64 images into the media store", manual=True)
+async def _externalize_embedded_images(dry_run: bool) -> dict:
+    """Upload profile pictures and course/lesson thumbnails stored inline and keep only key + URL.
+
+    Manual because it streams every image through object storage; run it with
+    `manage.py migrate-images`. Safe to re-run: moved documents no longer match.
+    """
+    import base64
+    counts = {"users": 0, "courses": 0, "lessons": 0, "failed": 0}
+    
+    async for user in db.users.find({"profile_image.data": {"$exists": True}}, {"_id": 0, "id": 1, "profile_image": 1}):
+        counts["users"] += 1
+        if dry_run:
+            continue
+        try:
+            image = user["profile_image"]
+            media = await store_image(base64.b64decode(image["data"]), image.get("content_type", "image/jpeg"), "avatars")
+            await db.users.update_one(
+                {"id": user["id"]},
+                {"$set": {"profile_image_key": media["key"], "profile_image_url": media["url"],
+                          "profile_image_variants": media["variants"]},
+                 "$unset": {"profile_image": ""}}
+            )
+            user_cache.invalidate(user["id"])
+        except Exception as e:
+            counts["failed"] += 1
+            logger.error(f"Failed to move profile image for user {user['id']}: {e}")
+    
+    async for course in db.courses.find(
+        {"$or": [{"thumbnail_data.data": {"$exists": True}}, {"thumbnail_url": {"$regex": "^data:"}}]},
+        {"_id": 0, "id": 1, "thumbnail_url": 1, "thumbnail_data": 1}
+    ):
+        counts["courses"] += 1
+        if dry_run:
+            continue
+        try:
+            embedded = course.get("thumbnail_data") or {}
+            if embedded.get("data"):
+                data, content_type = base64.b64decode(embedded["data"]), embedded.get("content_type", "image/jpeg")
+            else:
+                data, content_type = parse_data_url(course["thumbnail_url"])
+            media = await store_image(data, content_type, "course-thumbnails")
+            await db.courses.update_one(
+                {"id": course["id"]},
+                {"$set": {"thumbnail_key": media["key"], "thumbnail_url": media["url"],
+                          "thumbnail_variants": media["variants"]},
+                 "$unset": {"thumbnail_data": ""}}
+            )
+        except Exception as e:
+            counts["failed"] += 1
+            logger.error(f"Failed to move thumbnail for course {course['id']}: {e}")
+    
+    async for lesson in db.lessons.find({"thumbnail_url": {"$regex": "^data:"}}, {"_id": 0, "id": 1, "thumbnail_url": 1}):
+        counts["lessons"] += 1
+        if dry_run:
+            continue
+        try:
+            data, content_type = parse_data_url(lesson["thumbnail_url"])
+            media = await store_image(data, content_type, "lesson-thumbnails")
+            # Stamped and versioned like admin_upload_lesson_thumbnail, so delta
+            # sync and the outline cache stop serving the data: URL
+            seq = await next_change_seq()
+            await db.lessons.update_one(
+                {"id": lesson["id"]},
+                {"$set": {"thumbnail_key": media["key"], "thumbnail_url": media["url"],
+                          "thumbnail_variants": media["variants"], "updated_seq": seq}}
+            )
+            await release_change_seq(seq)
+            await bump_course_content_version(await resolve_course_id(lesson_id=lesson["id"]))
+        except Exception as e:
+            counts["failed"] += 1
+            logger.error(f"Failed to move thumbnail for lesson {lesson['id']}: {e}")
+    
+    if counts["failed"]:
+        raise RuntimeError(f"{counts['failed']} images could not be moved; re-run to retry")
+    return counts
+
+
 @fastapi_app.on_event("startup")
 async def startup():
-    try:
-        init_storage()
+    if fallback_storage is emergent_storage and await emergent_storage.init():
         logger.info("Storage initialized")
+
+    await apply_migrations()
+    try:
+        await bucket_registry.warm()
     except Exception as e:
-        logger.warning(f"Storage init failed: {e}")
+        logger.warning(f"Could not warm R2 bucket clients: {e}")
+    email_outbox.start()
+    progress_buffer.start()
     
     # Create admin user if not exists
     admin = await db.users.find_one({"email": "admin@lumina.com"})
@@ -4701,7 +7760,7 @@ async def startup():
         admin_user = {
             "id": str(uuid.uuid4()),
             "email": "admin@lumina.com",
-            "password": hash_password("admin123"),
+            "password": await hash_password_async("admin123"),
             "first_name": "Admin",
             "last_name": "User",
             "role": "admin",
@@ -4965,10 +8024,11 @@ async def create_r2_bucket(data: R2BucketCreate, current_user: dict = Depends(ge
     
     # Test connection
     try:
-        test_client = get_r2_client_for_bucket(bucket)
-        if test_client:
-            test_client.list_objects_v2(Bucket=data.bucket_name, MaxKeys=1)
+        bucket_storage = bucket_registry.for_config(bucket)
+        if bucket_storage:
+            await bucket_storage.list(limit=1)
     except Exception as e:
+        bucket_registry.invalidate(bucket["id"])
         raise HTTPException(status_code=400, detail=f"Failed to connect to bucket: {str(e)}")
     
     await db.r2_buckets.insert_one(bucket)
@@ -4990,6 +8050,7 @@ async def update_r2_bucket(bucket_id: str, data: R2BucketUpdate, current_user: d
     if update_data:
         update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
         await db.r2_buckets.update_one({"id": bucket_id}, {"$set": update_data})
+        bucket_registry.refresh(bucket_id)
     
     return {"message": "R2 bucket updated"}
 
@@ -4998,6 +8059,7 @@ async def update_r2_bucket(bucket_id: str, data: R2BucketUpdate, current_user: d
 async def delete_r2_bucket(bucket_id: str, current_user: dict = Depends(get_admin_user)):
     """Delete an R2 bucket configuration"""
     result = await db.r2_buckets.delete_one({"id": bucket_id})
+    bucket_registry.invalidate(bucket_id)
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Bucket not found")
     return {"message": "R2 bucket deleted"}
@@ -5006,16 +8068,15 @@ async def delete_r2_bucket(bucket_id: str, current_user: dict = Depends(get_admi
 @api_router.post("/admin/settings/r2-buckets/{bucket_id}/test")
 async def test_r2_bucket(bucket_id: str, current_user: dict = Depends(get_admin_user)):
     """Test connection to an R2 bucket"""
-    bucket = await db.r2_buckets.find_one({"id": bucket_id})
+    bucket = await bucket_registry.config(bucket_id)
     if not bucket:
         raise HTTPException(status_code=404, detail="Bucket not found")
     
     try:
-        test_client = get_r2_client_for_bucket(bucket)
-        if test_client:
-            response = test_client.list_objects_v2(Bucket=bucket["bucket_name"], MaxKeys=5)
-            object_count = len(response.get("Contents", []))
-            return {"status": "connected", "objects_found": object_count}
+        bucket_storage = bucket_registry.for_config(bucket)
+        if bucket_storage:
+            objects = await bucket_storage.list(limit=5)
+            return {"status": "connected", "objects_found": len(objects)}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Connection failed: {str(e)}")
 
@@ -5023,40 +8084,19 @@ async def test_r2_bucket(bucket_id: str, current_user: dict = Depends(get_admin_
 @api_router.get("/admin/settings/r2-buckets/{bucket_id}/usage")
 async def get_r2_bucket_usage(bucket_id: str, current_user: dict = Depends(get_admin_user)):
     """Get storage usage stats for an R2 bucket"""
-    bucket = await db.r2_buckets.find_one({"id": bucket_id})
+    bucket = await bucket_registry.config(bucket_id)
     if not bucket:
         raise HTTPException(status_code=404, detail="Bucket not found")
     
     try:
-        r2_client_bucket = get_r2_client_for_bucket(bucket)
-        if not r2_client_bucket:
+        bucket_storage = bucket_registry.for_config(bucket)
+        if not bucket_storage:
             raise HTTPException(status_code=500, detail="Failed to create R2 client")
         
         # Get all objects in the bucket
-        total_size = 0
-        total_objects = 0
-        continuation_token = None
-        
-        while True:
-            if continuation_token:
-                response = r2_client_bucket.list_objects_v2(
-                    Bucket=bucket["bucket_name"],
-                    ContinuationToken=continuation_token
-                )
-            else:
-                response = r2_client_bucket.list_objects_v2(
-                    Bucket=bucket["bucket_name"]
-                )
-            
-            contents = response.get("Contents", [])
-            for obj in contents:
-                total_size += obj.get("Size", 0)
-                total_objects += 1
-            
-            if response.get("IsTruncated"):
-                continuation_token = response.get("NextContinuationToken")
-            else:
-                break
+        usage = await bucket_storage.usage()
+        total_size = usage["bytes"]
+        total_objects = usage["objects"]
         
         # Convert bytes to human readable
         size_gb = total_size / (1024 * 1024 * 1024)
@@ -5091,8 +8131,8 @@ async def get_all_r2_buckets_usage(current_user: dict = Depends(get_admin_user))
     results = []
     for bucket in buckets:
         try:
-            r2_client_bucket = get_r2_client_for_bucket(bucket)
-            if not r2_client_bucket:
+            bucket_storage = bucket_registry.for_config(bucket)
+            if not bucket_storage:
                 results.append({
                     "bucket_id": bucket["id"],
                     "bucket_name": bucket["bucket_name"],
@@ -5102,30 +8142,9 @@ async def get_all_r2_buckets_usage(current_user: dict = Depends(get_admin_user))
                 continue
             
             # Get all objects
-            total_size = 0
-            total_objects = 0
-            continuation_token = None
-            
-            while True:
-                if continuation_token:
-                    response = r2_client_bucket.list_objects_v2(
-                        Bucket=bucket["bucket_name"],
-                        ContinuationToken=continuation_token
-                    )
-                else:
-                    response = r2_client_bucket.list_objects_v2(
-                        Bucket=bucket["bucket_name"]
-                    )
-                
-                contents = response.get("Contents", [])
-                for obj in contents:
-                    total_size += obj.get("Size", 0)
-                    total_objects += 1
-                
-                if response.get("IsTruncated"):
-                    continuation_token = response.get("NextContinuationToken")
-                else:
-                    break
+            usage = await bucket_storage.usage()
+            total_size = usage["bytes"]
+            total_objects = usage["objects"]
             
             size_gb = total_size / (1024 * 1024 * 1024)
             size_mb = total_size / (1024 * 1024)
@@ -5180,6 +8199,7 @@ async def update_email_settings(data: EmailSettingsUpdate, current_user: dict =
         {"$set": update_data},
         upsert=True
     )
+    invalidate_smtp_settings()
     return {"message": "Email settings updated"}
 
 
@@ -5190,30 +8210,25 @@ async def test_email_settings(test_email: str, current_user: dict = Depends(get_
     if not settings:
         raise HTTPException(status_code=400, detail="Email settings not configured")
     
+    # Sent directly rather than queued so the admin sees the SMTP error, if any
+    connection = SMTPConnection()
     try:
-        import smtplib
-        from email.mime.text import MIMEText
-        from email.mime.multipart import MIMEMultipart
-        
         msg = MIMEMultipart()
         msg['From'] = settings.get("smtp_from_email", settings.get("smtp_user"))
         msg['To'] = test_email
         msg['Subject'] = "LUMINA LMS - Test Email"
         msg.attach(MIMEText("This is a test email from LUMINA LMS. Your email settings are working correctly!", 'plain'))
         
-        if settings.get("smtp_use_ssl", True):
-            server = smtplib.SMTP_SSL(settings["smtp_host"], settings.get("smtp_port", 465))
-        else:
-            server = smtplib.SMTP(settings["smtp_host"], settings.get("smtp_port", 587))
-            server.starttls()
-        
-        server.login(settings["smtp_user"], settings["smtp_password"])
-        server.send_message(msg)
-        server.quit()
+        if not settings.get("smtp_use_ssl", True):
+            # A copy: settings is the cached dict shared with every other sender
+            settings = {"smtp_port": 587, **settings}
+        await connection.send(settings, msg, test_email)
         
         return {"message": f"Test email sent to {test_email}"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to send email: {str(e)}")
+    finally:
+        await connection.close()
 
 
 @api_router.post("/admin/settings/email/logo")
@@ -5238,15 +8253,10 @@ async def upload_email_logo(file: UploadFile = File(...), current_user: dict = D
     if r2_settings and r2_settings.get("buckets"):
         try:
             default_bucket = r2_settings["buckets"][0]
-            r2_cli = get_r2_client_for_bucket(default_bucket)
-            if r2_cli:
+            bucket_storage = bucket_registry.for_config(default_bucket)
+            if bucket_storage:
                 object_key = f"email-logo-{uuid.uuid4()}.{file_ext}"
-                r2_cli.put_object(
-                    Bucket=default_bucket["bucket_name"],
-                    Key=object_key,
-                    Body=contents,
-                    ContentType=file.content_type
-                )
+                await bucket_storage.put(object_key, contents, file.content_type)
                 logo_url = f"{default_bucket.get('public_url', '').rstrip('/')}/{object_key}"
         except Exception as e:
             logger.error(f"R2 upload failed: {e}")
@@ -5262,6 +8272,7 @@ async def upload_email_logo(file: UploadFile = File(...), current_user: dict = D
         {"$set": {"email_logo_url": logo_url, "updated_at": datetime.now(timezone.utc).isoformat()}},
         upsert=True
     )
+    invalidate_smtp_settings()
     
     return {"message": "Logo uploaded successfully", "logo_url": logo_url}
 
@@ -5273,9 +8284,43 @@ async def delete_email_logo(current_user: dict = Depends(get_admin_user)):
         {"type": "email"},
         {"$unset": {"email_logo_url": ""}, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
     )
+    invalidate_smtp_settings()
     return {"message": "Logo removed successfully"}
 
 
+@api_router.get("/admin/email/outbox")
+async def get_email_outbox_stats(current_user: dict = Depends(get_admin_user)):
+    """Queue depth by status plus this worker's delivery counters"""
+    return await email_outbox.stats()
+
+
+@api_router.get("/admin/email/outbox/messages")
+async def get_email_outbox_messages(
+    status: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 50,
+    current_user: dict = Depends(get_admin_user)
+):
+    query = {"status": status} if status else {}
+    messages = await db.email_outbox.find(query, {"_id": 0, "html": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    total = await db.email_outbox.count_documents(query)
+    return {"messages": messages, "total": total}
+
+
+@api_router.post("/admin/email/outbox/{message_id}/retry")
+async def retry_email_outbox_message(message_id: str, current_user: dict = Depends(get_admin_user)):
+    """Requeue a failed message with a fresh attempt budget"""
+    now = datetime.now(timezone.utc).isoformat()
+    result = await db.email_outbox.update_one(
+        {"id": message_id, "status": "failed"},
+        {"$set": {"status": "pending", "attempts": 0, "next_attempt_at": now, "updated_at": now}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Failed message not found")
+    email_outbox.notify()
+    return {"message": "Email requeued"}
+
+
 @api_router.get("/admin/settings/general")
 async def get_general_settings(current_user: dict = Depends(get_admin_user)):
     """Get general site settings"""
@@ -5350,7 +8395,7 @@ async def upload_video_to_bucket(
     current_user: dict = Depends(get_admin_user)
 ):
     """Upload video to a specific R2 bucket"""
-    bucket = await db.r2_buckets.find_one({"id": bucket_id})
+    bucket = await bucket_registry.config(bucket_id)
     if not bucket:
         raise HTTPException(status_code=404, detail="Bucket not found")
     
@@ -5359,12 +8404,11 @@ async def upload_video_to_bucket(
     content_type = file.content_type or "video/mp4"
     
     try:
-        bucket_client = get_r2_client_for_bucket(bucket)
-        if not bucket_client:
+        bucket_storage = bucket_registry.for_config(bucket)
+        if not bucket_storage:
             raise HTTPException(status_code=500, detail="Failed to connect to bucket")
         
         import tempfile
-        from boto3.s3.transfer import TransferConfig
         
         with tempfile.SpooledTemporaryFile(max_size=100*1024*1024) as tmp:
             total_size = 0
@@ -5378,21 +8422,7 @@ async def upload_video_to_bucket(
                 total_size += len(chunk)
             
             tmp.seek(0)
-            
-            config = TransferConfig(
-                multipart_threshold=50 * 1024 * 1024,
-                max_concurrency=10,
-                multipart_chunksize=50 * 1024 * 1024,
-                use_threads=True
-            )
-            
-            bucket_client.upload_fileobj(
-                tmp,
-                bucket["bucket_name"],
-                object_key,
-                Config=config,
-                ExtraArgs={'ContentType': content_type}
-            )
+            await bucket_storage.put_file(tmp, object_key, content_type)
             
             return {
                 "video_key": object_key,
@@ -5432,23 +8462,34 @@ async def bulk_import_users(
     created = 0
     errors = []
     
-    for row in reader:
+    rows = [row for row in reader if row.get('email', '').strip()]
+    emails = [row['email'].strip() for row in rows]
+    existing_emails = set(await db.users.distinct("email", {"email": {"$in": emails}}))
+    
+    # Hash every new user's password concurrently on the password pool
+    new_rows = []
+    for row in rows:
+        email = row['email'].strip()
+        if email in existing_emails:
+            errors.append(f"{email}: Already exists")
+            continue
+        existing_emails.add(email)
+        new_rows.append(row)
+    hashes = await asyncio.gather(
+        *[hash_password_async(row.get('password', 'Welcome@123')) for row in new_rows],
+        return_exceptions=True
+    )
+    
+    for row, password_hash in zip(new_rows, hashes):
         try:
-            email = row.get('email', '').strip()
-            if not email:
-                continue
-                
-            # Check if user exists
-            existing = await db.users.find_one({"email": email})
-            if existing:
-                errors.append(f"{email}: Already exists")
-                continue
-            
+            if isinstance(password_hash, Exception):
+                raise password_hash
+            email = row['email'].strip()
             user_id = str(uuid.uuid4())
             user_doc = {
                 "id": user_id,
                 "email": email,
-                "password": hash_password(row.get('password', 'Welcome@123')),
+                "password": password_hash,
                 "first_name": row.get('first_name', '').strip(),
                 "last_name": row.get('last_name', '').strip(),
                 "role": "student",
@@ -5473,7 +8514,7 @@ async def bulk_export_users(current_user: dict = Depends(get_admin_user)):
     import csv
     import io
     
-    users = await db.users.find({}, {"_id": 0, "password": 0}).to_list(10000)
+    users = await db.users.find({}, {"_id": 0, "password": 0, "profile_image": 0}).to_list(10000)
     
     output = io.StringIO()
     fieldnames = ['id', 'email', 'first_name', 'last_name', 'role', 'is_verified', 'created_at', 'wallet_balance']
@@ -5497,7 +8538,7 @@ async def bulk_enroll_users(
     current_user: dict = Depends(get_admin_user)
 ):
     """Enroll multiple users in a course"""
-    course = await db.courses.find_one({"id": data.course_id}, {"_id": 0})
+    course = await db.courses.find_one({"id": data.course_id}, {"_id": 0, "thumbnail_data": 0})
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     
@@ -5526,6 +8567,7 @@ async def bulk_enroll_users(
                 "assignment_note": "Bulk enrollment by admin"
             }
             await db.enrollments.insert_one(enrollment)
+            await adjust_course_enrollments(data.course_id, 1)
             enrolled += 1
         except Exception as e:
             errors.append(f"{user_id}: {str(e)}")
@@ -5538,7 +8580,7 @@ async def bulk_generate_certificates(
     current_user: dict = Depends(get_admin_user)
 ):
     """Generate certificates for multiple users"""
-    course = await db.courses.find_one({"id": data.course_id}, {"_id": 0})
+    course = await db.courses.find_one({"id": data.course_id}, {"_id": 0, "thumbnail_data": 0})
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     
@@ -5576,7 +8618,7 @@ async def bulk_generate_certificates(
             generated += 1
             
             # Send certificate email
-            send_certificate_email(
+            await send_certificate_email(
                 user.get("email"),
                 certificate["user_name"],
                 course.get("title"),
@@ -5602,12 +8644,11 @@ async def generate_user_progress_report(
     from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
     import io
     
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0, "profile_image": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Get enrollments
-    enrollments = await db.enrollments.find({"user_id": user_id}, {"_id": 0}).to_list(100)
+    course_progress = await learner_course_progress(user_id)
     
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4)
@@ -5631,13 +8672,11 @@ async def generate_user_progress_report(
     
     table_data = [['Course', 'Progress', 'Status', 'Enrolled Date']]
     
-    for enrollment in enrollments:
-        course = await db.courses.find_one({"id": enrollment["course_id"]}, {"_id": 0})
-        if course:
-            status = "Completed" if enrollment.get("is_completed") else "In Progress"
-            progress = f"{enrollment.get('progress', 0)}%"
-            enrolled = enrollment.get('enrolled_at', '')[:10]
-            table_data.append([course.get('title', '')[:30], progress, status, enrolled])
+    for row in course_progress:
+        status = "Completed" if row["is_completed"] else "In Progress"
+        progress = f"{100 if row['is_completed'] else row['progress_percentage']}%"
+        enrolled = (row.get('enrolled_at') or '')[:10]
+        table_data.append([(row.get('course_title') or '')[:30], progress, status, enrolled])
     
     if len(table_data) > 1:
         table = Table(table_data, colWidths=[200, 80, 80, 100])
@@ -5707,24 +8746,14 @@ async def generate_user_transcript(current_user: dict = Depends(get_current_user
     story.append(Paragraph("<b>COMPLETED COURSES</b>", styles['Heading2']))
     story.append(Spacer(1, 10))
     
-    enrollments = await db.enrollments.find({
-        "user_id": current_user["id"],
-        "is_completed": True
-    }, {"_id": 0}).to_list(100)
+    course_progress = await learner_course_progress(current_user["id"])
     
     table_data = [['Course Title', 'Completion Date', 'Certificate ID']]
     
-    for enrollment in enrollments:
-        course = await db.courses.find_one({"id": enrollment["course_id"]}, {"_id": 0})
-        cert = await db.certificates.find_one({
-            "user_id": current_user["id"],
-            "course_id": enrollment["course_id"]
-        }, {"_id": 0})
-        
-        if course:
-            completed = enrollment.get('completed_at', enrollment.get('enrolled_at', ''))[:10]
-            cert_id = cert.get('certificate_id', 'N/A') if cert else 'N/A'
-            table_data.append([course.get('title', ''), completed, cert_id])
+    for row in course_progress:
+        if row["is_completed"]:
+            completed = (row.get('completed_at') or row.get('enrolled_at') or '')[:10]
+            table_data.append([row.get('course_title') or '', completed, row.get('certificate_id') or 'N/A'])
     
     if len(table_data) > 1:
         table = Table(table_data, colWidths=[250, 120, 120])
@@ -5743,15 +8772,10 @@ async def generate_user_transcript(current_user: dict = Depends(get_current_user
     story.append(Spacer(1, 30))
     story.append(Paragraph("<b>COURSES IN PROGRESS</b>", styles['Heading2']))
     
-    in_progress = await db.enrollments.find({
-        "user_id": current_user["id"],
-        "is_completed": {"$ne": True}
-    }, {"_id": 0}).to_list(100)
+    in_progress = [row for row in course_progress if not row["is_completed"]]
     
-    for enrollment in in_progress:
-        course = await db.courses.find_one({"id": enrollment["course_id"]}, {"_id": 0})
-        if course:
-            story.append(Paragraph(f"• {course.get('title', '')} - {enrollment.get('progress', 0)}% complete", styles['Normal']))
+    for row in in_progress:
+        story.append(Paragraph(f"• {row.get('course_title') or ''} - {row['progress_percentage']}% complete", styles['Normal']))
     
     if not in_progress:
         story.append(Paragraph("No courses in progress.", styles['Normal']))
@@ -5772,7 +8796,7 @@ async def generate_user_transcript(current_user: dict = Depends(get_current_user
 
 # ======================== EMAIL AUTOMATION ========================
 
-def send_course_completion_email(to_email: str, user_name: str, course_title: str):
+async def send_course_completion_email(to_email: str, user_name: str, course_title: str):
     """Send course completion congratulation email"""
     html_content = f"""
     <!DOCTYPE html>
@@ -5807,9 +8831,9 @@ def send_course_completion_email(to_email: str, user_name: str, course_title: st
     </body>
     </html>
     """
-    return send_email(to_email, f"🎉 Course Completed - {course_title}", html_content)
+    return await enqueue_email(to_email, f"🎉 Course Completed - {course_title}", html_content)
 
-def send_course_reminder_email(to_email: str, user_name: str, course_title: str, progress: int):
+async def send_course_reminder_email(to_email: str, user_name: str, course_title: str, progress: int):
     """Send reminder email for incomplete courses"""
     html_content = f"""
     <!DOCTYPE html>
@@ -5844,9 +8868,9 @@ def send_course_reminder_email(to_email: str, user_name: str, course_title: str,
     </body>
     </html>
     """
-    return send_email(to_email, f"📚 Continue Learning - {course_title}", html_content)
+    return await enqueue_email(to_email, f"📚 Continue Learning - {course_title}", html_content)
 
-def send_bucket_limit_warning_email(to_email: str, bucket_name: str, usage_percent: float, used_gb: float):
+async def send_bucket_limit_warning_email(to_email: str, bucket_name: str, usage_percent: float, used_gb: float):
     """Send warning email when bucket approaches storage limit"""
     html_content = f"""
     <!DOCTYPE html>
@@ -5885,7 +8909,7 @@ def send_bucket_limit_warning_email(to_email: str, bucket_name: str, usage_perce
     </body>
     </html>
     """
-    return send_email(to_email, f"⚠️ Storage Warning - {bucket_name} at {usage_percent:.0f}%", html_content)
+    return await enqueue_email(to_email, f"⚠️ Storage Warning - {bucket_name} at {usage_percent:.0f}%", html_content)
 
 @api_router.post("/admin/email/send-reminders")
 async def send_course_reminders(current_user: dict = Depends(get_admin_user)):
@@ -5899,11 +8923,11 @@ async def send_course_reminders(current_user: dict = Depends(get_admin_user)):
     sent = 0
     for enrollment in enrollments:
         user = await db.users.find_one({"id": enrollment["user_id"]}, {"_id": 0})
-        course = await db.courses.find_one({"id": enrollment["course_id"]}, {"_id": 0})
+        course = await db.courses.find_one({"id": enrollment["course_id"]}, {"_id": 0, "thumbnail_data": 0})
         
         if user and course:
             user_name = f"{user.get('first_name', '')} {user.get('last_name', '')}".strip() or "Student"
-            send_course_reminder_email(
+            await send_course_reminder_email(
                 user.get("email"),
                 user_name,
                 course.get("title"),
@@ -5921,29 +8945,11 @@ async def check_and_notify_bucket_limits(current_user: dict = Depends(get_admin_
     
     for bucket in buckets:
         try:
-            r2_client_bucket = get_r2_client_for_bucket(bucket)
-            if not r2_client_bucket:
+            bucket_storage = bucket_registry.for_config(bucket)
+            if not bucket_storage:
                 continue
             
-            total_size = 0
-            continuation_token = None
-            
-            while True:
-                if continuation_token:
-                    response = r2_client_bucket.list_objects_v2(
-                        Bucket=bucket["bucket_name"],
-                        ContinuationToken=continuation_token
-                    )
-                else:
-                    response = r2_client_bucket.list_objects_v2(Bucket=bucket["bucket_name"])
-                
-                for obj in response.get("Contents", []):
-                    total_size += obj.get("Size", 0)
-                
-                if response.get("IsTruncated"):
-                    continuation_token = response.get("NextContinuationToken")
-                else:
-                    break
+            total_size = (await bucket_storage.usage())["bytes"]
             
             size_gb = total_size / (1024 * 1024 * 1024)
             usage_percent = (size_gb / 10.0) * 100
@@ -5952,7 +8958,7 @@ async def check_and_notify_bucket_limits(current_user: dict = Depends(get_admin_
                 # Get admin email
                 admin = await db.users.find_one({"role": "admin"}, {"_id": 0})
                 if admin:
-                    send_bucket_limit_warning_email(
+                    await send_bucket_limit_warning_email(
                         admin.get("email"),
                         bucket.get("name"),
                         usage_percent,
@@ -5980,7 +8986,7 @@ async def get_drip_schedule(
     if not enrollment:
         raise HTTPException(status_code=403, detail="Not enrolled in this course")
     
-    course = await db.courses.find_one({"id": course_id}, {"_id": 0})
+    course = await db.courses.find_one({"id": course_id}, {"_id": 0, "thumbnail_data": 0})
     if not course or not course.get("drip_enabled"):
         return {"drip_enabled": False, "modules": []}
     
@@ -6022,21 +9028,24 @@ async def get_my_assignments(current_user: dict = Depends(get_current_user)):
     
     assignments = await db.assignments.find({"course_id": {"$in": course_ids}}, {"_id": 0}).to_list(100)
     
-    for assignment in assignments:
-        course = await db.courses.find_one({"id": assignment["course_id"]}, {"_id": 0, "title": 1})
-        assignment["course_title"] = course.get("title") if course else ""
-        
-        submission = await db.assignment_submissions.find_one({
-            "assignment_id": assignment["id"],
+    courses = await BatchLoader().load_many("course_title", (a["course_id"] for a in assignments))
+    submissions: Dict[str, dict] = {}
+    if assignments:
+        async for submission in db.assignment_submissions.find({
+            "assignment_id": {"$in": [a["id"] for a in assignments]},
             "user_id": current_user["id"]
-        }, {"_id": 0})
-        assignment["submission"] = submission
+        }, {"_id": 0}):
+            submissions.setdefault(submission["assignment_id"], submission)
+    
+    for assignment in assignments:
+        assignment["course_title"] = courses.get(assignment["course_id"], {}).get("title", "")
+        assignment["submission"] = submissions.get(assignment["id"])
     
     return {"assignments": assignments}
 
 # ======================== FRIENDS/MESSAGING UI SUPPORT ========================
 
-@api_router.get("/friends/search")
+@api_router.get("/friends/search", response_model=FriendSearchResponse)
 async def search_users_for_friends(
     query: str,
     current_user: dict = Depends(get_current_user)
@@ -6051,10 +9060,11 @@ async def search_users_for_friends(
                 {"last_name": {"$regex": query, "$options": "i"}}
             ]}
         ]
-    }, {"_id": 0, "password": 0}).limit(10).to_list(10)
+    }, {**USER_PROJECTIONS["public_summary"], "email": 1}).limit(10).to_list(10)
     
     # Check friendship status for each user
     for user in users:
+        use_image_variant(user, "profile_image_url", "profile_image_variants", 64)
         friendship = await db.friendships.find_one({
             "$or": [
                 {"user_id": current_user["id"], "friend_id": user["id"]},
@@ -6092,7 +9102,17 @@ fastapi_app.add_middleware(
 
 @fastapi_app.on_event("shutdown")
 async def shutdown_db_client():
+    await email_outbox.stop()
+    try:
+        await progress_buffer.stop()
+    except Exception as e:
+        logger.error(f"Final progress flush failed: {e}")
     client.close()
+    if image_process_pool is not None:
+        image_process_pool.shutdown(wait=False, cancel_futures=True)
+    password_executor.shutdown(wait=False, cancel_futures=True)
+    await emergent_storage.close()
+    storage_executor.shutdown(wait=False, cancel_futures=True)
 
 # Wrap FastAPI app with Socket.IO and export as 'app' for uvicorn
 app = socketio.ASGIApp(sio, fastapi_app)
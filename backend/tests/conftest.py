@@ -0,0 +1,55 @@
+"""
+Fixtures for in-process tests that call route handlers directly against MongoDB.
+
+The HTTP tests in this directory need a deployed backend (REACT_APP_BACKEND_URL).
+In-process tests only need a reachable MongoDB at MONGO_URL; they run against a
+throwaway database that is dropped at the end of the session.
+"""
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017/?serverSelectionTimeoutMS=2000")
+os.environ["DB_NAME"] = os.environ.get("TEST_DB_NAME", f"lumina_test_{uuid.uuid4().hex[:8]}")
+
+
+@pytest.fixture(scope="session")
+def run():
+    """Run a coroutine on one event loop shared by the whole session (Motor binds to it)"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop.run_until_complete
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def server(run):
+    """The backend module, connected to the scratch database"""
+    pytest.importorskip("motor")
+    from pymongo.errors import ConnectionFailure
+    import server as server_module
+
+    async def ping():
+        await server_module.client.admin.command("ping")
+    try:
+        run(ping())
+    except ConnectionFailure as e:
+        pytest.skip(f"MongoDB not reachable at MONGO_URL: {e}")
+    yield server_module
+    run(server_module.client.drop_database(os.environ["DB_NAME"]))
+
+
+@pytest.fixture
+def query_counter(server):
+    """Start a Mongo command count; calling the returned function gives the commands issued since"""
+    def start():
+        begin = server.db_command_counter.total()
+        return lambda: server.db_command_counter.total() - begin
+    return start
@@ -0,0 +1,100 @@
+"""
+Batch loader tests
+Routes that embed users and courses into each row resolve them with one $in
+per collection, so the query count does not grow with the number of rows.
+"""
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+ADMIN = {"id": "admin-test", "role": "admin"}
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+@pytest.fixture
+def rows(server, run):
+    """A learner with cart, wishlist, tickets, reviews and assignments spread over several users and courses"""
+
+    def seed(count):
+        learner = {"id": str(uuid.uuid4()), "role": "student", "email": f"loader-{uuid.uuid4().hex[:8]}@example.com"}
+        users = [{"id": str(uuid.uuid4()), "first_name": f"U{n}", "email": f"u{n}-{uuid.uuid4().hex[:6]}@example.com",
+                  "password": "hash", "role": "student"} for n in range(count)]
+        courses = [{"id": str(uuid.uuid4()), "title": f"C{n}", "price": 10, "is_published": True} for n in range(count)]
+
+        async def insert():
+            await server.db.users.insert_many([dict(u) for u in users] + [dict(learner)])
+            await server.db.courses.insert_many([dict(c) for c in courses])
+            await server.db.cart.insert_many([
+                {"id": str(uuid.uuid4()), "user_id": learner["id"], "course_id": c["id"]} for c in courses])
+            await server.db.wishlist.insert_many([
+                {"id": str(uuid.uuid4()), "user_id": learner["id"], "course_id": c["id"]} for c in courses])
+            await server.db.enrollments.insert_many([
+                {"id": str(uuid.uuid4()), "user_id": learner["id"], "course_id": c["id"]} for c in courses])
+            await server.db.assignments.insert_many([
+                {"id": str(uuid.uuid4()), "course_id": c["id"], "title": "A"} for c in courses])
+            await server.db.friendships.insert_many([
+                {"id": str(uuid.uuid4()), "user_id": u["id"], "friend_id": learner["id"], "status": "accepted"}
+                for u in users])
+            tag = str(uuid.uuid4())
+            await server.db.reviews.insert_many([
+                {"id": str(uuid.uuid4()), "user_id": u["id"], "course_id": c["id"], "rating": 5,
+                 "is_visible": True, "created_at": now(), "tag": tag} for u, c in zip(users, courses)])
+            return tag
+        tag = run(insert())
+        return learner, users, courses, tag
+    return seed
+
+
+def count_queries(query_counter, call):
+    queries = query_counter()
+    result = call()
+    return queries(), result
+
+
+class TestQueryCounts:
+    @pytest.mark.parametrize("size", [3, 30])
+    def test_learner_routes(self, server, run, rows, query_counter, size):
+        learner, users, courses, _ = rows(size)
+        for route, limit in ((server.get_cart, 2), (server.get_wishlist, 2), (server.get_friends, 2),
+                             (server.get_my_assignments, 4)):
+            queries, result = count_queries(query_counter, lambda: run(route(current_user=learner)))
+            print(f"{route.__name__} with {size} rows: {queries} queries")
+            assert queries <= limit
+
+        cart = run(server.get_cart(current_user=learner))
+        assert sorted(i["course"]["title"] for i in cart["items"]) == sorted(c["title"] for c in courses)
+        friends = run(server.get_friends(current_user=learner))["friends"]
+        assert len(friends) == size and all("password" not in f for f in friends)
+        assignments = run(server.get_my_assignments(current_user=learner))["assignments"]
+        assert {a["course_title"] for a in assignments} == {c["title"] for c in courses}
+
+    def test_admin_reviews(self, server, run, rows, query_counter):
+        _, users, courses, _ = rows(30)
+        course_id = courses[0]["id"]
+        queries, result = count_queries(query_counter, lambda: run(server.admin_get_all_reviews(
+            course_id=None, is_visible=None, cursor=None, limit=30, current_user=ADMIN)))
+        assert queries <= 3
+        assert all(r["user"] and r["course"] for r in result["reviews"])
+        mine = [r for r in result["reviews"] if r["course_id"] == course_id]
+        assert mine[0]["course"]["title"] == "C0" and mine[0]["user"]["first_name"] == "U0"
+
+
+class TestBatchLoader:
+    def test_dedupes_and_reports_missing(self, server, run, rows, query_counter):
+        _, users, courses, _ = rows(3)
+        loader = server.BatchLoader()
+        ids = [u["id"] for u in users] * 3 + ["missing"]
+        queries = query_counter()
+        found = run(loader.load_many("public_summary", ids))
+        assert queries() == 1
+        assert set(found) == {u["id"] for u in users}
+        assert "password" not in found[users[0]["id"]]
+
+        rows_ = [{"user_id": users[0]["id"]}, {"user_id": "missing"}]
+        run(loader.attach(rows_, ("user_id", "user", "public_summary")))
+        assert queries() == 1
+        assert rows_[0]["user"]["first_name"] == "U0" and rows_[1]["user"] is None
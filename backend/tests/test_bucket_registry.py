@@ -0,0 +1,54 @@
+"""
+R2 bucket client registry tests
+Each configured bucket gets one boto3 client per process, reused until an
+admin changes or removes the bucket.
+"""
+import time
+import uuid
+
+import pytest
+
+ADMIN = {"id": "admin-test", "role": "admin"}
+
+
+@pytest.fixture
+def bucket(server, run):
+    config = {"id": str(uuid.uuid4()), "name": "Videos", "account_id": "acct", "access_key_id": "key",
+              "secret_access_key": "secret", "bucket_name": "videos", "is_default": False}
+    run(server.db.r2_buckets.insert_one(dict(config)))
+    yield config
+    server.bucket_registry.invalidate(config["id"])
+
+
+class TestRegistry:
+    def test_client_is_reused_without_queries(self, server, run, bucket, query_counter):
+        first = run(server.bucket_registry.storage(bucket["id"]))
+        queries = query_counter()
+        started = time.perf_counter()
+        for _ in range(100):
+            assert run(server.bucket_registry.storage(bucket["id"])) is first
+        print(f"100 cached lookups: {(time.perf_counter() - started) * 1000:.1f}ms")
+        assert queries() == 0
+        assert first.bucket == "videos"
+
+    def test_update_rebuilds_client(self, server, run, bucket):
+        first = run(server.bucket_registry.storage(bucket["id"]))
+        run(server.update_r2_bucket(bucket["id"], server.R2BucketUpdate(description="renamed"), current_user=ADMIN))
+        assert run(server.bucket_registry.storage(bucket["id"])) is first
+
+        run(server.update_r2_bucket(bucket["id"], server.R2BucketUpdate(secret_access_key="rotated"),
+                                    current_user=ADMIN))
+        rotated = run(server.bucket_registry.storage(bucket["id"]))
+        assert rotated is not first
+
+    def test_delete_drops_client(self, server, run, bucket):
+        run(server.bucket_registry.storage(bucket["id"]))
+        run(server.delete_r2_bucket(bucket["id"], current_user=ADMIN))
+        assert run(server.bucket_registry.storage(bucket["id"])) is None
+
+    def test_warm_builds_every_bucket(self, server, run, bucket):
+        server.bucket_registry.invalidate(bucket["id"])
+        run(server.bucket_registry.warm())
+        created = server.bucket_registry.created
+        run(server.bucket_registry.storage(bucket["id"]))
+        assert server.bucket_registry.created == created
@@ -0,0 +1,85 @@
+"""
+Course catalog benchmark
+Asserts GET /api/courses issues a constant number of Mongo commands per page,
+whatever the page size, and prints the timing for each size.
+"""
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def catalog(server, run):
+    """48 published courses in a private category, each with reviews and enrollments"""
+    category = f"bench-{uuid.uuid4().hex[:8]}"
+    base = datetime.now(timezone.utc)
+    courses, reviews, enrollments = [], [], []
+    for i in range(48):
+        course_id = str(uuid.uuid4())
+        courses.append({
+            "id": course_id,
+            "title": f"Benchmark Course {i}",
+            "description": "Catalog benchmark fixture",
+            "category": category,
+            "level": "beginner",
+            "price": 10.0,
+            "is_published": True,
+            "created_at": (base - timedelta(minutes=i)).isoformat()
+        })
+        for r in range(i % 5):
+            reviews.append({
+                "id": str(uuid.uuid4()), "course_id": course_id, "user_id": str(uuid.uuid4()),
+                "rating": r + 1, "is_visible": True
+            })
+        reviews.append({
+            "id": str(uuid.uuid4()), "course_id": course_id, "user_id": str(uuid.uuid4()),
+            "rating": 1, "is_visible": False
+        })
+        for _ in range(i % 7):
+            enrollments.append({"id": str(uuid.uuid4()), "course_id": course_id, "user_id": str(uuid.uuid4())})
+
+    async def seed():
+        await server.db.courses.insert_many(courses)
+        await server.db.reviews.insert_many(reviews)
+        await server.db.enrollments.insert_many(enrollments)
+        await server.reconcile_course_counters()
+    run(seed())
+    return category
+
+
+class TestCatalogQueryCount:
+    """GET /api/courses round trips must not grow with the page size"""
+
+    def fetch(self, server, run, category, limit):
+        return run(server.get_courses(
+            category=category, level=None, search=None, sort_by="created_at",
+            sort_order="desc", page=1, limit=limit
+        ))
+
+    def test_query_count_constant_across_limits(self, server, run, catalog, query_counter):
+        """limit=1, 12 and 48 cost the same number of commands"""
+        counts = {}
+        for limit in (1, 12, 48):
+            queries = query_counter()
+            started = time.perf_counter()
+            data = self.fetch(server, run, catalog, limit)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            counts[limit] = queries()
+            assert len(data["courses"]) == limit
+            print(f"limit={limit}: {counts[limit]} queries, {elapsed_ms:.1f}ms")
+        assert len(set(counts.values())) == 1, f"Query count varies with limit: {counts}"
+
+    def test_ratings_and_enrollments_match_source(self, server, run, catalog):
+        """Course counters agree with the reviews and enrollments collections"""
+        data = self.fetch(server, run, catalog, 48)
+        assert data["total"] == 48
+        for i, course in enumerate(data["courses"]):
+            visible = i % 5
+            assert course["review_count"] == visible
+            expected = sum(range(1, visible + 1)) / visible if visible else 0
+            assert course["average_rating"] == pytest.approx(expected)
+            assert course["enrollment_count"] == i % 7
+            assert "_ratings" not in course and "_enrollments" not in course
+        print("PASS: catalog ratings and enrollment counts are correct")
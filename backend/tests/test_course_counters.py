@@ -0,0 +1,84 @@
+"""
+Course counter tests
+rating_sum / rating_count / enrollment_count follow review moderation and
+enrollment changes, and reconcile_course_counters repairs drift.
+"""
+import uuid
+
+import pytest
+
+ADMIN = {"id": "admin-test", "role": "admin"}
+
+
+@pytest.fixture
+def course_id(server, run):
+    course_id = str(uuid.uuid4())
+    run(server.db.courses.insert_one({"id": course_id, "title": "Counter Course", "is_published": True}))
+    return course_id
+
+
+def counters(server, run, course_id):
+    return run(server.db.courses.find_one(
+        {"id": course_id}, {"_id": 0, "rating_sum": 1, "rating_count": 1, "enrollment_count": 1}
+    ))
+
+
+class TestReviewCounters:
+    """Only visible reviews contribute to the rating counters"""
+
+    def test_moderation_updates_counters(self, server, run, course_id):
+        review_id = str(uuid.uuid4())
+        run(server.db.reviews.insert_one({
+            "id": review_id, "course_id": course_id, "user_id": "u1", "rating": 4, "is_visible": False
+        }))
+
+        run(server.admin_toggle_review_visibility(review_id, True, current_user=ADMIN))
+        run(server.admin_toggle_review_visibility(review_id, True, current_user=ADMIN))
+        assert counters(server, run, course_id) == {"rating_sum": 4, "rating_count": 1}
+
+        run(server.admin_edit_review(review_id, rating=2, comment=None, current_user=ADMIN))
+        assert counters(server, run, course_id) == {"rating_sum": 2, "rating_count": 1}
+
+        run(server.admin_toggle_review_visibility(review_id, False, current_user=ADMIN))
+        assert counters(server, run, course_id) == {"rating_sum": 0, "rating_count": 0}
+
+        run(server.admin_toggle_review_visibility(review_id, True, current_user=ADMIN))
+        run(server.admin_delete_review(review_id, current_user=ADMIN))
+        assert counters(server, run, course_id) == {"rating_sum": 0, "rating_count": 0}
+        print("PASS: review moderation keeps rating counters in step")
+
+
+class TestEnrollmentCounters:
+    """Admin assignment and revocation adjust enrollment_count"""
+
+    def test_assign_and_revoke(self, server, run, course_id):
+        user_id = str(uuid.uuid4())
+        run(server.db.users.insert_one({
+            "id": user_id, "email": f"{user_id}@example.com", "first_name": "Count", "last_name": "Er"
+        }))
+        run(server.admin_assign_course(user_id, course_id, current_user=ADMIN))
+        assert counters(server, run, course_id)["enrollment_count"] == 1
+        run(server.admin_revoke_course(user_id, course_id, current_user=ADMIN))
+        assert counters(server, run, course_id)["enrollment_count"] == 0
+        print("PASS: enrollment counter follows assign/revoke")
+
+
+class TestReconcile:
+    """reconcile_course_counters reports and repairs drift"""
+
+    def test_reports_and_fixes_drift(self, server, run, course_id):
+        run(server.db.reviews.insert_one({
+            "id": str(uuid.uuid4()), "course_id": course_id, "user_id": "u2", "rating": 5, "is_visible": True
+        }))
+        run(server.db.enrollments.insert_one({"id": str(uuid.uuid4()), "course_id": course_id, "user_id": "u2"}))
+        run(server.db.courses.update_one({"id": course_id}, {"$set": {"enrollment_count": 7}}))
+
+        report = run(server.reconcile_course_counters(dry_run=True))
+        drift = [d for d in report["drift"] if d["course_id"] == course_id]
+        assert drift and drift[0]["actual"] == {"rating_sum": 5, "rating_count": 1, "enrollment_count": 1,
+                                                "lesson_count": 0, "module_ids": []}
+        assert counters(server, run, course_id) == {"enrollment_count": 7}
+
+        run(server.reconcile_course_counters())
+        assert counters(server, run, course_id) == {"rating_sum": 5, "rating_count": 1, "enrollment_count": 1}
+        print("PASS: reconcile repairs drifted counters")
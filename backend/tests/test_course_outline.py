@@ -0,0 +1,137 @@
+"""
+Course outline tests
+get_course and get_enrolled_course build the outline from a fixed number of
+queries, and return exactly what the old per-module lookups returned.
+"""
+import json
+import uuid
+
+import pytest
+
+
+def seed_course(server, run, modules, lessons_per_module, user_id):
+    """Course with a quiz per module, some progress and attempts for user_id"""
+    course_id = str(uuid.uuid4())
+    docs = {"modules": [], "lessons": [], "quizzes": [], "questions": [], "lesson_progress": [],
+            "quiz_attempts": [], "reviews": [], "users": []}
+    for m in range(modules):
+        module_id = str(uuid.uuid4())
+        docs["modules"].append({"id": module_id, "course_id": course_id, "title": f"Module {m}", "order": m})
+        for l in range(lessons_per_module):
+            lesson_id = str(uuid.uuid4())
+            docs["lessons"].append({
+                "id": lesson_id, "module_id": module_id, "title": f"Lesson {m}.{l}", "order": l,
+                "video_key": f"videos/{lesson_id}.mp4" if l % 2 == 0 else None
+            })
+            if l % 3 == 0:
+                docs["lesson_progress"].append({
+                    "id": str(uuid.uuid4()), "lesson_id": lesson_id, "user_id": user_id,
+                    "watch_percentage": 90, "is_completed": True
+                })
+        quiz_id = str(uuid.uuid4())
+        docs["quizzes"].append({"id": quiz_id, "module_id": module_id, "title": f"Quiz {m}", "passing_score": 70})
+        for q in range(3):
+            docs["questions"].append({
+                "id": str(uuid.uuid4()), "quiz_id": quiz_id, "question": f"Q{q}",
+                "options": ["a", "b"], "correct_answer": 0
+            })
+        if m % 2 == 0:
+            docs["quiz_attempts"].append({"id": str(uuid.uuid4()), "quiz_id": quiz_id, "user_id": user_id, "score": 80})
+    for r in range(3):
+        reviewer_id = str(uuid.uuid4())
+        docs["users"].append({"id": reviewer_id, "email": f"{reviewer_id}@example.com",
+                              "first_name": "Rev", "last_name": str(r), "avatar_url": None})
+        docs["reviews"].append({"id": str(uuid.uuid4()), "course_id": course_id, "user_id": reviewer_id,
+                                "rating": 4, "is_visible": True, "created_at": f"2024-01-0{r + 1}T00:00:00"})
+
+    async def seed():
+        await server.db.courses.insert_one({"id": course_id, "title": "Outline Course", "is_published": True,
+                                            "instructor_id": "", "rating_sum": 12, "rating_count": 3})
+        for collection, items in docs.items():
+            if items:
+                await server.db[collection].insert_many(items)
+        await server.db.enrollments.insert_one({"id": str(uuid.uuid4()), "course_id": course_id, "user_id": user_id})
+    run(seed())
+    return course_id
+
+
+async def legacy_modules(db, course_id, user_id=None):
+    """The per-module lookups get_course / get_enrolled_course used to run"""
+    modules = await db.modules.find({"course_id": course_id}, {"_id": 0}).sort("order", 1).to_list(100)
+    for module in modules:
+        lessons = await db.lessons.find({"module_id": module["id"]}, {"_id": 0}).sort("order", 1).to_list(100)
+        for lesson in lessons:
+            if user_id:
+                lesson["progress"] = await db.lesson_progress.find_one(
+                    {"lesson_id": lesson["id"], "user_id": user_id}, {"_id": 0})
+            elif lesson.get("video_key"):
+                lesson["has_video"] = True
+                del lesson["video_key"]
+        module["lessons"] = lessons
+        quiz = await db.quizzes.find_one({"module_id": module["id"]}, {"_id": 0})
+        if quiz:
+            questions = await db.questions.find({"quiz_id": quiz["id"]}, {"_id": 0}).to_list(100)
+            if not user_id:
+                for q in questions:
+                    del q["correct_answer"]
+            quiz["questions"] = questions
+            if user_id:
+                quiz["attempt"] = await db.quiz_attempts.find_one(
+                    {"quiz_id": quiz["id"], "user_id": user_id}, {"_id": 0})
+            module["quiz"] = quiz
+    return modules
+
+
+@pytest.fixture(scope="module")
+def learner():
+    return {"id": str(uuid.uuid4()), "role": "student"}
+
+
+@pytest.fixture(scope="module")
+def courses(server, run, learner):
+    return {
+        "small": seed_course(server, run, 2, 3, learner["id"]),
+        "large": seed_course(server, run, 12, 15, learner["id"]),
+    }
+
+
+class TestOutlineQueryCount:
+    """Query count does not depend on the number of modules, lessons or quizzes"""
+
+    def test_public_outline(self, server, run, courses, query_counter):
+        counts = {}
+        for size, course_id in courses.items():
+            queries = query_counter()
+            run(server.get_course(course_id))
+            counts[size] = queries()
+        print(f"get_course queries: {counts}")
+        assert counts["small"] == counts["large"]
+
+    def test_enrolled_outline(self, server, run, courses, learner, query_counter):
+        counts = {}
+        for size, course_id in courses.items():
+            queries = query_counter()
+            run(server.get_enrolled_course(course_id, current_user=learner))
+            counts[size] = queries()
+        print(f"get_enrolled_course queries: {counts}")
+        assert counts["small"] == counts["large"]
+
+
+class TestOutlineUnchanged:
+    """The bulk outline is identical to the per-module one"""
+
+    def test_public_outline_matches_legacy(self, server, run, courses):
+        course_id = courses["large"]
+        data = run(server.get_course(course_id))
+        expected = run(legacy_modules(server.db, course_id))
+        assert json.dumps(data["modules"]) == json.dumps(expected)
+        assert all(r["user"]["first_name"] == "Rev" for r in data["reviews"])
+        assert data["average_rating"] == 4
+        print("PASS: public outline unchanged")
+
+    def test_enrolled_outline_matches_legacy(self, server, run, courses, learner):
+        course_id = courses["large"]
+        data = run(server.get_enrolled_course(course_id, current_user=learner))
+        expected = run(legacy_modules(server.db, course_id, learner["id"]))
+        assert json.dumps(data["modules"]) == json.dumps(expected)
+        print("PASS: enrolled outline unchanged")
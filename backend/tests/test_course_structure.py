@@ -0,0 +1,101 @@
+"""
+Course structure bookkeeping tests
+Admin routes keep lesson_count / module_ids current, and progress and
+enrollment lists resolve lessons without walking modules.
+"""
+import uuid
+
+import pytest
+
+ADMIN = {"id": "admin-test", "role": "admin"}
+
+
+def create_course(server, run):
+    return run(server.admin_create_course(server.CourseCreate(
+        title="Structured", description="d", short_description="s", price=0, category="Dev", level="beginner"
+    ), current_user=ADMIN))["course_id"]
+
+
+def stored(server, run, course_id):
+    return run(server.db.courses.find_one({"id": course_id}, {"_id": 0, "lesson_count": 1, "module_ids": 1}))
+
+
+class TestBookkeeping:
+    def test_admin_routes_maintain_counts(self, server, run):
+        course_id = create_course(server, run)
+        modules = [
+            run(server.admin_create_module(course_id, server.ModuleCreate(title=f"M{n}", order=n), current_user=ADMIN))["module_id"]
+            for n in range(2)
+        ]
+        lessons = [
+            run(server.admin_create_lesson(module_id, server.LessonCreate(title=f"L{n}", order=n), current_user=ADMIN))["lesson_id"]
+            for module_id in modules for n in range(3)
+        ]
+        assert stored(server, run, course_id) == {"lesson_count": 6, "module_ids": modules}
+
+        run(server.admin_delete_lesson(lessons[0], current_user=ADMIN))
+        assert stored(server, run, course_id)["lesson_count"] == 5
+        run(server.admin_delete_module(modules[1], current_user=ADMIN))
+        assert stored(server, run, course_id) == {"lesson_count": 2, "module_ids": [modules[0]]}
+
+        result = run(server.reconcile_course_counters(dry_run=True))
+        assert course_id not in [d["course_id"] for d in result["drift"]]
+        print("PASS: lesson_count and module_ids follow admin edits")
+
+    def test_reconcile_repairs_drift(self, server, run):
+        course_id = create_course(server, run)
+        module_id = run(server.admin_create_module(course_id, server.ModuleCreate(title="M", order=0), current_user=ADMIN))["module_id"]
+        run(server.db.lessons.insert_one({"id": str(uuid.uuid4()), "module_id": module_id, "title": "Raw", "order": 0}))
+        run(server.reconcile_course_counters())
+        assert stored(server, run, course_id) == {"lesson_count": 1, "module_ids": [module_id]}
+
+
+class TestLessonIndex:
+    def test_progress_skips_lesson_and_module_lookups(self, server, run, query_counter):
+        course_id = create_course(server, run)
+        module_id = run(server.admin_create_module(course_id, server.ModuleCreate(title="M", order=0), current_user=ADMIN))["module_id"]
+        lesson_id = run(server.admin_create_lesson(module_id, server.LessonCreate(title="L", order=0), current_user=ADMIN))["lesson_id"]
+        user = {"id": str(uuid.uuid4()), "role": "student"}
+        run(server.db.enrollments.insert_one({"id": str(uuid.uuid4()), "user_id": user["id"], "course_id": course_id}))
+
+        run(server.update_lesson_progress(lesson_id, 10.0, current_user=user))
+        queries = query_counter()
+        run(server.update_lesson_progress(lesson_id, 20.0, current_user=user))
+        assert queries() == 1
+        assert run(server.lesson_index.resolve(lesson_id)) == (module_id, course_id)
+
+        run(server.admin_delete_lesson(lesson_id, current_user=ADMIN))
+        assert run(server.lesson_index.resolve(lesson_id)) is None
+        print("PASS: heartbeat on a known lesson costs one query")
+
+    def test_lesson_deleted_by_another_worker_takes_no_progress(self, server, run):
+        from fastapi import HTTPException
+
+        course_id = create_course(server, run)
+        module_id = run(server.admin_create_module(course_id, server.ModuleCreate(title="M", order=0), current_user=ADMIN))["module_id"]
+        lesson_id = run(server.admin_create_lesson(module_id, server.LessonCreate(title="L", order=0), current_user=ADMIN))["lesson_id"]
+        user = {"id": str(uuid.uuid4()), "role": "student"}
+        run(server.db.enrollments.insert_one({"id": str(uuid.uuid4()), "user_id": user["id"], "course_id": course_id}))
+        run(server.update_lesson_progress(lesson_id, 10.0, current_user=user))
+        # Deleted elsewhere: this worker still has the lesson cached
+        run(server.db.lessons.delete_one({"id": lesson_id}))
+
+        run(server.progress_buffer.flush())
+        assert run(server.db.lesson_progress.find_one({"lesson_id": lesson_id})) is None
+        with pytest.raises(HTTPException) as exc:
+            run(server.update_lesson_progress(lesson_id, 90.0, current_user=user))
+        assert exc.value.status_code == 404
+        assert run(server.lesson_index.resolve(lesson_id)) is None
+
+    def test_enrolled_courses_constant_queries(self, server, run, query_counter):
+        user = {"id": str(uuid.uuid4()), "role": "student"}
+        counts = []
+        for _ in range(3):
+            course_id = create_course(server, run)
+            run(server.admin_create_module(course_id, server.ModuleCreate(title="M", order=0), current_user=ADMIN))
+            run(server.db.enrollments.insert_one({"id": str(uuid.uuid4()), "user_id": user["id"], "course_id": course_id}))
+            queries = query_counter()
+            data = run(server.get_enrolled_courses(current_user=user))
+            counts.append(queries())
+        assert len(set(counts)) == 1
+        assert all(c["total_modules"] == 1 and c["total_lessons"] == 0 for c in data["courses"])
@@ -0,0 +1,84 @@
+"""
+Dashboard rollup tests
+Payments, enrollments, withdrawals and logins $inc the daily rollup and the
+running totals; the dashboard reads those instead of scanning, and the
+rebuild job recomputes them from source collections.
+"""
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+ADMIN = {"id": "admin-test", "role": "admin"}
+
+
+@pytest.fixture
+def buyer(server, run):
+    user = {"id": str(uuid.uuid4()), "email": f"buyer-{uuid.uuid4().hex[:8]}@example.com", "first_name": "Buyer",
+            "role": "student", "wallet_balance": 500.0, "pending_earnings": 0}
+    course = {"id": str(uuid.uuid4()), "title": "Paid", "price": 120.0, "is_published": True}
+    order = {"id": str(uuid.uuid4()), "txn_id": f"TXN{uuid.uuid4().hex}", "user_id": user["id"],
+             "course_ids": [course["id"]], "total": 120.0, "status": "pending",
+             "created_at": datetime.now(timezone.utc).isoformat()}
+
+    async def seed():
+        await server.db.users.insert_one(dict(user))
+        await server.db.courses.insert_one(dict(course))
+        await server.db.orders.insert_one(dict(order))
+    run(seed())
+    return user, order
+
+
+def dashboard(server, run):
+    return run(server.admin_dashboard(current_user=ADMIN))
+
+
+def today(data):
+    return next((d for d in data["daily"] if d["date"] == datetime.now(timezone.utc).strftime("%Y-%m-%d")), {})
+
+
+class TestIncremental:
+    def test_events_update_rollups(self, server, run, buyer):
+        user, order = buyer
+        before = dashboard(server, run)
+
+        run(server.payment_success(order["txn_id"], "success", "hash"))
+        run(server.payment_success(order["txn_id"], "success", "hash"))
+        withdrawal = run(server.request_withdrawal(
+            server.WithdrawalRequest(amount=50.0, bank_details="x"), current_user=user))
+        run(server.record_login(user["id"]))
+        run(server.record_login(user["id"]))
+
+        after = dashboard(server, run)
+        assert after["total_revenue"] - before["total_revenue"] == 120.0
+        assert after["total_enrollments"] - before["total_enrollments"] == 1
+        assert after["pending_withdrawals"] - before["pending_withdrawals"] == 1
+        assert after["pending_withdrawal_amount"] - before["pending_withdrawal_amount"] == 50.0
+        assert today(after)["orders"] - today(before).get("orders", 0) == 1
+        assert today(after)["active_users"] - today(before).get("active_users", 0) == 1
+        assert after["active_users"] >= 1
+
+        withdrawal_id = run(server.db.withdrawals.find_one({"user_id": user["id"]}))["id"]
+        run(server.admin_update_withdrawal(withdrawal_id, "approved", current_user=ADMIN))
+        assert dashboard(server, run)["pending_withdrawals"] == before["pending_withdrawals"]
+        print(f"PASS: rollups track events, withdrawal {withdrawal}")
+
+    def test_dashboard_reads_are_constant(self, server, run, query_counter):
+        queries = query_counter()
+        dashboard(server, run)
+        assert queries() <= 6
+
+
+class TestRebuild:
+    def test_rebuild_matches_sources(self, server, run, buyer):
+        _, order = buyer
+        run(server.payment_success(order["txn_id"], "success", "hash"))
+        result = run(server.rebuild_dashboard_metrics())
+        totals = result["totals"]
+        assert totals["enrollments"] == run(server.db.enrollments.count_documents({}))
+        assert totals["pending_withdrawals"] == run(server.db.withdrawals.count_documents({"status": "pending"}))
+
+        data = dashboard(server, run)
+        assert data["total_revenue"] == pytest.approx(totals["revenue"])
+        assert data["total_enrollments"] == totals["enrollments"]
+        print(f"PASS: rebuilt {result['days']} days")
@@ -0,0 +1,107 @@
+"""
+Enrolled course delta sync tests
+Content, progress and attempts carry updated_seq; the changes route returns
+only what moved past the client's cursor, plus tombstones for deletions.
+"""
+import uuid
+
+import pytest
+
+ADMIN = {"id": "admin-test", "role": "admin"}
+
+
+@pytest.fixture
+def synced_course(server, run):
+    """A course with one module of two lessons and an enrolled learner"""
+    user = {"id": str(uuid.uuid4()), "email": f"delta-{uuid.uuid4().hex[:8]}@example.com", "role": "student", "points": 0}
+    course_id = run(server.admin_create_course(server.CourseCreate(
+        title="Delta", description="d", short_description="s", price=0, category="Dev", level="beginner"
+    ), current_user=ADMIN))["course_id"]
+    module_id = run(server.admin_create_module(
+        course_id, server.ModuleCreate(title="M", order=0), current_user=ADMIN))["module_id"]
+    lessons = [
+        run(server.admin_create_lesson(module_id, server.LessonCreate(title=f"L{n}", order=n), current_user=ADMIN))["lesson_id"]
+        for n in range(2)
+    ]
+    run(server.db.users.insert_one(dict(user)))
+    run(server.db.enrollments.insert_one({
+        "id": str(uuid.uuid4()), "user_id": user["id"], "course_id": course_id, "completed_lessons": []
+    }))
+    return user, course_id, module_id, lessons
+
+
+def changes(server, run, course_id, user, since):
+    return run(server.get_enrolled_course_changes(course_id, since=since, current_user=user))
+
+
+class TestDeltaSync:
+    def test_full_then_incremental(self, server, run, synced_course):
+        user, course_id, module_id, lessons = synced_course
+        full = changes(server, run, course_id, user, 0)
+        assert [m["id"] for m in full["modules"]] == [module_id]
+        assert sorted(l["id"] for l in full["lessons"]) == sorted(lessons)
+
+        cursor = full["cursor"]
+        assert changes(server, run, course_id, user, cursor)["lessons"] == []
+
+        run(server.admin_update_lesson(lessons[1], server.LessonUpdate(title="Renamed"), current_user=ADMIN))
+        run(server.update_lesson_progress(lessons[0], 95.0, current_user=user))
+        delta = changes(server, run, course_id, user, cursor)
+        assert [l["title"] for l in delta["lessons"]] == ["Renamed"]
+        assert [p["lesson_id"] for p in delta["progress"]] == [lessons[0]]
+        assert delta["modules"] == [] and delta["deleted"] == {}
+        assert delta["cursor"] > cursor
+        print(f"PASS: delta since {cursor} carried 1 lesson and 1 progress row")
+
+    def test_buffered_progress_arrives_after_flush(self, server, run, synced_course):
+        user, course_id, _, lessons = synced_course
+        cursor = run(server.get_enrolled_course(course_id, current_user=user))["sync_cursor"]
+        run(server.update_lesson_progress(lessons[1], 30.0, current_user=user))
+        run(server.progress_buffer.flush())
+        delta = changes(server, run, course_id, user, cursor)
+        assert [p["watch_percentage"] for p in delta["progress"]] == [30]
+
+    def test_deletions_are_tombstoned(self, server, run, synced_course):
+        user, course_id, module_id, lessons = synced_course
+        cursor = changes(server, run, course_id, user, 0)["cursor"]
+        run(server.admin_delete_lesson(lessons[0], current_user=ADMIN))
+        assert changes(server, run, course_id, user, cursor)["deleted"] == {"lesson": [lessons[0]]}
+
+        run(server.admin_delete_module(module_id, current_user=ADMIN))
+        deleted = changes(server, run, course_id, user, cursor)["deleted"]
+        assert deleted["module"] == [module_id]
+        assert sorted(deleted["lesson"]) == sorted(lessons)
+
+    def test_requires_enrollment(self, server, run, synced_course):
+        from fastapi import HTTPException
+
+        _, course_id, _, _ = synced_course
+        stranger = {"id": str(uuid.uuid4()), "role": "student"}
+        with pytest.raises(HTTPException) as exc:
+            changes(server, run, course_id, stranger, 0)
+        assert exc.value.status_code == 403
+
+    def test_cursor_waits_for_writes_in_flight(self, server, run, synced_course):
+        user, course_id, _, lessons = synced_course
+        before = changes(server, run, course_id, user, 0)["cursor"]
+        reserved = run(server.next_change_seq())
+        assert changes(server, run, course_id, user, 0)["cursor"] < reserved
+
+        run(server.db.lessons.update_one({"id": lessons[0]}, {"$set": {"title": "Late", "updated_seq": reserved}}))
+        run(server.release_change_seq(reserved))
+        after = changes(server, run, course_id, user, before)
+        assert after["cursor"] >= reserved
+        assert [l["title"] for l in after["lessons"]] == ["Late"]
+
+    def test_rows_without_seq_are_synced_and_backfilled(self, server, run, synced_course):
+        user, course_id, module_id, _ = synced_course
+        legacy = {"id": str(uuid.uuid4()), "module_id": module_id, "title": "Legacy", "order": 9}
+        run(server.db.lessons.insert_one(dict(legacy)))
+        full = changes(server, run, course_id, user, 0)
+        assert legacy["id"] in [l["id"] for l in full["lessons"]]
+
+        run(server.apply_migrations(only=["0015_change_sequence_backfill"]))
+        stamped = run(server.db.lessons.find_one({"id": legacy["id"]}))
+        assert stamped["updated_seq"] > full["cursor"]
+        delta = changes(server, run, course_id, user, full["cursor"])
+        assert [l["id"] for l in delta["lessons"]] == [legacy["id"]]
@@ -0,0 +1,140 @@
+"""
+Email outbox tests against a local aiosmtpd server
+Handlers only enqueue; workers deliver over one reused SMTP session, retry
+transient failures with backoff and give up on permanent ones.
+"""
+import asyncio
+import socket
+import time
+import uuid
+
+import pytest
+
+pytest.importorskip("aiosmtplib")
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+from aiosmtpd.smtp import AuthResult
+
+
+class RecordingHandler:
+    """Accepts mail, except 550 for 'bounce-*' and 451 for 'later-*' recipients"""
+
+    def __init__(self):
+        self.messages = []
+        self.peers = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("bounce-"):
+            return "550 5.1.1 No such user"
+        if address.startswith("later-"):
+            return "451 4.3.0 Try again later"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.peers.add(session.peer)
+        self.messages.append(envelope)
+        return "250 Message accepted"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp(server):
+    """Local SMTP server, with the backend's cached SMTP settings pointed at it"""
+    handler = RecordingHandler()
+    port = free_port()
+    controller = aiosmtpd_controller.Controller(
+        handler, hostname="127.0.0.1", port=port, auth_require_tls=False,
+        authenticator=lambda *args: AuthResult(success=True)
+    )
+    controller.start()
+    saved = dict(server._smtp_settings_cache)
+    server._smtp_settings_cache.update(expires=float("inf"), settings={
+        "smtp_host": "127.0.0.1", "smtp_port": port, "smtp_user": "outbox@example.com",
+        "smtp_password": "secret", "smtp_use_ssl": False, "smtp_starttls": False
+    })
+    yield handler
+    server._smtp_settings_cache.update(saved)
+    controller.stop()
+
+
+def recipient(prefix="learner"):
+    return f"{prefix}-{uuid.uuid4().hex[:8]}@example.com"
+
+
+class TestDelivery:
+    """Enqueue is cheap; delivery reuses one authenticated session"""
+
+    def test_enqueue_does_not_touch_smtp(self, server, run, smtp):
+        message_id = run(server.enqueue_email(recipient(), "Queued", "<p>hi</p>"))
+        assert smtp.messages == []
+        stored = run(server.db.email_outbox.find_one({"id": message_id}))
+        assert stored["status"] == "pending" and stored["attempts"] == 0
+        run(server.email_outbox.drain())
+
+    def test_drain_reuses_connection(self, server, run, smtp):
+        ids = [run(server.enqueue_email(recipient(), f"Message {n}", "<p>hi</p>")) for n in range(20)]
+        started = time.perf_counter()
+        run(server.email_outbox.drain())
+        elapsed = time.perf_counter() - started
+
+        assert len(smtp.messages) == 20
+        assert len(smtp.peers) == 1
+        statuses = run(server.db.email_outbox.distinct("status", {"id": {"$in": ids}}))
+        assert statuses == ["sent"]
+        print(f"PASS: 20 emails over {len(smtp.peers)} SMTP session in {elapsed:.2f}s")
+
+    def test_workers_deliver_in_background(self, server, run, smtp):
+        async def scenario():
+            server.email_outbox.start()
+            try:
+                message_id = await server.enqueue_email(recipient(), "Background", "<p>hi</p>")
+                for _ in range(100):
+                    doc = await server.db.email_outbox.find_one({"id": message_id})
+                    if doc["status"] == "sent":
+                        return doc
+                    await asyncio.sleep(0.05)
+                return doc
+            finally:
+                await server.email_outbox.stop()
+
+        doc = run(scenario())
+        assert doc["status"] == "sent" and "html" not in doc
+
+
+class TestFailures:
+    """Transient errors back off, permanent errors stop"""
+
+    def test_permanent_error_fails_immediately(self, server, run, smtp):
+        message_id = run(server.enqueue_email(recipient("bounce"), "Bounce", "<p>hi</p>"))
+        run(server.email_outbox.drain())
+        doc = run(server.db.email_outbox.find_one({"id": message_id}))
+        assert doc["status"] == "failed" and doc["attempts"] == 1
+        assert "550" in doc["last_error"]
+
+    def test_transient_error_is_rescheduled(self, server, run, smtp):
+        message_id = run(server.enqueue_email(recipient("later"), "Later", "<p>hi</p>"))
+        run(server.email_outbox.drain())
+        doc = run(server.db.email_outbox.find_one({"id": message_id}))
+        assert doc["status"] == "pending" and doc["attempts"] == 1
+        assert doc["next_attempt_at"] > doc["created_at"]
+        stats = run(server.email_outbox.stats())
+        assert stats["queue"]["pending"] >= 1
+        print(f"PASS: 451 rescheduled for {doc['next_attempt_at']}")
+
+
+class TestRateLimiter:
+    def test_rate_is_enforced(self, server, run):
+        limiter = server.RateLimiter(rate_per_second=50, burst=1)
+
+        async def burst():
+            started = time.perf_counter()
+            for _ in range(11):
+                await limiter.acquire()
+            return time.perf_counter() - started
+
+        assert run(burst()) >= 0.18
@@ -0,0 +1,45 @@
+"""
+Image derivative tests
+render_variants produces WebP and JPEG presets without upscaling.
+"""
+import io
+
+import pytest
+
+PIL = pytest.importorskip("PIL")
+from PIL import Image
+
+from image_processing import render_variants
+
+
+def encode(image, fmt):
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+class TestRenderVariants:
+    """Fixed presets, both formats, aspect ratio preserved"""
+
+    def test_presets_fit_longest_side(self):
+        source = encode(Image.new("RGBA", (2000, 1000), (10, 20, 30, 128)), "PNG")
+        variants = render_variants(source, (64, 256, 1024))
+        assert set(variants) == {"64", "256", "1024"}
+        for size, encoded in variants.items():
+            webp = Image.open(io.BytesIO(encoded["webp"]))
+            jpeg = Image.open(io.BytesIO(encoded["jpeg"]))
+            assert webp.format == "WEBP" and jpeg.format == "JPEG"
+            assert webp.size == (int(size), int(size) // 2)
+            assert jpeg.mode == "RGB"
+        print("PASS: variants rendered for every preset")
+
+    def test_small_images_are_not_upscaled(self):
+        source = encode(Image.new("RGB", (100, 50), "red"), "JPEG")
+        variants = render_variants(source, (64, 256))
+        assert Image.open(io.BytesIO(variants["256"]["webp"])).size == (100, 50)
+        assert Image.open(io.BytesIO(variants["64"]["webp"])).size == (64, 32)
+        print("PASS: small images keep their size")
+
+    def test_invalid_image_raises(self):
+        with pytest.raises(Exception):
+            render_variants(b"not an image", (64,))
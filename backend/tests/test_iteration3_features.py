@@ -136,17 +136,23 @@ class TestProfileImage:
         print("Profile image upload successful")
     
     def test_get_profile_image_after_upload(self, admin_token):
-        """Test GET /user/profile-image returns data URL after upload"""
+        """Test GET /user/profile-image returns a media URL after upload"""
         response = requests.get(
             f"{BASE_URL}/api/user/profile-image",
             headers={"Authorization": f"Bearer {admin_token}"}
         )
         assert response.status_code == 200
         data = response.json()
-        # After upload, image_url should be a data URL
+        # After upload, image_url points at the cacheable media route
         if data.get("image_url"):
-            assert data["image_url"].startswith("data:image/")
-            print(f"Profile image data URL: {data['image_url'][:60]}...")
+            assert "/api/media/" in data["image_url"]
+            image_path = data["image_url"][data["image_url"].index("/api/media/"):]
+            image = requests.get(f"{BASE_URL}{image_path}")
+            assert image.status_code == 200
+            assert "immutable" in image.headers.get("Cache-Control", "")
+            cached = requests.get(f"{BASE_URL}{image_path}", headers={"If-None-Match": image.headers["ETag"]})
+            assert cached.status_code == 304
+            print(f"Profile image media URL: {data['image_url']}")
         else:
             print("No profile image found (may have been reset)")
 
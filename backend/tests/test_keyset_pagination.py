@@ -0,0 +1,99 @@
+"""
+Keyset pagination tests and benchmark
+Cursors walk a list without gaps or repeats, and a page 5,000 deep costs the
+same index seek as the first page instead of skipping every earlier row.
+"""
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+ROWS = 20000
+PAGE = 4
+
+
+@pytest.fixture(scope="module")
+def earnings(server, run):
+    """ROWS referral earnings for one referrer, with duplicate timestamps to exercise the id tie-break"""
+    referrer = {"id": str(uuid.uuid4()), "role": "student"}
+    base = datetime.now(timezone.utc)
+    rows = [{
+        "id": str(uuid.uuid4()), "referrer_id": referrer["id"], "buyer_id": "buyer",
+        "commission_amount": 1.0, "created_at": (base - timedelta(seconds=i // 3)).isoformat()
+    } for i in range(ROWS)]
+
+    async def seed():
+        await server.apply_migrations(only=["0011_keyset_pagination"])
+        await server.db.referral_earnings.insert_many(rows)
+    run(seed())
+    return referrer, sorted(rows, key=lambda r: (r["created_at"], r["id"]), reverse=True)
+
+
+def page(server, run, referrer, cursor=None, limit=PAGE):
+    return run(server.paginate(
+        server.db.referral_earnings, {"referrer_id": referrer["id"]}, {"_id": 0},
+        limit=limit, cursor=cursor
+    ))
+
+
+class TestCursor:
+    def test_walk_is_complete_and_ordered(self, server, run, earnings):
+        referrer, expected = earnings
+        seen, cursor = [], None
+        for _ in range(10):
+            rows, cursor = page(server, run, referrer, cursor, limit=7)
+            seen.extend(r["id"] for r in rows)
+        assert seen == [r["id"] for r in expected[:70]]
+
+    def test_last_page_has_no_cursor(self, server, run, earnings):
+        referrer, expected = earnings
+        tail = expected[-3]
+        cursor = server.encode_cursor("created_at", tail["created_at"], tail["id"])
+        rows, next_cursor = page(server, run, referrer, cursor)
+        assert [r["id"] for r in rows] == [r["id"] for r in expected[-2:]] and next_cursor is None
+
+    def test_bad_cursor_is_400(self, server, run, earnings):
+        from fastapi import HTTPException
+
+        referrer, expected = earnings
+        for cursor in ("not-a-cursor", server.encode_cursor("updated_at", "x", "y")):
+            with pytest.raises(HTTPException) as exc:
+                page(server, run, referrer, cursor)
+            assert exc.value.status_code == 400
+
+
+class TestDepthBenchmark:
+    """Page 1 and page 5,000 cost the same"""
+
+    def timed(self, server, run, referrer, cursor):
+        started = time.perf_counter()
+        for _ in range(5):
+            page(server, run, referrer, cursor)
+        return (time.perf_counter() - started) / 5 * 1000
+
+    def docs_examined(self, server, run, referrer, cursor):
+        query = {"referrer_id": referrer["id"]}
+        if cursor:
+            query = {"$and": [query, server.keyset_filter("created_at", -1, *server.decode_cursor(cursor, "created_at"))]}
+        explain = run(server.db.referral_earnings.find(query).sort(
+            [("created_at", -1), ("id", -1)]).limit(PAGE + 1).explain())
+        return explain["executionStats"]["totalDocsExamined"]
+
+    def test_latency_is_flat_with_depth(self, server, run, earnings):
+        referrer, expected = earnings
+        before = expected[(5000 - 1) * PAGE - 1]
+        deep = server.encode_cursor("created_at", before["created_at"], before["id"])
+
+        rows, _ = page(server, run, referrer, deep)
+        assert rows[0]["id"] == expected[(5000 - 1) * PAGE]["id"]
+
+        first_ms, deep_ms = self.timed(server, run, referrer, None), self.timed(server, run, referrer, deep)
+        skip_started = time.perf_counter()
+        run(server.db.referral_earnings.find({"referrer_id": referrer["id"]}).sort(
+            [("created_at", -1), ("id", -1)]).skip((5000 - 1) * PAGE).limit(PAGE).to_list(PAGE))
+        skip_ms = (time.perf_counter() - skip_started) * 1000
+        print(f"page 1: {first_ms:.2f}ms, page 5000 by cursor: {deep_ms:.2f}ms, page 5000 by skip: {skip_ms:.2f}ms")
+
+        assert self.docs_examined(server, run, referrer, deep) <= 3 * (PAGE + 1)
+        assert self.docs_examined(server, run, referrer, None) <= PAGE + 1
@@ -0,0 +1,123 @@
+"""
+Leaderboard tests
+The all-time board is served from memory and patched on every award; weekly
+and monthly boards read per-period totals; /leaderboard/me sums a points
+histogram instead of sorting or counting every user ahead.
+"""
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def learners(server, run):
+    """Three fresh students, with the in-memory board reloaded to include them"""
+    users = [{"id": str(uuid.uuid4()), "first_name": f"L{n}", "role": "student", "points": 0,
+              "email": f"board-{uuid.uuid4().hex[:8]}@example.com", "otp": "999999"} for n in range(3)]
+    run(server.db.users.insert_many([dict(u) for u in users]))
+    server.leaderboard.invalidate()
+    return users
+
+
+def ids(board):
+    return [u["id"] for u in board["leaderboard"]]
+
+
+class TestAllTime:
+    def test_award_patches_board_without_queries(self, server, run, learners, query_counter):
+        low, mid, high = learners
+        run(server.get_leaderboard())
+        for user, points in ((low, 10 ** 10), (mid, 2 * 10 ** 10), (high, 3 * 10 ** 10)):
+            run(server.award_points(user["id"], points, "test"))
+
+        queries = query_counter()
+        board = run(server.get_leaderboard())
+        assert queries() == 0
+        assert ids(board)[:3] == [high["id"], mid["id"], low["id"]]
+        assert [u["rank"] for u in board["leaderboard"][:3]] == [1, 2, 3]
+        assert "otp" not in board["leaderboard"][0] and "email" not in board["leaderboard"][0]
+        print(f"PASS: board served from memory, stats {server.leaderboard.stats()}")
+
+    def test_my_rank(self, server, run, learners):
+        low, mid, high = learners
+        run(server.award_points(high["id"], 5 * 10 ** 10, "test"))
+        run(server.award_points(low["id"], 4 * 10 ** 10, "test"))
+        assert run(server.get_my_leaderboard_rank(current_user=high)) == {"period": "all", "rank": 1, "points": 5 * 10 ** 10}
+        assert run(server.get_my_leaderboard_rank(current_user=low))["rank"] == 2
+
+    def test_unknown_period_is_400(self, server, run):
+        from fastapi import HTTPException
+
+        with pytest.raises(HTTPException) as exc:
+            run(server.get_leaderboard(period="year"))
+        assert exc.value.status_code == 400
+
+
+class TestPeriods:
+    def test_weekly_and_monthly_boards(self, server, run, learners):
+        first, second, _ = learners
+        run(server.award_points(first["id"], 7 * 10 ** 11, "test"))
+        run(server.award_points(second["id"], 9 * 10 ** 11, "test"))
+        run(server.award_points(first["id"], 3 * 10 ** 11, "test"))
+
+        for period in ("week", "month"):
+            board = run(server.get_leaderboard(period=period))
+            assert board["period"] == period
+            top = board["leaderboard"][:2]
+            assert [u["id"] for u in top] == [first["id"], second["id"]]
+            assert top[0]["points"] == 10 ** 12
+            me = run(server.get_my_leaderboard_rank(period=period, current_user=second))
+            assert me == {"period": period, "rank": 2, "points": 9 * 10 ** 11}
+
+        events = run(server.db.points_events.count_documents({"user_id": first["id"]}))
+        assert events == 2
+
+
+class TestIndexes:
+    def test_redundant_points_index_is_dropped(self, server, run):
+        from pymongo import ASCENDING, DESCENDING
+
+        run(server.db.users.create_index([("role", ASCENDING), ("points", DESCENDING)]))
+        run(server.apply_migrations(only=["0012_points_leaderboard", "0016_drop_role_points_index"]))
+        indexes = run(server.db.users.index_information())
+        assert "role_1_points_-1" not in indexes
+        assert "role_1_points_-1_id_1" in indexes
+
+
+class TestRanks:
+    """Kept last: these awards put its learners at the top of every board"""
+
+    def test_ties_share_a_rank_on_both_endpoints(self, server, run, learners, query_counter):
+        first, second, third = learners
+        for user in (first, second):
+            run(server.award_points(user["id"], 7 * 10 ** 13, "test"))
+        run(server.award_points(third["id"], 10 ** 13, "test"))
+
+        board = run(server.get_leaderboard())["leaderboard"]
+        assert [(u["id"], u["rank"]) for u in board[:3]] == [
+            (min(first["id"], second["id"]), 1), (max(first["id"], second["id"]), 1), (third["id"], 3)]
+        queries = query_counter()
+        assert run(server.get_my_leaderboard_rank(current_user=second))["rank"] == 1
+        assert queries() == 2
+        assert run(server.get_my_leaderboard_rank(current_user=third))["rank"] == 3
+
+        run(server.admin_delete_user(first["id"], current_user={"id": "admin-test", "role": "admin"}))
+        assert run(server.get_my_leaderboard_rank(current_user=third))["rank"] == 2
+
+    def test_rebuild_matches_incremental_buckets(self, server, run, learners):
+        run(server.rebuild_points_rank_buckets())
+        for n, user in enumerate(learners):
+            run(server.award_points(user["id"], 10 * (n + 1), "test"))
+            run(server.award_points(user["id"], 50, "test"))
+
+        def buckets():
+            docs = run(server.db.points_rank_buckets.find({"count": {"$ne": 0}}).to_list(None))
+            return {doc["_id"]: doc["count"] for doc in docs}
+        incremental = buckets()
+        run(server.apply_migrations(only=["0017_points_rank_buckets"]))
+        assert buckets() == incremental
+
+    def test_bucket_ranges(self, server):
+        assert server.rank_buckets_above("all", 4) == ["all:0:5", "all:1:3"] + [
+            f"all:{level}:1" for level in range(3, server.POINTS_RANK_LEVELS)]
+        assert server.rank_bucket_changes("all", 0, 6) == [(f"all:{level}:{6 >> level}", 1) for level in range(3)]
@@ -0,0 +1,96 @@
+"""
+Learner progress tests and benchmark
+Admin performance, the progress report and the transcript share one progress
+engine whose query count stays fixed however many courses a learner holds.
+"""
+import time
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+ADMIN = {"id": "admin-test", "role": "admin"}
+COURSES = 30
+MODULES = 3
+LESSONS = 10
+
+
+@pytest.fixture
+def learner(server, run):
+    """A student enrolled in COURSES courses, having finished (course index % LESSONS) lessons in each"""
+    user = {"id": str(uuid.uuid4()), "email": f"learner-{uuid.uuid4().hex[:8]}@example.com",
+            "first_name": "Busy", "role": "student", "wallet_balance": 0}
+    now = datetime.now(timezone.utc).isoformat()
+    courses, modules, lessons, enrollments, progress, certificates = [], [], [], [], [], []
+    for c in range(COURSES):
+        course = {"id": str(uuid.uuid4()), "title": f"Course {c}", "lesson_count": MODULES * LESSONS}
+        courses.append(course)
+        course_lessons = []
+        for m in range(MODULES):
+            module = {"id": str(uuid.uuid4()), "course_id": course["id"], "title": f"M{m}", "order": m}
+            modules.append(module)
+            course_lessons += [{"id": str(uuid.uuid4()), "module_id": module["id"], "title": f"L{n}", "order": n}
+                               for n in range(LESSONS)]
+        lessons += course_lessons
+        finished = course_lessons[:c % LESSONS] if c else course_lessons
+        progress += [{"id": str(uuid.uuid4()), "user_id": user["id"], "lesson_id": l["id"],
+                      "is_completed": True, "completed_at": now} for l in finished]
+        enrollments.append({"id": str(uuid.uuid4()), "user_id": user["id"], "course_id": course["id"],
+                            "enrolled_at": now, "is_completed": c == 0, "completed_at": now if c == 0 else None})
+        if c == 0:
+            certificates.append({"id": str(uuid.uuid4()), "certificate_id": "CERT-0", "user_id": user["id"],
+                                 "course_id": course["id"]})
+    # A duplicate completion row must not be counted twice
+    progress.append(dict(progress[-1], id=str(uuid.uuid4())))
+
+    async def seed():
+        await server.db.users.insert_one(dict(user))
+        for name, docs in (("courses", courses), ("modules", modules), ("lessons", lessons),
+                           ("enrollments", enrollments), ("lesson_progress", progress),
+                           ("certificates", certificates)):
+            await server.db[name].insert_many(docs)
+        await server.db.orders.insert_many([
+            {"id": str(uuid.uuid4()), "user_id": user["id"], "status": "completed", "total": 40.0},
+            {"id": str(uuid.uuid4()), "user_id": user["id"], "status": "completed", "total": 60.0},
+            {"id": str(uuid.uuid4()), "user_id": user["id"], "status": "pending", "total": 99.0},
+        ])
+    run(seed())
+    return user, courses
+
+
+class TestEngine:
+    def test_rows_per_course(self, server, run, learner):
+        user, courses = learner
+        rows = {r["course_id"]: r for r in run(server.learner_course_progress(user["id"]))}
+        assert len(rows) == COURSES
+        first, seventh = rows[courses[0]["id"]], rows[courses[7]["id"]]
+        assert first["completed_lessons"] == MODULES * LESSONS and first["progress_percentage"] == 100
+        assert first["is_completed"] and first["certificate_id"] == "CERT-0"
+        assert seventh["completed_lessons"] == 7 and seventh["progress_percentage"] == round(7 / 30 * 100, 1)
+        assert seventh["certificate_id"] is None and seventh["course_title"] == "Course 7"
+        assert rows[courses[COURSES - 1]["id"]]["completed_lessons"] == (COURSES - 1) % LESSONS
+
+    def test_admin_performance(self, server, run, learner):
+        user, _ = learner
+        performance = run(server.admin_get_user_performance(user["id"], current_user=ADMIN))["performance"]
+        assert performance["total_purchases"] == 2 and performance["total_spent"] == 100.0
+        assert performance["courses_enrolled"] == COURSES
+        assert len(performance["course_progress"]) == COURSES
+
+
+class TestBenchmark:
+    """Query count and latency for a 30-course learner"""
+
+    def test_query_count_is_bounded(self, server, run, learner, query_counter):
+        user, _ = learner
+        queries = query_counter()
+        started = time.perf_counter()
+        run(server.admin_get_user_performance(user["id"], current_user=ADMIN))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        issued = queries()
+        print(f"admin performance for {COURSES} courses: {issued} queries, {elapsed_ms:.1f}ms")
+        assert issued <= 7
+
+        queries = query_counter()
+        run(server.learner_course_progress(user["id"]))
+        assert queries() == 2
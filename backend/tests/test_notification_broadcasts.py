@@ -0,0 +1,103 @@
+"""
+Broadcast notification tests
+A broadcast is one document merged into every feed at read time; per-user
+read/delete state is sparse, and emails are queued by a background job.
+"""
+import asyncio
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+ADMIN = {"id": "admin-test", "role": "admin"}
+
+
+def make_user(server, run):
+    user = {
+        "id": str(uuid.uuid4()), "email": f"feed-{uuid.uuid4().hex[:8]}@example.com", "role": "student",
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    run(server.db.users.insert_one(dict(user)))
+    return user
+
+
+def feed(server, run, user):
+    return run(server.get_notifications(current_user=user))
+
+
+@pytest.fixture
+def users(server, run):
+    return [make_user(server, run) for _ in range(3)]
+
+
+class TestBroadcast:
+    """Stored once, visible to everyone who existed when it was sent"""
+
+    def test_broadcast_writes_one_document(self, server, run, users, query_counter):
+        queries = query_counter()
+        result = run(server.admin_send_notification({"title": "Campus", "message": "Closed"}, current_user=ADMIN))
+        assert queries() <= 3
+        notif_id = result["notification_id"]
+        assert run(server.db.notifications.count_documents({"title": "Campus"})) == 0
+
+        for user in users:
+            data = feed(server, run, user)
+            item = next(n for n in data["notifications"] if n["id"] == notif_id)
+            assert item["is_read"] is False and item["is_broadcast"]
+            assert data["unread_count"] >= 1
+
+        late = make_user(server, run)
+        assert notif_id not in [n["id"] for n in feed(server, run, late)["notifications"]]
+        print(f"PASS: broadcast stored once, visible to {len(users)} users")
+
+    def test_read_delete_and_read_all(self, server, run, users):
+        first = run(server.admin_send_notification({"title": "One", "message": "m"}, current_user=ADMIN))["notification_id"]
+        second = run(server.admin_send_notification({"title": "Two", "message": "m"}, current_user=ADMIN))["notification_id"]
+        reader, deleter, other = users
+        before = feed(server, run, reader)["unread_count"]
+
+        run(server.mark_notification_read(first, current_user=reader))
+        data = feed(server, run, reader)
+        assert next(n for n in data["notifications"] if n["id"] == first)["is_read"]
+        assert data["unread_count"] == before - 1
+
+        run(server.delete_notification(second, current_user=deleter))
+        assert second not in [n["id"] for n in feed(server, run, deleter)["notifications"]]
+        assert second in [n["id"] for n in feed(server, run, other)["notifications"]]
+
+        run(server.mark_all_notifications_read(current_user=other))
+        other = run(server.db.users.find_one({"id": other["id"]}, {"_id": 0}))
+        data = feed(server, run, other)
+        assert data["unread_count"] == 0 and all(n["is_read"] for n in data["notifications"])
+        assert run(server.db.notification_receipts.count_documents({"user_id": other["id"]})) == 0
+        print("PASS: read, delete and read-all without per-user broadcast rows")
+
+    def test_unknown_notification_delete_is_404(self, server, run, users):
+        from fastapi import HTTPException
+
+        with pytest.raises(HTTPException) as exc:
+            run(server.delete_notification(str(uuid.uuid4()), current_user=users[0]))
+        assert exc.value.status_code == 404
+
+
+class TestTargetedAndEmail:
+    def test_targeted_send_inserts_rows(self, server, run, users):
+        ids = [u["id"] for u in users[:2]]
+        run(server.admin_send_notification({"title": "Targeted", "message": "m", "user_ids": ids}, current_user=ADMIN))
+        rows = run(server.db.notifications.distinct("user_id", {"title": "Targeted"}))
+        assert sorted(rows) == sorted(ids)
+        assert "Targeted" not in [n["title"] for n in feed(server, run, users[2])["notifications"]]
+
+    def test_email_job_reports_progress(self, server, run, users):
+        async def scenario():
+            result = await server.admin_send_notification(
+                {"title": "Mail", "message": "m", "send_email": True}, current_user=ADMIN)
+            await asyncio.gather(*server.background_jobs)
+            return await server.admin_notification_progress(result["notification_id"], current_user=ADMIN)
+
+        progress = run(scenario())
+        total = run(server.db.users.count_documents({"email": {"$exists": True}}))
+        assert progress["email_progress"]["status"] == "completed"
+        assert progress["email_progress"]["queued"] == total
+        assert sum(progress["delivery"].values()) == total
+        print(f"PASS: email job queued {total} messages")
@@ -0,0 +1,68 @@
+"""
+Course outline cache tests
+Concurrent misses share one build, and admin edits invalidate the cached outline.
+"""
+import asyncio
+import uuid
+
+ADMIN = {"id": "admin-test", "role": "admin"}
+
+
+class TestSingleFlight:
+    """Concurrent misses for one course trigger a single build"""
+
+    def test_concurrent_misses_coalesce(self, server, run):
+        cache = server.OutlineCache(max_entries=4)
+        builds = []
+
+        async def build():
+            builds.append(1)
+            await asyncio.sleep(0.05)
+            return [{"id": "module"}]
+
+        async def burst():
+            return await asyncio.gather(*[cache.get("course", 0, build) for _ in range(20)])
+
+        results = run(burst())
+        assert len(builds) == 1
+        assert all(r is results[0] for r in results)
+        run(cache.get("course", 0, build))
+        assert len(builds) == 1 and cache.hits == 1
+        print(f"PASS: 20 concurrent misses -> {len(builds)} build")
+
+    def test_lru_eviction(self, server, run):
+        cache = server.OutlineCache(max_entries=2)
+
+        async def build():
+            return []
+
+        for course in ("a", "b", "c"):
+            run(cache.get(course, 0, build))
+        assert cache.stats()["entries"] == 2
+        assert ("a", 0) not in cache._entries
+
+
+class TestInvalidation:
+    """Admin edits bump the course content version"""
+
+    def test_lesson_edit_visible_immediately(self, server, run):
+        course_id, module_id, lesson_id = (str(uuid.uuid4()) for _ in range(3))
+
+        async def seed():
+            await server.db.courses.insert_one({"id": course_id, "title": "Cached", "is_published": True})
+            await server.db.modules.insert_one({"id": module_id, "course_id": course_id, "title": "M", "order": 0})
+            await server.db.lessons.insert_one({"id": lesson_id, "module_id": module_id, "title": "Before", "order": 0})
+        run(seed())
+
+        first = run(server.get_course(course_id))
+        assert first["modules"][0]["lessons"][0]["title"] == "Before"
+        assert "content_version" not in first
+
+        run(server.admin_update_lesson(lesson_id, server.LessonUpdate(title="After"), current_user=ADMIN))
+        second = run(server.get_course(course_id))
+        assert second["modules"][0]["lessons"][0]["title"] == "After"
+
+        run(server.admin_create_module(course_id, server.ModuleCreate(title="M2", order=1), current_user=ADMIN))
+        third = run(server.get_course(course_id))
+        assert [m["title"] for m in third["modules"]] == ["M", "M2"]
+        print("PASS: admin edits invalidate the cached outline")
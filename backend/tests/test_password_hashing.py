@@ -0,0 +1,85 @@
+"""
+Password hashing tests and login throughput benchmark
+Logins verify bcrypt hashes off the event loop and upgrade outdated hashes.
+"""
+import asyncio
+import time
+import uuid
+
+import pytest
+
+bcrypt = pytest.importorskip("bcrypt")
+
+CONCURRENT_LOGINS = 16
+PASSWORD = "Bench@12345"
+
+
+@pytest.fixture(scope="module")
+def bench_user(server, run):
+    """Verified student whose hash uses the configured work factor"""
+    email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+    run(server.db.users.insert_one({
+        "id": str(uuid.uuid4()), "email": email, "password": server.hash_password(PASSWORD),
+        "first_name": "Bench", "last_name": "User", "role": "student", "is_verified": True, "is_banned": False
+    }))
+    return email
+
+
+async def measure(server, email):
+    """Run concurrent logins while a ticker records the worst event loop stall"""
+    worst_lag = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal worst_lag
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            worst_lag = max(worst_lag, time.perf_counter() - started - 0.005)
+
+    tick = asyncio.ensure_future(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        server.login(server.UserLogin(email=email, password=PASSWORD)) for _ in range(CONCURRENT_LOGINS)
+    ])
+    elapsed = time.perf_counter() - started
+    done.set()
+    await tick
+    return CONCURRENT_LOGINS / elapsed, worst_lag * 1000
+
+
+class TestLoginThroughput:
+    """Executor-backed verification versus verifying inline on the event loop"""
+
+    def test_executor_keeps_event_loop_responsive(self, server, run, bench_user, monkeypatch):
+        async def verify_inline(password, hashed):
+            return server.verify_password(password, hashed)
+
+        with monkeypatch.context() as patch:
+            patch.setattr(server, "verify_password_async", verify_inline)
+            before_rate, before_lag = run(measure(server, bench_user))
+        after_rate, after_lag = run(measure(server, bench_user))
+
+        print(f"inline:   {before_rate:.1f} logins/s, worst loop stall {before_lag:.0f}ms")
+        print(f"executor: {after_rate:.1f} logins/s, worst loop stall {after_lag:.0f}ms")
+        assert after_lag < before_lag
+
+
+class TestRehash:
+    """Hashes with an outdated cost are upgraded on successful login"""
+
+    def test_outdated_cost_is_rehashed(self, server, run):
+        email = f"rehash-{uuid.uuid4().hex[:8]}@example.com"
+        old_rounds = 4 if server.PASSWORD_HASH_ROUNDS != 4 else 5
+        old_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds=old_rounds)).decode()
+        run(server.db.users.insert_one({
+            "id": str(uuid.uuid4()), "email": email, "password": old_hash, "first_name": "Re",
+            "last_name": "Hash", "role": "student", "is_verified": True, "is_banned": False
+        }))
+        assert server.password_needs_rehash(old_hash)
+
+        run(server.login(server.UserLogin(email=email, password=PASSWORD)))
+        stored = run(server.db.users.find_one({"email": email}))["password"]
+        assert not server.password_needs_rehash(stored)
+        assert server.verify_password(PASSWORD, stored)
+        print("PASS: outdated hash upgraded on login")
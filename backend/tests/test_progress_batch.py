@@ -0,0 +1,82 @@
+"""
+Offline progress sync tests
+POST /api/progress/batch validates enrollment once per course, writes all
+progress in one bulk_write, and is safe to replay.
+"""
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def learner_courses(server, run):
+    """A learner enrolled in two 2-lesson courses, plus one course they are not enrolled in"""
+    user = {"id": str(uuid.uuid4()), "email": f"sync-{uuid.uuid4().hex[:8]}@example.com", "role": "student", "points": 0}
+    courses = {}
+
+    async def seed():
+        await server.db.users.insert_one(dict(user))
+        for name in ("a", "b", "locked"):
+            course_id, module_id = str(uuid.uuid4()), str(uuid.uuid4())
+            lessons = [str(uuid.uuid4()) for _ in range(2)]
+            await server.db.courses.insert_one({"id": course_id, "title": name, "lesson_count": 2, "module_ids": [module_id]})
+            await server.db.modules.insert_one({"id": module_id, "course_id": course_id, "title": "M", "order": 0})
+            await server.db.lessons.insert_many([{"id": l, "module_id": module_id, "title": "L", "order": 0} for l in lessons])
+            if name != "locked":
+                await server.db.enrollments.insert_one({"id": str(uuid.uuid4()), "user_id": user["id"], "course_id": course_id})
+            courses[name] = (course_id, lessons)
+    run(seed())
+    return user, courses
+
+
+def batch(server, items):
+    return server.ProgressSyncBatch(items=[
+        server.ProgressSyncItem(lesson_id=l, watch_percentage=p, client_timestamp=f"2024-05-01T10:{n:02d}:00Z")
+        for n, (l, p) in enumerate(items)
+    ])
+
+
+class TestBatchSync:
+    def test_replay_applies_in_bulk(self, server, run, learner_courses, query_counter):
+        user, courses = learner_courses
+        (a_id, a_lessons), (b_id, b_lessons) = courses["a"], courses["b"]
+        items = [(a_lessons[0], p) for p in (10, 40, 95)] + [(a_lessons[1], 85), (b_lessons[0], 30),
+                                                             (courses["locked"][1][0], 90), ("missing", 50)]
+        queries = query_counter()
+        result = run(server.sync_progress_batch(batch(server, items), current_user=user))
+        print(f"batch of {len(items)} items: {queries()} queries")
+        # Fixed per batch, whatever its size: 5 lookups, the progress bulk_write and its
+        # change_seq lease (3), 2 enrollment bulk_writes and award_points (5)
+        assert queries() <= 15
+
+        assert result["applied"] == 3 and result["points_awarded"] == 20
+        assert {r["reason"] for r in result["rejected"]} == {"Lesson not found", "Not enrolled in this course"}
+        by_course = {c["course_id"]: c for c in result["courses"]}
+        assert by_course[a_id]["is_completed"] and by_course[a_id]["progress_percentage"] == 100
+        assert by_course[b_id]["completed_lessons"] == 0
+
+        stored = run(server.db.lesson_progress.find_one({"user_id": user["id"], "lesson_id": a_lessons[0]}))
+        assert stored["watch_percentage"] == 95 and stored["is_completed"]
+        assert stored["client_updated_at"].startswith("2024-05-01T10:02:00")
+
+    def test_replay_is_idempotent(self, server, run, learner_courses):
+        user, courses = learner_courses
+        lessons = courses["a"][1]
+        first = run(server.sync_progress_batch(batch(server, [(lessons[0], 90)]), current_user=user))
+        second = run(server.sync_progress_batch(batch(server, [(lessons[0], 90), (lessons[0], 20)]), current_user=user))
+        assert first["points_awarded"] == 10 and second["points_awarded"] == 0
+        assert run(server.db.users.find_one({"id": user["id"]}))["points"] == 10
+        assert run(server.db.lesson_progress.count_documents({"user_id": user["id"], "lesson_id": lessons[0]})) == 1
+        print("PASS: replayed batch awards nothing twice")
+
+    def test_completion_rule_matches_single_updates(self, server, run, learner_courses):
+        user, courses = learner_courses
+        for name, complete in (("a", lambda l: run(server.update_lesson_progress(l, 95.0, current_user=user))),
+                               ("b", lambda l: run(server.sync_progress_batch(batch(server, [(l, 95)]), current_user=user)))):
+            course_id, lessons = courses[name]
+            complete(lessons[0])
+            # A lesson is deleted after the learner completed it
+            run(server.db.courses.update_one({"id": course_id}, {"$set": {"lesson_count": 1}}))
+            complete(lessons[1])
+            enrollment = run(server.db.enrollments.find_one({"user_id": user["id"], "course_id": course_id}))
+            assert enrollment["is_completed"] and enrollment["progress_percentage"] == 100, name
@@ -0,0 +1,98 @@
+"""
+Lesson progress write-behind tests
+Heartbeats coalesce in memory and flush as one bulk write; completions are
+applied synchronously and award points once.
+"""
+import asyncio
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def enrolled(server, run):
+    """A learner enrolled in a two-lesson course"""
+    user = {"id": str(uuid.uuid4()), "email": f"progress-{uuid.uuid4().hex[:8]}@example.com", "role": "student", "points": 0}
+    course_id, module_id = str(uuid.uuid4()), str(uuid.uuid4())
+    lessons = [str(uuid.uuid4()) for _ in range(2)]
+
+    async def seed():
+        await server.db.users.insert_one(dict(user))
+        await server.db.courses.insert_one({"id": course_id, "title": "Buffered", "is_published": True,
+                                            "lesson_count": 2, "module_ids": [module_id]})
+        await server.db.modules.insert_one({"id": module_id, "course_id": course_id, "title": "M", "order": 0})
+        await server.db.lessons.insert_many([
+            {"id": lesson_id, "module_id": module_id, "title": f"L{n}", "order": n} for n, lesson_id in enumerate(lessons)
+        ])
+        await server.db.enrollments.insert_one({
+            "id": str(uuid.uuid4()), "user_id": user["id"], "course_id": course_id, "completed_lessons": []
+        })
+    run(seed())
+    return user, course_id, lessons
+
+
+def writes_since(server):
+    before = dict(server.db_command_counter.counts)
+    return lambda: sum(server.db_command_counter.counts.get(c, 0) - before.get(c, 0) for c in ("insert", "update"))
+
+
+class TestCoalescing:
+    def test_heartbeats_write_once_per_flush(self, server, run, enrolled):
+        user, _, lessons = enrolled
+        writes = writes_since(server)
+        for pct in range(10, 60, 1):
+            run(server.update_lesson_progress(lessons[0], float(pct), current_user=user))
+        run(server.update_lesson_progress(lessons[0], 20.0, current_user=user))
+        assert writes() == 0
+
+        stored = lambda: run(server.db.lesson_progress.find_one({"user_id": user["id"], "lesson_id": lessons[0]}))
+        assert stored() is None
+        run(server.progress_buffer.flush())
+        assert writes() == 1
+        assert stored()["watch_percentage"] == 59 and stored()["is_completed"] is False
+        print(f"PASS: 51 heartbeats -> {writes()} write, stats {server.progress_buffer.stats()}")
+
+    def test_outline_shows_unflushed_progress(self, server, run, enrolled):
+        user, course_id, lessons = enrolled
+        run(server.update_lesson_progress(lessons[1], 42.0, current_user=user))
+        data = run(server.get_enrolled_course(course_id, current_user=user))
+        progress = {l["id"]: l["progress"] for m in data["modules"] for l in m["lessons"]}
+        assert progress[lessons[1]]["watch_percentage"] == 42
+        run(server.progress_buffer.flush())
+
+    def test_stop_flushes(self, server, run, enrolled):
+        user, _, lessons = enrolled
+
+        async def scenario():
+            server.progress_buffer.start()
+            await server.update_lesson_progress(lessons[0], 33.0, current_user=user)
+            await server.progress_buffer.stop()
+
+        run(scenario())
+        assert server.progress_buffer.stats()["pending"] == 0
+        stored = run(server.db.lesson_progress.find_one({"user_id": user["id"], "lesson_id": lessons[0]}))
+        assert stored["watch_percentage"] == 33
+
+
+class TestCompletion:
+    def test_completion_is_synchronous_and_awarded_once(self, server, run, enrolled):
+        user, course_id, lessons = enrolled
+        run(server.update_lesson_progress(lessons[0], 50.0, current_user=user))
+
+        async def complete_concurrently():
+            return await asyncio.gather(*[
+                server.update_lesson_progress(lessons[0], 90.0, current_user=user) for _ in range(5)
+            ])
+
+        run(complete_concurrently())
+        stored = run(server.db.lesson_progress.find_one({"user_id": user["id"], "lesson_id": lessons[0]}))
+        assert stored["is_completed"] is True and stored["watch_percentage"] == 90
+        enrollment = run(server.db.enrollments.find_one({"user_id": user["id"], "course_id": course_id}))
+        assert enrollment["completed_lessons"] == [lessons[0]]
+        assert enrollment["progress_percentage"] == 50
+        assert run(server.db.users.find_one({"id": user["id"]}))["points"] == 10
+
+        run(server.update_lesson_progress(lessons[1], 100.0, current_user=user))
+        enrollment = run(server.db.enrollments.find_one({"user_id": user["id"], "course_id": course_id}))
+        assert enrollment["is_completed"] is True
+        print("PASS: completions applied synchronously, points awarded once per lesson")
@@ -0,0 +1,54 @@
+"""
+Storage backend tests
+Object storage goes through the async StorageBackend interface; the local
+filesystem backend stands in for R2 and Emergent storage offline.
+"""
+import io
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def local_storage(server, tmp_path, monkeypatch):
+    """Route every upload to a LocalStorage under tmp_path, as if R2 were not configured"""
+    storage = server.LocalStorage(tmp_path)
+    monkeypatch.setattr(server, "r2_storage", None)
+    monkeypatch.setattr(server, "fallback_storage", storage)
+    return storage
+
+
+class TestLocalStorage:
+    def test_round_trip(self, server, run, local_storage):
+        stored = run(local_storage.put("videos/a.mp4", b"x" * 10, "video/mp4"))
+        assert stored == {"path": "videos/a.mp4", "size": 10}
+        assert run(local_storage.put_file(io.BytesIO(b"y" * 5), "videos/b.mp4", "video/mp4"))["size"] == 5
+
+        assert run(local_storage.get("videos/a.mp4")) == (b"x" * 10, "video/mp4")
+        assert run(local_storage.head("videos/b.mp4"))["size"] == 5
+        assert [o["key"] for o in run(local_storage.list("videos/"))] == ["videos/a.mp4", "videos/b.mp4"]
+        assert run(local_storage.usage()) == {"objects": 2, "bytes": 15}
+
+        run(local_storage.delete("videos/a.mp4"))
+        assert run(local_storage.head("videos/a.mp4")) is None
+        with pytest.raises(server.StorageError):
+            run(local_storage.get("videos/a.mp4"))
+
+    def test_rejects_keys_outside_root(self, server, run, local_storage):
+        with pytest.raises(server.StorageError):
+            run(local_storage.put("../escape.txt", b"x", "text/plain"))
+
+    def test_cannot_sign(self, local_storage):
+        assert local_storage.sign("videos/a.mp4") is None
+
+
+class TestMedia:
+    def test_media_is_stored_and_served_from_the_backend(self, server, run, local_storage):
+        data = uuid.uuid4().bytes * 100
+        stored = run(server.store_media(data, "image/png", "test"))
+        media = run(server.db.media_objects.find_one({"key": stored["key"]}))
+        assert media["storage"] == "local"
+
+        response = run(server.get_media(stored["key"], if_none_match=None))
+        assert response.body == data
+        assert run(local_storage.head(media["storage_path"]))["size"] == len(data)
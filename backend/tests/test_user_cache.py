@@ -0,0 +1,65 @@
+"""
+Authenticated user cache tests
+get_current_user serves repeat requests from memory, never loads heavy fields,
+and sees profile and admin changes immediately.
+"""
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def credentials(server, run):
+    """Bearer credentials for a fresh student with an embedded legacy image"""
+    from fastapi.security import HTTPAuthorizationCredentials
+
+    user_id = str(uuid.uuid4())
+    run(server.db.users.insert_one({
+        "id": user_id, "email": f"cache-{user_id[:8]}@example.com", "password": "hash",
+        "first_name": "Cache", "last_name": "User", "role": "student", "is_banned": False,
+        "profile_image": {"data": "aGVsbG8=", "content_type": "image/png"}
+    }))
+    token = server.create_access_token({"sub": user_id})
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+class TestUserCache:
+    """Hits skip the database; writes invalidate"""
+
+    def test_repeat_requests_hit_cache(self, server, run, credentials, query_counter):
+        first = run(server.get_current_user(credentials))
+        assert "password" not in first and "data" not in first["profile_image"]
+
+        queries = query_counter()
+        hits = server.user_cache.hits
+        for _ in range(5):
+            run(server.get_current_user(credentials))
+        assert queries() == 0
+        assert server.user_cache.hits == hits + 5
+        print(f"PASS: 5 cached lookups, stats {server.user_cache.stats()}")
+
+    def test_profile_update_visible_immediately(self, server, run, credentials):
+        user = run(server.get_current_user(credentials))
+        run(server.update_profile(server.ProfileUpdate(first_name="Renamed"), current_user=user))
+        assert run(server.get_current_user(credentials))["first_name"] == "Renamed"
+
+    def test_admin_ban_visible_immediately(self, server, run, credentials):
+        from fastapi import HTTPException
+
+        user = run(server.get_current_user(credentials))
+        run(server.admin_update_user(user["id"], is_banned=True, current_user={"role": "admin"}))
+        with pytest.raises(HTTPException) as exc:
+            run(server.get_current_user(credentials))
+        assert exc.value.status_code == 403
+        print("PASS: ban applies without waiting for the TTL")
+
+    def test_legacy_image_still_returned_by_me(self, server, run, credentials):
+        user = run(server.get_current_user(credentials))
+        me = run(server.get_me(current_user=user))
+        assert me["profile_image_url"] == "data:image/png;base64,aGVsbG8="
+
+    def test_me_without_image_skips_legacy_lookup(self, server, run, query_counter):
+        user = {"id": str(uuid.uuid4()), "role": "student", "first_name": "Plain"}
+        queries = query_counter()
+        me = run(server.get_me(current_user=user))
+        assert queries() == 0 and "profile_image_url" not in me
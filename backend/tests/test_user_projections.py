@@ -0,0 +1,84 @@
+"""
+User projection policy tests
+Routes that embed other users load only the named summary fields, and their
+response models drop anything else.
+"""
+import json
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+ADMIN = {"id": "admin-test", "role": "admin"}
+SECRETS = {"password", "otp", "otp_expiry", "profile_image", "college_details", "referral_code", "pending_earnings"}
+
+
+@pytest.fixture
+def heavy_user(server, run):
+    """A student carrying every sensitive field, befriended by and filing a ticket for a viewer"""
+    user = {
+        "id": str(uuid.uuid4()), "email": f"heavy-{uuid.uuid4().hex[:8]}@example.com", "password": "hash",
+        "first_name": "Heavy", "last_name": "User", "role": "student", "points": 10 ** 9,
+        "otp": "123456", "otp_expiry": datetime.now(timezone.utc).isoformat(), "referral_code": "SECRET01",
+        "wallet_balance": 12.5, "pending_earnings": 3.0, "college_details": {"roll_number": "R-1"},
+        "profile_image": {"data": "A" * 200000, "content_type": "image/png"},
+        "profile_image_variants": {"64": {"webp": "https://cdn.example.com/64.webp"}},
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    viewer = {"id": str(uuid.uuid4()), "role": "student"}
+
+    async def seed():
+        await server.db.users.insert_one(dict(user))
+        await server.db.friendships.insert_one({
+            "id": str(uuid.uuid4()), "user_id": viewer["id"], "friend_id": user["id"], "status": "accepted"})
+        await server.db.tickets.insert_one({
+            "id": str(uuid.uuid4()), "user_id": user["id"], "subject": "Help",
+            "updated_at": "9999-01-01T00:00:00+00:00"})
+    run(seed())
+    return user, viewer
+
+
+def leaked(doc):
+    return SECRETS & set(doc)
+
+
+class TestProjections:
+    def test_leaderboard_is_public_summary(self, server, run, heavy_user):
+        user, _ = heavy_user
+        board = run(server.get_leaderboard())
+        entry = next(u for u in board["leaderboard"] if u["id"] == user["id"])
+        assert not leaked(entry) and "email" not in entry
+        assert entry["profile_image_url"] == "https://cdn.example.com/64.webp"
+        size = len(json.dumps(board))
+        print(f"PASS: leaderboard payload {size} bytes for {len(board['leaderboard'])} users")
+        assert size < 200000
+
+    def test_friends_and_search(self, server, run, heavy_user):
+        user, viewer = heavy_user
+        friends = run(server.get_friends(current_user=viewer))["friends"]
+        assert [f["id"] for f in friends] == [user["id"]] and not leaked(friends[0])
+        found = run(server.search_users_for_friends(user["email"], current_user=viewer))["users"]
+        assert found[0]["friendship_status"] == "accepted" and not leaked(found[0])
+
+    def test_admin_rows_use_admin_summary(self, server, run, heavy_user):
+        user, _ = heavy_user
+        tickets = run(server.admin_get_all_tickets(cursor=None, limit=1, current_user=ADMIN))
+        embedded = tickets["tickets"][0]["user"]
+        assert embedded["email"] == user["email"] and embedded["wallet_balance"] == 12.5
+        assert not leaked(embedded)
+
+
+class TestResponseModels:
+    def test_models_drop_unknown_fields(self, server):
+        row = {"id": "t1", "subject": "Help", "user": {"id": "u1", "email": "a@b.c", "otp": "1", "password": "x"}}
+        dumped = server.AdminTicketsResponse(tickets=[row]).model_dump()
+        assert dumped["tickets"][0]["subject"] == "Help"
+        assert "otp" not in dumped["tickets"][0]["user"] and "password" not in dumped["tickets"][0]["user"]
+
+        board = server.LeaderboardResponse(leaderboard=[{"id": "u1", "rank": 1, "otp": "1", "email": "a@b.c"}]).model_dump()
+        assert set(board["leaderboard"][0]) == set(server.UserPublicSummary.model_fields) | {"rank"}
+
+    def test_projections_match_models(self, server):
+        for name, model in (("public_summary", server.UserPublicSummary), ("admin_summary", server.UserAdminSummary)):
+            fields = {f for f, v in server.USER_PROJECTIONS[name].items() if v and f != "profile_image_variants"}
+            assert fields == set(model.model_fields)
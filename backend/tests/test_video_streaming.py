@@ -0,0 +1,183 @@
+"""
+Video streaming proxy tests
+When no bucket can sign a URL, lesson videos are streamed from the fallback
+storage in fixed-size chunks, honouring Range and If-None-Match; the local
+filesystem backend stands in for Emergent storage, whose HTTP client is
+exercised separately against an httpx MockTransport.
+"""
+import os
+import uuid
+
+import httpx
+import pytest
+
+SIZE = 3 * 1024 * 1024 + 123
+
+
+@pytest.fixture
+def video(server, run, tmp_path, monkeypatch):
+    """An enrolled learner and a lesson whose video lives in LocalStorage under tmp_path"""
+    storage = server.LocalStorage(tmp_path)
+    monkeypatch.setattr(server, "r2_storage", None)
+    monkeypatch.setattr(server, "fallback_storage", storage)
+    data = os.urandom(SIZE)
+    course_id, module_id = str(uuid.uuid4()), str(uuid.uuid4())
+    learner = {"id": str(uuid.uuid4()), "role": "student"}
+    lesson = {"id": str(uuid.uuid4()), "module_id": module_id, "title": "Lecture", "order": 0,
+              "video_key": f"lumina-lms/videos/{uuid.uuid4()}.mp4"}
+
+    async def seed():
+        await storage.put(lesson["video_key"], data, "video/mp4")
+        await server.db.modules.insert_one({"id": module_id, "course_id": course_id, "title": "M", "order": 0})
+        await server.db.lessons.insert_one(dict(lesson))
+        await server.db.enrollments.insert_one({"id": str(uuid.uuid4()), "user_id": learner["id"],
+                                                "course_id": course_id})
+    run(seed())
+    return learner, lesson, data
+
+
+def fetch(server, run, learner, lesson, range_header=None, if_none_match=None):
+    """(response, [chunks]) for one request to the video route"""
+    response = run(server.get_lesson_video(lesson["id"], range_header=range_header, if_none_match=if_none_match,
+                                           current_user=learner))
+
+    async def drain():
+        chunks = [chunk async for chunk in response.body_iterator] if hasattr(response, "body_iterator") else []
+        if response.background:
+            await response.background()
+        return chunks
+    return response, run(drain())
+
+
+class TestRangeParsing:
+    @pytest.mark.parametrize("header,expected", [
+        ("bytes=0-99", (0, 99)), ("bytes=100-", (100, None)), ("bytes=-500", (None, 500)),
+        ("bytes=5-1", None), ("bytes=0-1,4-5", None), ("items=0-1", None), ("bytes=x-1", None), (None, None),
+    ])
+    def test_parse(self, server, header, expected):
+        assert server.parse_range_header(header) == expected
+
+    def test_resolve(self, server):
+        assert server.resolve_range((None, 500), 100) == (0, 99)
+        assert server.resolve_range((10, 10 ** 9), 100) == (10, 99)
+        with pytest.raises(server.RangeNotSatisfiable):
+            server.resolve_range((100, None), 100)
+
+
+class TestStreaming:
+    def test_full_download_is_chunked(self, server, run, video):
+        learner, lesson, data = video
+        response, chunks = fetch(server, run, learner, lesson)
+        assert response.status_code == 200
+        assert response.headers["content-length"] == str(SIZE) and response.headers["accept-ranges"] == "bytes"
+        assert b"".join(chunks) == data
+        assert max(len(c) for c in chunks) <= server.STORAGE_STREAM_CHUNK_SIZE
+        print(f"{SIZE} bytes in {len(chunks)} chunks of at most {server.STORAGE_STREAM_CHUNK_SIZE}")
+
+    def test_ranges(self, server, run, video):
+        learner, lesson, data = video
+        response, chunks = fetch(server, run, learner, lesson, "bytes=1000-1999")
+        assert response.status_code == 206
+        assert response.headers["content-range"] == f"bytes 1000-1999/{SIZE}"
+        assert b"".join(chunks) == data[1000:2000]
+
+        _, chunks = fetch(server, run, learner, lesson, "bytes=-10")
+        assert b"".join(chunks) == data[-10:]
+        _, chunks = fetch(server, run, learner, lesson, f"bytes={SIZE - 5}-")
+        assert b"".join(chunks) == data[-5:]
+
+        response, _ = fetch(server, run, learner, lesson, f"bytes={SIZE}-")
+        assert response.status_code == 416 and response.headers["content-range"] == f"bytes */{SIZE}"
+
+    def test_if_none_match(self, server, run, video):
+        learner, lesson, _ = video
+        response, _ = fetch(server, run, learner, lesson, "bytes=0-0")
+        etag = response.headers["etag"]
+        response, chunks = fetch(server, run, learner, lesson, if_none_match=etag)
+        assert response.status_code == 304 and not chunks
+
+
+class TestSliceChunks:
+    def test_skip_and_limit_across_chunks(self, server, run):
+        async def source():
+            for chunk in (b"abcd", b"efgh", b"ijkl"):
+                yield chunk
+
+        async def collect():
+            return b"".join([c async for c in server.slice_chunks(source(), 3, 6)])
+        assert run(collect()) == b"defghi"
+
+
+@pytest.fixture
+def emergent(server):
+    """(storage, requests) for an EmergentStorage answering from `storage.respond(request)`"""
+    data = bytes(range(256)) * 40
+    requests = []
+    storage = server.EmergentStorage("https://storage.test", None)
+    storage.storage_key = "test-key"
+    storage.data, storage.etag = data, '"v1"'
+
+    def handler(request):
+        requests.append(request)
+        return storage.respond(request)
+    storage._client = httpx.AsyncClient(base_url=storage.base_url, transport=httpx.MockTransport(handler))
+    storage.respond = lambda request: httpx.Response(200, content=data, headers={
+        "ETag": storage.etag, "Content-Type": "video/mp4"})
+    return storage, requests
+
+
+def drain_stream(run, stream):
+    async def collect():
+        return b"".join([chunk async for chunk in stream.chunks])
+    return run(collect())
+
+
+class TestEmergentStream:
+    def test_forwards_range_and_if_none_match(self, server, run, emergent):
+        storage, requests = emergent
+        storage.respond = lambda request: httpx.Response(206, content=storage.data[10:20], headers={
+            "Content-Range": f"bytes 10-19/{len(storage.data)}", "ETag": storage.etag})
+        stream = run(storage.open_stream("videos/a.mp4", (10, 19), if_none_match='"old"'))
+        assert requests[0].url.path == "/objects/videos/a.mp4"
+        assert requests[0].headers["Range"] == "bytes=10-19"
+        assert requests[0].headers["If-None-Match"] == '"old"'
+        assert requests[0].headers["X-Storage-Key"] == "test-key"
+        assert stream.byte_range == (10, 19) and stream.size == len(storage.data)
+        assert drain_stream(run, stream) == storage.data[10:20]
+
+        run(storage.open_stream("videos/a.mp4", (None, 5)))
+        assert requests[1].headers["Range"] == "bytes=-5" and "If-None-Match" not in requests[1].headers
+
+    def test_full_response_is_sliced_locally(self, server, run, emergent):
+        storage, _ = emergent
+        stream = run(storage.open_stream("videos/a.mp4", (100, 5099), chunk_size=1000))
+        assert stream.byte_range == (100, 5099) and stream.size == len(storage.data)
+        assert drain_stream(run, stream) == storage.data[100:5100]
+
+        stream = run(storage.open_stream("videos/a.mp4", (None, 7)))
+        assert drain_stream(run, stream) == storage.data[-7:]
+
+        with pytest.raises(server.RangeNotSatisfiable):
+            run(storage.open_stream("videos/a.mp4", (len(storage.data), None)))
+
+    def test_not_modified(self, server, run, emergent):
+        storage, _ = emergent
+        storage.respond = lambda request: httpx.Response(304, headers={"ETag": storage.etag})
+        stream = run(storage.open_stream("videos/a.mp4", if_none_match=storage.etag))
+        assert stream.not_modified and stream.etag == storage.etag
+
+        # An upstream that ignores If-None-Match still yields a 304 here
+        storage.respond = lambda request: httpx.Response(200, content=storage.data, headers={"ETag": storage.etag})
+        assert run(storage.open_stream("videos/a.mp4", if_none_match=storage.etag)).not_modified
+
+    def test_range_not_satisfiable(self, server, run, emergent):
+        storage, _ = emergent
+        storage.respond = lambda request: httpx.Response(416, headers={
+            "Content-Range": f"bytes */{len(storage.data)}"})
+        with pytest.raises(server.RangeNotSatisfiable) as exc:
+            run(storage.open_stream("videos/a.mp4", (10 ** 9, None)))
+        assert exc.value.size == len(storage.data)
+
+        storage.respond = lambda request: httpx.Response(500)
+        with pytest.raises(server.StorageError):
+            run(storage.open_stream("videos/a.mp4"))